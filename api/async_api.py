@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Async API - Fase 3
+Modo de serviço ASGI da API de custos: mesmas rotas e JSON equivalente ao
+do chatbot_api (planos de queries.py), servidos pelo Starlette/uvicorn com
+aiomysql. As consultas independentes de uma rota (resumo, economia) rodam
+concorrentes em conexões diferentes do pool, e uma consulta lenta não
+bloqueia as demais requisições do worker
+
+    uvicorn async_api:app --host 0.0.0.0 --port 5001 --workers 4
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from decimal import Decimal
+
+import aiomysql
+import pymysql
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.http import http_date, parse_etags, quote_etag
+
+import queries
+import summary_queries
+from data_access import get_database_credentials
+from response_cache import VERSION_TTL, ResponseCache
+
+POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', 16))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Conexões sem uso há mais tempo que isso são recriadas no próximo acquire
+POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 300))
+# Linhas lidas do cursor do servidor a cada bloco transmitido
+STREAM_CHUNK_ROWS = 500
+
+cache = ResponseCache()
+
+def json_default(value):
+    """Mesma conversão do provider JSON do Flask (datas em formato HTTP, Decimal como texto)"""
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Objeto do tipo {type(value).__name__} não é serializável em JSON")
+
+class FlaskJSONResponse(JSONResponse):
+    """JSONResponse no formato do jsonify do chatbot_api (compacto, com \\n final)
+
+    O JSON é equivalente ao do Flask; com debug=True o Flask indenta a saída.
+    """
+
+    def render(self, content):
+        return (json.dumps(content, default=json_default, ensure_ascii=True, sort_keys=True,
+                           separators=(',', ':')) + '\n').encode('utf-8')
+
+async def create_pool(refresh=False):
+    """Pool aiomysql com as credenciais do Secrets Manager (em cache)"""
+    db_config = await asyncio.to_thread(get_database_credentials, refresh)
+    return await aiomysql.create_pool(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        db='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4',
+        autocommit=True,
+        minsize=1,
+        maxsize=POOL_SIZE,
+        pool_recycle=POOL_RECYCLE
+    )
+
+async def reset_pool(app):
+    """Recria o pool com credenciais relidas (senha rotacionada)"""
+    old_pool = app.state.pool
+    app.state.pool = await create_pool(refresh=True)
+    old_pool.close()
+
+async def acquire(request):
+    """Conexão do pool; recria o pool uma vez se o acesso for negado"""
+    for attempt in (1, 2):
+        pool = request.app.state.pool
+        try:
+            return pool, await asyncio.wait_for(pool.acquire(), POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError("Pool de conexões esgotado")
+        except pymysql.err.OperationalError as e:
+            # 1045: acesso negado, a senha pode ter sido rotacionada
+            if attempt == 2 or e.args[0] != 1045:
+                raise
+            await reset_pool(request.app)
+
+async def fetch(request, sql, params, mode):
+    """Executa uma consulta numa conexão própria do pool"""
+    pool, conn = await acquire(request)
+    try:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(sql, params)
+            return await (cursor.fetchall() if mode == 'all' else cursor.fetchone())
+    except pymysql.err.OperationalError:
+        # Conexão quebrada não volta para o pool
+        conn.close()
+        raise
+    finally:
+        pool.release(conn)
+
+class ServerSideRows:
+    """Resultado de cursor do lado do servidor numa conexão dedicada do pool
+
+    Iterável assíncrono de blocos de STREAM_CHUNK_ROWS linhas em NDJSON. A
+    conexão volta ao pool quando o resultado termina; close() antes do fim
+    (cliente desconectou) a fecha, porque ainda há resultado pendente.
+    """
+
+    def __init__(self, pool, conn, cursor):
+        self.pool = pool
+        self.conn = conn
+        self.cursor = cursor
+        self.finished = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.conn is None:
+            raise StopAsyncIteration
+        rows = await self.cursor.fetchmany(STREAM_CHUNK_ROWS)
+        if not rows:
+            await self.cursor.close()
+            self.finished = True
+            self.close()
+            raise StopAsyncIteration
+        return ''.join(json.dumps(row, default=json_default, ensure_ascii=True, sort_keys=True,
+                                  separators=(',', ':')) + '\n' for row in rows)
+
+    def close(self):
+        if self.conn is not None:
+            if not self.finished:
+                self.conn.close()
+            self.pool.release(self.conn)
+            self.conn = None
+
+class NDJSONResponse(StreamingResponse):
+    """StreamingResponse que sempre devolve a conexão do resultado, inclusive na desconexão"""
+    media_type = 'application/x-ndjson'
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.body_iterator.close()
+
+async def stream_rows(request, sql, params):
+    """Resposta NDJSON lida com cursor do lado do servidor (SSDictCursor)
+
+    A consulta roda antes da resposta, então erros ainda viram 500.
+    """
+    pool, conn = await acquire(request)
+    try:
+        cursor = await conn.cursor(aiomysql.SSDictCursor)
+        await cursor.execute(sql, params)
+    except Exception:
+        conn.close()
+        pool.release(conn)
+        raise
+    return NDJSONResponse(ServerSideRows(pool, conn, cursor))
+
+async def run_plan(request, plan, concurrent=True):
+    """Executa as consultas do plano (concorrentes por padrão) e monta a resposta
+
+    O tempo de banco registrado é o tempo de parede do conjunto, não a soma.
+    """
+    statements, build = plan
+    started = time.perf_counter()
+    try:
+        if concurrent:
+            results = await asyncio.gather(*(fetch(request, sql, params, mode)
+                                             for sql, params, mode in statements.values()))
+        else:
+            results = [await fetch(request, sql, params, mode) for sql, params, mode in statements.values()]
+    finally:
+        request.state.db_time += time.perf_counter() - started
+        request.state.db_queries += len(statements)
+    return build(dict(zip(statements, results)))
+
+async def get_data_version(request):
+    """Versão dos dados, relida no máximo a cada VERSION_TTL (None desativa o cache)"""
+    state = request.app.state
+    if state.version_checked is not None and time.monotonic() - state.version_checked < VERSION_TTL:
+        return state.data_version
+    started = time.perf_counter()
+    try:
+        row = await fetch(request, "SELECT version FROM pipeline_data_version WHERE id = 1", (), 'one')
+        version = row['version'] if row else None
+    except Exception:
+        version = None
+    request.state.db_time += time.perf_counter() - started
+    request.state.db_queries += 1
+    if version != state.data_version:
+        cache.clear()
+    state.data_version = version
+    state.version_checked = time.monotonic()
+    return version
+
+async def get_summary_mode(request):
+    """Modo do resumo (summary_queries); o valor do benchmark é relido a cada MODE_TTL"""
+    if summary_queries.CONFIGURED_MODE in summary_queries.SUMMARY_MODES:
+        return summary_queries.CONFIGURED_MODE
+    state = request.app.state
+    if state.mode_checked is not None and time.monotonic() - state.mode_checked < summary_queries.MODE_TTL:
+        return state.summary_mode
+    try:
+        row = await fetch(request, summary_queries.MODE_SQL, (), 'one')
+        stored = row['setting_value'] if row else None
+    except Exception:
+        stored = None
+    state.summary_mode = summary_queries.pick_mode(stored)
+    state.mode_checked = time.monotonic()
+    return state.summary_mode
+
+# Rota -> plano de queries.py a partir do cliente e da query string
+PLANS = {
+    'monthly': lambda cliente, args: queries.monthly_costs(cliente, datetime.now()),
+    'top_services': lambda cliente, args: queries.top_services(cliente, datetime.now(), args.get('limit', 10)),
+    'daily': lambda cliente, args: queries.daily_costs(cliente, datetime.now(), args.get('days', 30),
+                                                       args.get('limit'), args.get('cursor')),
+    'alerts': lambda cliente, args: queries.alerts(cliente),
+    'forecasts': lambda cliente, args: queries.forecasts(cliente, args.get('limit'), args.get('cursor')),
+    'savings': lambda cliente, args: queries.savings_opportunities(cliente),
+    'summaries': lambda cliente, args: queries.client_summaries(queries.parse_clientes(args.get('clientes')),
+                                                                datetime.now()),
+}
+
+# Rotas com ?format=ndjson -> consulta completa (sql, params)
+STREAMS = {
+    'daily': lambda cliente, args: queries.daily_costs_query(cliente, datetime.now(), args.get('days', 30),
+                                                             args.get('cursor')),
+    'forecasts': lambda cliente, args: queries.forecasts_query(cliente, args.get('cursor')),
+}
+
+async def serve_plan(request, name, cliente):
+    """Resposta de uma rota de leitura, com o mesmo cache por versão e ETag/304 do Flask"""
+    version = await get_data_version(request)
+    key = (name, cliente, tuple(sorted(request.query_params.multi_items())),
+           date.today().isoformat(), version)
+    entry = cache.get(key) if version is not None else None
+    status = 'HIT'
+    if entry is None:
+        status = 'MISS'
+        try:
+            if name == 'summary':
+                summary_mode = await get_summary_mode(request)
+                plan = summary_queries.summary_plan(cliente, datetime.now(), summary_mode)
+                body = await run_plan(request, plan, concurrent=summary_mode != 'sequential')
+            else:
+                body = await run_plan(request, PLANS[name](cliente, request.query_params))
+            body = FlaskJSONResponse(body).body
+        except queries.InvalidParameter as e:
+            return FlaskJSONResponse({"error": str(e)}, status_code=400)
+        except Exception as e:
+            return FlaskJSONResponse({"error": str(e)}, status_code=500)
+        if version is None:
+            return Response(body, media_type='application/json')
+        etag = hashlib.sha256(repr(key).encode() + body).hexdigest()[:32]
+        entry = (body, 'application/json', etag)
+        cache.put(key, entry)
+
+    body, mimetype, etag = entry
+    headers = {'ETag': quote_etag(etag), 'Cache-Control': 'no-cache', 'X-Cache': status}
+    if request.method == 'GET' and etag in parse_etags(request.headers.get('if-none-match')):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=mimetype, headers=headers)
+
+def plan_endpoint(name):
+    """Endpoint GET /api/.../{cliente} de um plano"""
+    async def endpoint(request):
+        cliente = request.path_params['cliente']
+        if name in STREAMS and request.query_params.get('format') == 'ndjson':
+            try:
+                return await stream_rows(request, *STREAMS[name](cliente, request.query_params))
+            except queries.InvalidParameter as e:
+                return FlaskJSONResponse({"error": str(e)}, status_code=400)
+            except Exception as e:
+                return FlaskJSONResponse({"error": str(e)}, status_code=500)
+        return await serve_plan(request, name, cliente)
+    endpoint.__name__ = f"get_{name}"
+    return endpoint
+
+async def get_client_summaries(request):
+    """Resumo de vários clientes (?clientes=a,b; sem o parâmetro, todos)"""
+    return await serve_plan(request, 'summaries', None)
+
+async def health_check(request):
+    """Health check endpoint"""
+    return FlaskJSONResponse({"status": "healthy", "timestamp": datetime.now().isoformat()})
+
+async def natural_language_query(request):
+    """Endpoint para consultas em linguagem natural"""
+    try:
+        data = await request.json()
+        target = queries.match_natural_query(data.get('query', ''))
+        if target is None:
+            return FlaskJSONResponse(queries.UNRECOGNIZED_QUERY)
+        return await serve_plan(request, target, data.get('cliente', ''))
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+class ServerTimingMiddleware(BaseHTTPMiddleware):
+    """Header Server-Timing com o tempo de banco e o total da requisição"""
+
+    async def dispatch(self, request, call_next):
+        started = time.perf_counter()
+        request.state.db_time = 0.0
+        request.state.db_queries = 0
+        response = await call_next(request)
+        total = (time.perf_counter() - started) * 1000
+        db_time = request.state.db_time * 1000
+        response.headers['Server-Timing'] = (f"db;dur={db_time:.1f};desc=\"{request.state.db_queries} queries\", "
+                                             f"app;dur={max(total - db_time, 0):.1f}")
+        return response
+
+@asynccontextmanager
+async def lifespan(app):
+    """Cria o pool na subida do worker e fecha na parada"""
+    app.state.pool = await create_pool()
+    app.state.data_version = None
+    app.state.version_checked = None
+    app.state.summary_mode = None
+    app.state.mode_checked = None
+    try:
+        yield
+    finally:
+        app.state.pool.close()
+        await app.state.pool.wait_closed()
+
+routes = [
+    Route('/api/health', health_check, methods=['GET']),
+    Route('/api/costs/monthly/{cliente}', plan_endpoint('monthly'), methods=['GET']),
+    Route('/api/costs/top-services/{cliente}', plan_endpoint('top_services'), methods=['GET']),
+    Route('/api/costs/daily/{cliente}', plan_endpoint('daily'), methods=['GET']),
+    Route('/api/alerts/{cliente}', plan_endpoint('alerts'), methods=['GET']),
+    Route('/api/forecasts/{cliente}', plan_endpoint('forecasts'), methods=['GET']),
+    Route('/api/savings/{cliente}', plan_endpoint('savings'), methods=['GET']),
+    Route('/api/summary/{cliente}', plan_endpoint('summary'), methods=['GET']),
+    Route('/api/summaries', get_client_summaries, methods=['GET']),
+    Route('/api/query', natural_language_query, methods=['POST']),
+]
+
+app = Starlette(routes=routes, middleware=[Middleware(ServerTimingMiddleware)], lifespan=lifespan)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('async_api:app', host='0.0.0.0', port=int(os.environ.get('ASYNC_API_PORT', 5001)),
+                workers=int(os.environ.get('ASYNC_API_WORKERS', 1)))
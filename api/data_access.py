@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Data Access - Fase 3
+Camada de acesso ao banco da API: credenciais do Secrets Manager em cache com
+validade, pool de conexões MySQL reaproveitadas entre requisições e uma
+conexão por requisição (flask.g) devolvida ao pool no teardown, mesmo quando
+a rota levanta exceção. O tempo gasto no banco vai no header Server-Timing
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+import boto3
+import pymysql
+from flask import g, has_app_context
+
+CREDENTIALS_TTL = int(os.environ.get('DB_CREDENTIALS_TTL', 300))
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Conexões ociosas há mais tempo que isso recebem ping antes do uso
+PING_AFTER = 30
+
+_credentials = {'value': None, 'expires': 0.0}
+_credentials_lock = threading.Lock()
+
+def get_database_credentials(refresh=False):
+    """Credenciais do Secrets Manager, em cache por CREDENTIALS_TTL segundos"""
+    with _credentials_lock:
+        if refresh or _credentials['value'] is None or time.monotonic() >= _credentials['expires']:
+            session = boto3.session.Session()
+            client = session.client(service_name='secretsmanager', region_name='us-east-1')
+            response = client.get_secret_value(SecretId='glpidatabaseadmin')
+            secret = json.loads(response['SecretString'])
+            _credentials['value'] = {
+                'host': secret.get('host'),
+                'username': secret['username'],
+                'password': secret['password'],
+                'port': secret.get('port', 3306),
+                'dbname': secret.get('dbname', 'aws_costs')
+            }
+            _credentials['expires'] = time.monotonic() + CREDENTIALS_TTL
+        return _credentials['value']
+
+class TimedDictCursor(pymysql.cursors.DictCursor):
+    """DictCursor que soma o tempo de cada consulta no contexto da requisição
+
+    O DictCursor lê o resultado inteiro no execute, então a leitura das linhas
+    entra na medida.
+    """
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            record_db_time(time.perf_counter() - started)
+
+    def executemany(self, query, args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, args)
+        finally:
+            record_db_time(time.perf_counter() - started)
+
+def record_db_time(seconds, count=1):
+    """Acumula tempo de banco e número de consultas da requisição atual"""
+    if has_app_context():
+        g.db_time = g.get('db_time', 0.0) + seconds
+        g.db_queries = g.get('db_queries', 0) + count
+
+class ConnectionPool:
+    """Pool de conexões pymysql com tamanho máximo e criação sob demanda
+
+    Conexões devolvidas com erro são descartadas; as demais voltam para a fila
+    sem transação aberta. Credenciais rejeitadas forçam uma nova leitura do
+    segredo (rotação de senha).
+    """
+
+    def __init__(self, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.timeout = timeout
+
+    def connect(self):
+        for refresh in (False, True):
+            db_config = get_database_credentials(refresh)
+            try:
+                return pymysql.connect(
+                    host=db_config['host'],
+                    user=db_config['username'],
+                    password=db_config['password'],
+                    database='aws_costs',
+                    port=db_config['port'],
+                    charset='utf8mb4',
+                    cursorclass=TimedDictCursor,
+                    autocommit=True
+                )
+            except pymysql.err.OperationalError as e:
+                # 1045: acesso negado, a senha pode ter sido rotacionada
+                if refresh or e.args[0] != 1045:
+                    raise
+
+    def acquire(self):
+        """Conexão ociosa (verificada com ping se antiga) ou uma nova"""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise RuntimeError("Pool de conexões esgotado")
+        try:
+            while True:
+                try:
+                    conn, released_at = self.idle.get_nowait()
+                except queue.Empty:
+                    return self.connect()
+                if time.monotonic() - released_at < PING_AFTER:
+                    return conn
+                try:
+                    conn.ping(reconnect=False)
+                    return conn
+                except pymysql.err.Error:
+                    self.discard(conn)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        """Devolve a conexão ao pool (ou descarta, se quebrada)"""
+        try:
+            if broken or not conn.open:
+                self.discard(conn)
+            else:
+                self.idle.put((conn, time.monotonic()))
+        finally:
+            self.slots.release()
+
+    @staticmethod
+    def discard(conn):
+        try:
+            conn.close()
+        except pymysql.err.Error:
+            pass
+
+pool = ConnectionPool()
+
+def get_db():
+    """Conexão da requisição atual (obtida do pool no primeiro uso)"""
+    if 'db_conn' not in g:
+        started = time.perf_counter()
+        g.db_conn = pool.acquire()
+        record_db_time(time.perf_counter() - started)
+    return g.db_conn
+
+def release_db(exception=None):
+    """Teardown: devolve a conexão da requisição, inclusive após exceção"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        pool.release(conn, broken=isinstance(exception, pymysql.err.OperationalError))
+
+class ServerSideQuery:
+    """Consulta lida com cursor do lado do servidor, numa conexão dedicada do pool
+
+    Iterável de blocos de até chunk_rows linhas, convertidos por render. Não usa
+    a conexão da requisição, pois o corpo transmitido é lido depois do teardown.
+    A conexão volta ao pool quando o resultado termina; close() antes do fim
+    (cliente desconectou) a descarta, porque ainda há resultado pendente.
+    """
+
+    def __init__(self, sql, params, chunk_rows, render):
+        self.conn = pool.acquire()
+        self.chunk_rows = chunk_rows
+        self.render = render
+        self.finished = False
+        try:
+            self.cursor = self.conn.cursor(pymysql.cursors.SSDictCursor)
+            self.cursor.execute(sql, params)
+        except Exception:
+            self.close()
+            raise
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.conn is None:
+            raise StopIteration
+        rows = self.cursor.fetchmany(self.chunk_rows)
+        if not rows:
+            self.cursor.close()
+            self.finished = True
+            self.close()
+            raise StopIteration
+        return self.render(rows)
+
+    def close(self):
+        if self.conn is not None:
+            pool.release(self.conn, broken=not self.finished)
+            self.conn = None
+
+def add_server_timing(response):
+    """Header Server-Timing com o tempo de banco e o total da requisição"""
+    total = (time.perf_counter() - g.request_started) * 1000 if 'request_started' in g else 0.0
+    db_time = g.get('db_time', 0.0) * 1000
+    response.headers['Server-Timing'] = (f"db;dur={db_time:.1f};desc=\"{g.get('db_queries', 0)} queries\", "
+                                         f"app;dur={max(total - db_time, 0):.1f}")
+    return response
+
+def init_app(app):
+    """Registra a conexão por requisição e a medição de tempo na aplicação Flask"""
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    app.after_request(add_server_timing)
+    app.teardown_appcontext(release_db)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Load Test - Fase 3
+Teste de carga das rotas de leitura da API: N clientes concorrentes com
+conexão keep-alive disparam requisições por um tempo fixo contra cada alvo
+(ex.: Flask e ASGI) e o resultado compara vazão e latência
+
+    python3 api/load_test.py --target flask=http://localhost:5000 \\
+        --target asgi=http://localhost:5001 --clientes clienteA,clienteB --no-cache
+"""
+
+import argparse
+import http.client
+import itertools
+import threading
+import time
+from urllib.parse import urlsplit
+
+ROUTES = [
+    '/api/costs/monthly/{cliente}',
+    '/api/costs/top-services/{cliente}',
+    '/api/costs/daily/{cliente}',
+    '/api/alerts/{cliente}',
+    '/api/forecasts/{cliente}',
+    '/api/savings/{cliente}',
+    '/api/summary/{cliente}',
+]
+
+def percentile(values, fraction):
+    """Percentil por posição (values já ordenado)"""
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def worker(base_url, paths, deadline, no_cache, results, lock):
+    """Cliente sequencial: uma conexão keep-alive, próxima requisição ao receber a anterior"""
+    url = urlsplit(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    latencies = []
+    errors = 0
+    for sequence, path in enumerate(paths):
+        if time.monotonic() >= deadline:
+            break
+        if no_cache:
+            # Query string única: a chave do cache de respostas nunca se repete
+            path = f"{path}?nocache={threading.get_ident()}-{sequence}"
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    with lock:
+        results['latencies'].extend(latencies)
+        results['errors'] += errors
+
+def run_target(base_url, clientes, concurrency, duration, no_cache):
+    """Executa a carga contra um alvo e retorna as métricas"""
+    paths = [route.format(cliente=cliente) for cliente in clientes for route in ROUTES]
+    results = {'latencies': [], 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = []
+    for index in range(concurrency):
+        # Cada cliente começa numa rota diferente para misturar consultas leves e pesadas
+        offset = index % len(paths)
+        ordered = itertools.cycle(paths[offset:] + paths[:offset])
+        thread = threading.Thread(target=worker, args=(base_url, ordered, deadline, no_cache, results, lock))
+        thread.start()
+        threads.append(thread)
+    started = time.monotonic()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies = sorted(results['latencies'])
+    return {
+        'requests': len(latencies),
+        'errors': results['errors'],
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+    }
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Teste de carga da API de custos")
+    parser.add_argument('--target', action='append', required=True,
+                        help="nome=url base (repetível), ex.: asgi=http://localhost:5001")
+    parser.add_argument('--clientes', required=True, help="Clientes separados por vírgula")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30, help="Segundos por alvo")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Query string única por requisição (mede o banco, não o cache)")
+    args = parser.parse_args()
+
+    clientes = [cliente.strip() for cliente in args.clientes.split(',') if cliente.strip()]
+    summary = []
+    for target in args.target:
+        name, _, base_url = target.partition('=')
+        print(f"🚀 {name}: {args.concurrency} clientes por {args.duration:.0f}s em {base_url}")
+        metrics = run_target(base_url, clientes, args.concurrency, args.duration, args.no_cache)
+        summary.append((name, metrics))
+        print(f"  {metrics['requests']} requisições, {metrics['errors']} erros, "
+              f"{metrics['throughput']:.1f} req/s")
+
+    print(f"\n{'alvo':<10} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erros':>7}")
+    for name, metrics in summary:
+        print(f"{name:<10} {metrics['throughput']:>9.1f} {metrics['p50']:>9.1f} {metrics['p95']:>9.1f} "
+              f"{metrics['p99']:>9.1f} {metrics['errors']:>7}")
+    if len(summary) > 1 and summary[0][1]['throughput']:
+        baseline_name, baseline = summary[0]
+        for name, metrics in summary[1:]:
+            print(f"📊 {name}: {metrics['throughput'] / baseline['throughput']:.2f}x a vazão de {baseline_name}")
+
+if __name__ == "__main__":
+    main()
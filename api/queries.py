@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Queries - Fase 3
+Consultas e montagem das respostas das rotas de leitura, compartilhadas pelo
+servidor Flask (chatbot_api) e pelo servidor ASGI (async_api)
+
+Cada rota vira um plano: (consultas, build). consultas é um dict
+nome -> (sql, params, fetch), com fetch 'all' ou 'one', e build recebe
+{nome: resultado} e devolve o corpo da resposta. As consultas de um plano são
+independentes entre si, então podem rodar em sequência numa conexão ou
+concorrentes em conexões diferentes.
+"""
+
+import base64
+import binascii
+import json
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+from rollup_router import build_query
+
+# Paginação por keyset (?limit=&cursor=): tamanho padrão e máximo da página
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(values):
+    """Cursor opaco com a chave de ordenação da última linha da página"""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode().rstrip('=')
+
+class InvalidParameter(ValueError):
+    """Parâmetro de query string inválido (as rotas respondem 400)"""
+
+def int_param(value, name):
+    """Inteiro de um parâmetro de query string"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise InvalidParameter(f"Parâmetro {name} inválido: {value!r}")
+
+def decode_cursor(cursor, *fields):
+    """Valores da chave gravados em encode_cursor (None sem cursor)
+
+    fields converte cada valor da chave (ex.: date.fromisoformat, int); um
+    cursor adulterado ou de outra rota vira InvalidParameter.
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [field(value) for field, value in zip(fields, values)]
+    except (TypeError, ValueError, InvalidOperation, binascii.Error):
+        raise InvalidParameter("Cursor de paginação inválido")
+
+def decimal_key(value):
+    """Custo decimal gravado no cursor (texto, para o CAST no MySQL)"""
+    value = Decimal(str(value))
+    if not value.is_finite():
+        raise ValueError
+    return str(value)
+
+def page_size(limit, cursor):
+    """Tamanho da página, ou None quando a rota não foi chamada paginada"""
+    if limit is None and cursor is None:
+        return None
+    return max(1, min(int_param(limit or DEFAULT_PAGE_SIZE, 'limit'), MAX_PAGE_SIZE))
+
+def paginate(rows, size, key):
+    """Corta a página (consulta feita com size + 1) e gera o cursor da próxima"""
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    return rows, encode_cursor(key(rows[-1]))
+
+def execute_statements(cursor, statements):
+    """Executa as consultas de um plano em sequência no cursor ({nome: resultado})"""
+    results = {}
+    for name, (sql, params, fetch) in statements.items():
+        cursor.execute(sql, params)
+        results[name] = cursor.fetchall() if fetch == 'all' else cursor.fetchone()
+    return results
+
+def monthly_costs(cliente, today):
+    """Custos mensais de um cliente (últimos 6 meses)"""
+    month_index = today.year * 12 + today.month - 1 - 6
+    first_month = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}"
+    statements = {
+        'monthly_costs': (*build_query(
+            group_by=[], grain='month',
+            measures={'monthly_total': 'total_cost', 'services_count': 'services_count'},
+            filters={'client': cliente},
+            period_from=first_month,
+            order_by='year_month DESC', period_alias='year_month'
+        ), 'all'),
+    }
+
+    def build(results):
+        return {
+            "cliente": cliente,
+            "monthly_costs": results['monthly_costs'],
+            "total_months": len(results['monthly_costs'])
+        }
+    return statements, build
+
+def top_services(cliente, today, limit=10):
+    """Top serviços por custo de um cliente no mês corrente"""
+    current_month = today.strftime('%Y-%m')
+    statements = {
+        'top_services': (*build_query(
+            group_by=['service'], grain='month',
+            measures={'service_cost': 'total_cost', 'avg_growth_rate': 'avg_growth_rate',
+                      'accounts_count': 'accounts_count'},
+            filters={'client': cliente},
+            period_from=current_month, period_to=current_month,
+            order_by='service_cost DESC', limit=int_param(limit, 'limit'), period_alias='year_month'
+        ), 'all'),
+    }
+
+    def build(results):
+        return {
+            "cliente": cliente,
+            "month": current_month,
+            "top_services": results['top_services']
+        }
+    return statements, build
+
+def daily_costs_query(cliente, today, days=30, cursor=None, limit=None):
+    """SQL dos custos diários em ordem decrescente de data
+
+    O cursor guarda a última data lida; a próxima página termina no dia anterior.
+    """
+    start_date = (today - timedelta(days=int_param(days, 'days'))).strftime('%Y-%m-%d')
+    after = decode_cursor(cursor, date.fromisoformat)
+    return build_query(
+        group_by=[], grain='day',
+        measures={'daily_total': 'total_cost', 'services_count': 'services_count'},
+        filters={'client': cliente},
+        period_from=start_date,
+        period_to=(after[0] - timedelta(days=1)).isoformat() if after else None,
+        order_by='cost_date DESC', limit=limit, period_alias='cost_date'
+    )
+
+def daily_costs(cliente, today, days=30, limit=None, cursor=None):
+    """Custos diários de um cliente nos últimos `days` dias (paginado com limit/cursor)"""
+    days = int_param(days, 'days')
+    size = page_size(limit, cursor)
+    statements = {
+        'daily_costs': (*daily_costs_query(cliente, today, days, cursor, size + 1 if size else None), 'all'),
+    }
+
+    def build(results):
+        rows = results['daily_costs']
+        response = {
+            "cliente": cliente,
+            "period_days": days,
+        }
+        if size:
+            rows, response["next_cursor"] = paginate(rows, size, lambda row: [row['cost_date']])
+        response["daily_costs"] = rows
+        return response
+    return statements, build
+
+def alerts(cliente):
+    """Alertas de custo (medium, high, critical) de um cliente"""
+    statements = {
+        'alerts': ("""
+            SELECT
+                service_name,
+                trend_type,
+                growth_percentage,
+                alert_level,
+                description,
+                created_at
+            FROM cost_trends
+            WHERE cliente = %s
+            AND alert_level IN ('medium', 'high', 'critical')
+            ORDER BY
+                CASE alert_level
+                    WHEN 'critical' THEN 1
+                    WHEN 'high' THEN 2
+                    WHEN 'medium' THEN 3
+                END,
+                growth_percentage DESC
+            LIMIT 20
+        """, (cliente,), 'all'),
+    }
+
+    def build(results):
+        return {
+            "cliente": cliente,
+            "alerts": results['alerts'],
+            "total_alerts": len(results['alerts'])
+        }
+    return statements, build
+
+def forecasts_query(cliente, cursor=None, limit=None):
+    """SQL das previsões em ordem estável (período, custo previsto decrescente, id)
+
+    O cursor guarda (período, custo previsto, id) da última linha lida.
+    """
+    sql = """
+        SELECT
+            id,
+            service_name,
+            forecast_period,
+            predicted_cost,
+            confidence_interval_lower,
+            confidence_interval_upper,
+            prediction_accuracy,
+            trend_direction,
+            growth_rate
+        FROM cost_forecasts
+        WHERE cliente = %s
+    """
+    params = [cliente]
+    after = decode_cursor(cursor, str, decimal_key, int)
+    if after:
+        period, cost, last_id = after
+        sql += """
+        AND (forecast_period > %s
+             OR (forecast_period = %s AND (predicted_cost < CAST(%s AS DECIMAL(12,4))
+                 OR (predicted_cost = CAST(%s AS DECIMAL(12,4)) AND id > %s))))
+        """
+        params += [period, period, cost, cost, last_id]
+    sql += " ORDER BY forecast_period, predicted_cost DESC, id"
+    if limit:
+        sql += " LIMIT %s"
+        params.append(int(limit))
+    return sql, params
+
+def forecasts(cliente, limit=None, cursor=None):
+    """Previsões de custo de um cliente (paginadas com limit/cursor)"""
+    size = page_size(limit, cursor)
+    statements = {
+        'forecasts': (*forecasts_query(cliente, cursor, size + 1 if size else None), 'all'),
+    }
+
+    def build(results):
+        rows = results['forecasts']
+        response = {"cliente": cliente}
+        if size:
+            rows, response["next_cursor"] = paginate(
+                rows, size, lambda row: [row['forecast_period'], row['predicted_cost'], row['id']]
+            )
+        response["forecasts"] = rows
+        response["total_forecasts"] = len(rows)
+        return response
+    return statements, build
+
+def savings_opportunities(cliente):
+    """Oportunidades de economia (rightsizing e RIs subutilizadas) de um cliente"""
+    statements = {
+        'rightsizing': ("""
+            SELECT
+                'Rightsizing' as opportunity_type,
+                resource_id,
+                current_instance_type,
+                recommended_instance_type,
+                estimated_savings,
+                savings_percentage,
+                confidence_level
+            FROM rightsizing_recommendations
+            WHERE cliente = %s AND status = 'Active'
+            ORDER BY estimated_savings DESC
+            LIMIT 10
+        """, (cliente,), 'all'),
+        'ri_optimization': ("""
+            SELECT
+                'RI Optimization' as opportunity_type,
+                ri_id,
+                instance_type,
+                utilization_percentage,
+                (fixed_price * (100 - COALESCE(utilization_percentage, 0)) / 100) as potential_savings
+            FROM reserved_instances
+            WHERE cliente = %s AND state = 'active'
+            AND COALESCE(utilization_percentage, 0) < 80
+            ORDER BY potential_savings DESC
+            LIMIT 10
+        """, (cliente,), 'all'),
+    }
+
+    def build(results):
+        return {
+            "cliente": cliente,
+            "rightsizing_opportunities": results['rightsizing'],
+            "ri_optimization": results['ri_optimization'],
+            "total_opportunities": len(results['rightsizing']) + len(results['ri_optimization'])
+        }
+    return statements, build
+
+def client_summary(cliente, now):
+    """Resumo de um cliente: total do mês, top 3 serviços, alertas e economia"""
+    current_month = now.strftime('%Y-%m')
+    statements = {
+        'current_total': (*build_query(
+            group_by=[], grain='month',
+            measures={'current_month_total': 'total_cost'},
+            filters={'client': cliente},
+            period_from=current_month, period_to=current_month
+        ), 'one'),
+        'top_services': (*build_query(
+            group_by=['service'], grain='month',
+            measures={'total_cost': 'total_cost'},
+            filters={'client': cliente},
+            period_from=current_month, period_to=current_month,
+            order_by='total_cost DESC', limit=3
+        ), 'all'),
+        'critical_alerts': ("""
+            SELECT COUNT(*) as critical_alerts
+            FROM cost_trends
+            WHERE cliente = %s AND alert_level IN ('high', 'critical')
+        """, (cliente,), 'one'),
+        'potential_savings': ("""
+            SELECT SUM(estimated_savings) as potential_savings
+            FROM rightsizing_recommendations
+            WHERE cliente = %s AND status = 'Active'
+        """, (cliente,), 'one'),
+    }
+
+    def build(results):
+        row = results['current_total']
+        return summary_card(
+            cliente, current_month, row['current_month_total'] if row else None, results['top_services'],
+            results['critical_alerts']['critical_alerts'], results['potential_savings']['potential_savings'], now
+        )
+    return statements, build
+
+def summary_card(cliente, current_month, current_total, services, critical_alerts, potential_savings, now):
+    """Corpo do resumo de um cliente (mesmo formato na rota individual e no lote)"""
+    return {
+        "cliente": cliente,
+        "current_month": current_month,
+        "current_month_total": float(current_total or 0),
+        "top_services": [
+            {'service_name': service['service_name'], 'total_cost': service['total_cost']}
+            for service in services
+        ],
+        "critical_alerts": critical_alerts or 0,
+        "potential_savings": float(potential_savings or 0),
+        "summary_generated_at": now.isoformat()
+    }
+
+def parse_clientes(value):
+    """'a, b,a' -> ['a', 'b']; vazio ou 'all' -> None (todos os clientes)"""
+    clientes = []
+    for cliente in (value or '').split(','):
+        cliente = cliente.strip()
+        if cliente and cliente not in clientes:
+            clientes.append(cliente)
+    if not clientes or clientes == ['all']:
+        return None
+    return clientes
+
+def client_summaries(clientes, now):
+    """Resumo de vários clientes (None = todos) em um número fixo de consultas
+
+    Cada fato do resumo vira uma consulta agrupada por cliente; o top 3 de
+    serviços de todos os clientes sai de uma única consulta com ROW_NUMBER().
+    São 4 consultas para qualquer quantidade de clientes (5 quando todos).
+    """
+    current_month = now.strftime('%Y-%m')
+    client_filter = {'client': clientes} if clientes else {}
+    trend_filter, trend_params = '', ()
+    if clientes:
+        trend_filter = f"AND cliente IN ({', '.join(['%s'] * len(clientes))})"
+        trend_params = tuple(clientes)
+
+    services_sql, services_params = build_query(
+        group_by=['client', 'service'], grain='month',
+        measures={'total_cost': 'total_cost'},
+        filters=client_filter,
+        period_from=current_month, period_to=current_month
+    )
+    statements = {
+        'current_totals': (*build_query(
+            group_by=['client'], grain='month',
+            measures={'current_month_total': 'total_cost'},
+            filters=client_filter,
+            period_from=current_month, period_to=current_month
+        ), 'all'),
+        'top_services': (f"""
+            SELECT cliente, service_name, total_cost
+            FROM (
+                SELECT services.*,
+                       ROW_NUMBER() OVER (PARTITION BY cliente ORDER BY total_cost DESC, service_name) AS service_rank
+                FROM ({services_sql}) services
+            ) ranked
+            WHERE service_rank <= 3
+            ORDER BY cliente, service_rank
+        """, services_params, 'all'),
+        'critical_alerts': (f"""
+            SELECT cliente, COUNT(*) as critical_alerts
+            FROM cost_trends
+            WHERE alert_level IN ('high', 'critical') {trend_filter}
+            GROUP BY cliente
+        """, trend_params, 'all'),
+        'potential_savings': (f"""
+            SELECT cliente, SUM(estimated_savings) as potential_savings
+            FROM rightsizing_recommendations
+            WHERE status = 'Active' {trend_filter}
+            GROUP BY cliente
+        """, trend_params, 'all'),
+    }
+    if not clientes:
+        statements['clientes'] = ("SELECT cliente FROM dim_client ORDER BY cliente", (), 'all')
+
+    def build(results):
+        totals = {row['cliente']: row['current_month_total'] for row in results['current_totals']}
+        services = {}
+        for row in results['top_services']:
+            services.setdefault(row['cliente'], []).append(row)
+        alerts = {row['cliente']: row['critical_alerts'] for row in results['critical_alerts']}
+        savings = {row['cliente']: row['potential_savings'] for row in results['potential_savings']}
+        requested = clientes or [row['cliente'] for row in results['clientes']]
+        summaries = [
+            summary_card(cliente, current_month, totals.get(cliente), services.get(cliente, []),
+                         alerts.get(cliente), savings.get(cliente), now)
+            for cliente in requested
+        ]
+        return {
+            "current_month": current_month,
+            "summaries": summaries,
+            "total_clients": len(summaries),
+            "summary_generated_at": now.isoformat()
+        }
+    return statements, build
+
+# Palavras-chave de /api/query -> rota, na ordem de verificação
+NATURAL_QUERIES = [
+    (('custo total', 'gasto total'), 'summary'),
+    (('serviços mais caros', 'top serviços'), 'top_services'),
+    (('alertas', 'problemas'), 'alerts'),
+    (('previsão', 'forecast'), 'forecasts'),
+    (('economia', 'savings'), 'savings'),
+    (('diário', 'últimos dias'), 'daily'),
+]
+
+UNRECOGNIZED_QUERY = {
+    "message": "Consulta não reconhecida. Tente: 'custo total', 'top serviços', 'alertas', 'previsão', 'economia'",
+    "available_queries": [
+        "Qual o custo total?",
+        "Quais os serviços mais caros?",
+        "Há alertas de custo?",
+        "Qual a previsão para próximo mês?",
+        "Quais oportunidades de economia?"
+    ]
+}
+
+def match_natural_query(query):
+    """Rota atendida por uma consulta em linguagem natural (ou None)"""
+    query = query.lower()
+    for keywords, target in NATURAL_QUERIES:
+        if any(keyword in query for keyword in keywords):
+            return target
+    return None
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Response Cache - Fase 3
+Cache de respostas da API em memória, com chave por rota, parâmetros e versão
+dos dados publicada pelo pipeline (pipeline_data_version). Memória limitada
+com despejo LRU, ETag forte e 304 para If-None-Match
+"""
+
+import hashlib
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from data_access import get_db
+
+CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 5000))
+# Intervalo entre consultas da versão dos dados (o pipeline roda uma vez por noite)
+VERSION_TTL = float(os.environ.get('DATA_VERSION_TTL', 30))
+
+class ResponseCache:
+    """LRU limitado por número de entradas e por bytes dos corpos"""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, max_entries=CACHE_MAX_ENTRIES):
+        self.entries = OrderedDict()
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        body = entry[0]
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self.entries[key] = entry
+            self.size += len(body)
+            while self.size > self.max_bytes or len(self.entries) > self.max_entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted[0])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses}
+
+cache = ResponseCache()
+_version = {'value': None, 'checked': None}
+_version_lock = threading.Lock()
+
+def get_data_version():
+    """Versão atual dos dados, relida do banco no máximo a cada VERSION_TTL
+
+    None (tabela ainda não criada pelo pipeline) desativa o cache.
+    """
+    with _version_lock:
+        if _version['checked'] is not None and time.monotonic() - _version['checked'] < VERSION_TTL:
+            return _version['value']
+    try:
+        cursor = get_db().cursor()
+        cursor.execute("SELECT version FROM pipeline_data_version WHERE id = 1")
+        row = cursor.fetchone()
+        cursor.close()
+        version = row['version'] if row else None
+    except Exception:
+        version = None
+    with _version_lock:
+        if version != _version['value']:
+            # Entradas de versões antigas nunca mais seriam lidas
+            cache.clear()
+        _version.update(value=version, checked=time.monotonic())
+    return version
+
+def cached_response(view):
+    """Decorator das rotas de leitura: cache por versão dos dados e ETag/304
+
+    A chave usa o nome da rota, os argumentos (inclusive quando a rota é chamada
+    por /api/query), a query string e o dia atual, pois as rotas calculam o mês
+    corrente. Só respostas 200 são guardadas.
+    """
+    signature = inspect.signature(view)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = get_data_version()
+        if version is None:
+            return view(*args, **kwargs)
+
+        arguments = tuple(signature.bind(*args, **kwargs).arguments.items())
+        key = (view.__name__, arguments, tuple(sorted(request.args.items(multi=True))),
+               date.today().isoformat(), version)
+        entry = cache.get(key)
+        status = 'HIT'
+        if entry is None:
+            status = 'MISS'
+            response = make_response(view(*args, **kwargs))
+            # Respostas transmitidas (NDJSON) não são lidas para o cache
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            body = response.get_data()
+            etag = hashlib.sha256(repr(key).encode() + body).hexdigest()[:32]
+            entry = (body, response.mimetype, etag)
+            cache.put(key, entry)
+
+        body, mimetype, etag = entry
+        if request.method == 'GET' and etag in request.if_none_match:
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(body, status=200, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Cache'] = status
+        return response
+    return wrapper
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Rollup Router - Fase 3
+Escolhe a tabela de rollup mais agregada que atende a uma consulta e monta o
+SQL, para que os endpoints de resumo não leiam as linhas das tabelas fato
+"""
+
+# Do mais agregado para o mais detalhado; mantidos por scripts/rollup_cube.py
+ROLLUPS = [
+    {
+        'table': 'rollup_service_month',
+        'dimensions': {'service'},
+        'grain': 'month',
+        'measures': {'total_cost', 'clients_count'},
+    },
+    {
+        'table': 'rollup_client_month',
+        'dimensions': {'client'},
+        'grain': 'month',
+        'measures': {'total_cost', 'services_count', 'accounts_count'},
+    },
+    {
+        'table': 'rollup_client_service_month',
+        'dimensions': {'client', 'service'},
+        'grain': 'month',
+        'measures': {'total_cost', 'accounts_count', 'avg_growth_rate'},
+    },
+    {
+        'table': 'rollup_client_day',
+        'dimensions': {'client'},
+        'grain': 'day',
+        'measures': {'total_cost', 'services_count'},
+    },
+]
+
+# Somente medidas aditivas podem ser reagregadas para um grão mais grosso
+ADDITIVE_MEASURES = {'total_cost'}
+
+DIMENSION_COLUMNS = {
+    'client': ('dim_client', 'client_key', 'cliente'),
+    'service': ('aws_services', 'service_key', 'service_name'),
+}
+
+GRAIN_COLUMNS = {'day': 'cost_date', 'month': 'year_month'}
+
+def route(dimensions, grain, measures):
+    """Retorna o rollup mais agregado que responde à consulta
+
+    dimensions inclui as dimensões agrupadas e as filtradas. Um rollup diário
+    atende consultas mensais, e um rollup com dimensões extras atende consultas
+    mais agregadas, desde que as medidas pedidas sejam aditivas.
+    """
+    dimensions = set(dimensions)
+    for rollup in ROLLUPS:
+        if not dimensions <= rollup['dimensions']:
+            continue
+        if grain == 'day' and rollup['grain'] != 'day':
+            continue
+        exact = rollup['dimensions'] == dimensions and rollup['grain'] == grain
+        if all(m in rollup['measures'] and (exact or m in ADDITIVE_MEASURES) for m in measures):
+            return rollup
+    raise ValueError(f"Nenhum rollup atende dimensões={sorted(dimensions)} grão={grain} medidas={sorted(measures)}")
+
+def build_query(group_by, grain, measures, filters=None, period_from=None, period_to=None,
+                order_by=None, limit=None, period_alias='period'):
+    """Monta o SQL sobre o rollup escolhido por route()
+
+    group_by: dimensões agrupadas ('client', 'service'); grain: 'day' ou 'month'
+    measures: {alias: medida}; filters: {dimensão: valor natural ou lista de valores}
+    period_from/period_to: limites do período (YYYY-MM-DD ou YYYY-MM, inclusive)
+    Retorna (sql, params); o período sai na coluna period_alias.
+    """
+    filters = filters or {}
+    rollup = route(set(group_by) | set(filters), grain, set(measures.values()))
+    table = rollup['table']
+
+    select = []
+    joins = []
+    where = []
+    params = []
+
+    for dimension in sorted(set(group_by) | set(filters)):
+        dim_table, key_column, name_column = DIMENSION_COLUMNS[dimension]
+        joins.append(f"JOIN {dim_table} {dimension} ON {dimension}.id = r.{key_column}")
+        if dimension in group_by:
+            select.append(f"{dimension}.{name_column}")
+        if dimension in filters:
+            value = filters[dimension]
+            if isinstance(value, (list, tuple)):
+                where.append(f"{dimension}.{name_column} IN ({', '.join(['%s'] * len(value))})")
+                params.extend(value)
+            else:
+                where.append(f"{dimension}.{name_column} = %s")
+                params.append(value)
+
+    if grain == rollup['grain']:
+        select.append(f"r.{GRAIN_COLUMNS[grain]} as {period_alias}")
+    else:
+        select.append(f"DATE_FORMAT(r.cost_date, '%%Y-%%m') as {period_alias}")
+
+    time_column = f"r.{GRAIN_COLUMNS[rollup['grain']]}"
+    day_to_month = rollup['grain'] == 'day' and grain == 'month'
+    if period_from:
+        where.append(f"{time_column} >= %s")
+        params.append(f"{period_from}-01" if day_to_month else period_from)
+    if period_to:
+        if day_to_month:
+            # Limite mensal sobre rollup diário: até o último dia do mês
+            where.append(f"{time_column} < %s + INTERVAL 1 MONTH")
+            params.append(f"{period_to}-01")
+        else:
+            where.append(f"{time_column} <= %s")
+            params.append(period_to)
+
+    # Medidas não aditivas só chegam aqui no grão exato (uma linha por grupo)
+    for alias, measure in measures.items():
+        function = 'SUM' if measure in ADDITIVE_MEASURES else 'MAX'
+        select.append(f"{function}(r.{measure}) as {alias}")
+
+    group_columns = [f"{d}.{DIMENSION_COLUMNS[d][2]}" for d in sorted(group_by)] + [period_alias]
+    sql = f"SELECT {', '.join(select)} FROM {table} r {' '.join(joins)}"
+    if where:
+        sql += f" WHERE {' AND '.join(where)}"
+    sql += f" GROUP BY {', '.join(group_columns)}"
+    if order_by:
+        sql += f" ORDER BY {order_by}"
+    if limit:
+        sql += " LIMIT %s"
+        params.append(int(limit))
+    return sql, params
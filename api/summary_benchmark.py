@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Summary Benchmark - Fase 3
+Mede o resumo de cliente nos modos de summary_queries (combined, concurrent,
+sequential) contra o banco e grava o vencedor em api_query_settings, que a
+API usa com SUMMARY_QUERY_MODE=auto
+
+    python3 api/summary_benchmark.py --sample 20 --rounds 5 --parallel 4
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import queries
+import summary_queries
+from data_access import pool
+from rollup_router import build_query
+
+def run_on_connection(callback):
+    """Executa callback(cursor) numa conexão do pool"""
+    conn = pool.acquire()
+    try:
+        cursor = conn.cursor()
+        result = callback(cursor)
+        cursor.close()
+        return result
+    finally:
+        pool.release(conn)
+
+def run_mode(mode, cliente, now):
+    """Resumo de um cliente no modo informado
+
+    Como na API, cada resumo segura uma conexão do pool (a da requisição); no
+    modo concurrent as consultas vão para o pool próprio de summary_queries.
+    """
+    statements, build = summary_queries.summary_plan(cliente, now, mode)
+    if mode == 'concurrent':
+        return build(run_on_connection(lambda cursor: summary_queries.run_concurrent(statements)))
+    return build(run_on_connection(lambda cursor: queries.execute_statements(cursor, statements)))
+
+def sample_clientes(size):
+    """Primeiros clientes com custo no mês corrente (os resumos mais pesados)"""
+    current_month = datetime.now().strftime('%Y-%m')
+    sql, params = build_query(
+        group_by=['client'], grain='month',
+        measures={'total_cost': 'total_cost'},
+        period_from=current_month, period_to=current_month,
+        order_by='total_cost DESC', limit=size
+    )
+
+    def fetch(cursor):
+        cursor.execute(sql, params)
+        return [row['cliente'] for row in cursor.fetchall()]
+    return run_on_connection(fetch)
+
+def measure(mode, clientes, rounds, parallel, now):
+    """Latências (ms, ordenadas) de rounds resumos por cliente, parallel simultâneos"""
+    def timed(cliente):
+        started = time.perf_counter()
+        run_mode(mode, cliente, now)
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        return sorted(executor.map(timed, [cliente for _ in range(rounds) for cliente in clientes]))
+
+def check_results(clientes, now):
+    """Clientes cujo resumo difere entre os modos"""
+    mismatched = []
+    for cliente in clientes:
+        outputs = {json.dumps(run_mode(mode, cliente, now), default=str, sort_keys=True)
+                   for mode in summary_queries.SUMMARY_MODES}
+        if len(outputs) > 1:
+            mismatched.append(cliente)
+    return mismatched
+
+def save_winner(mode, stats):
+    """Grava o modo vencedor (e as medidas) em api_query_settings"""
+    def save(cursor):
+        cursor.execute(summary_queries.SETTINGS_TABLE)
+        cursor.execute("""
+            INSERT INTO api_query_settings (setting_name, setting_value, details)
+            VALUES ('summary_query_mode', %s, %s)
+            ON DUPLICATE KEY UPDATE setting_value = VALUES(setting_value), details = VALUES(details)
+        """, (mode, json.dumps(stats)))
+    run_on_connection(save)
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Benchmark dos modos de consulta do resumo de cliente")
+    parser.add_argument('--clientes', help="Clientes separados por vírgula (padrão: amostra dos clientes com custo no mês)")
+    parser.add_argument('--sample', type=int, default=20, help="Tamanho da amostra sem --clientes")
+    parser.add_argument('--rounds', type=int, default=5, help="Resumos medidos por cliente e modo")
+    parser.add_argument('--parallel', type=int, default=1, help="Resumos simultâneos (simula carga)")
+    parser.add_argument('--dry-run', action='store_true', help="Só mede, não grava o vencedor")
+    args = parser.parse_args()
+
+    clientes = queries.parse_clientes(args.clientes) or sample_clientes(args.sample)
+    if not clientes:
+        print("⚠️ Nenhum cliente para medir")
+        return
+
+    now = datetime.now()
+    print(f"⏱️ Medindo resumo de {len(clientes)} clientes, {args.rounds} rodadas, {args.parallel} em paralelo...")
+    mismatched = check_results(clientes, now)
+    if mismatched:
+        print(f"✗ Resumos diferentes entre os modos: {', '.join(mismatched[:10])}")
+        return
+
+    stats = {}
+    for mode in summary_queries.SUMMARY_MODES:
+        latencies = measure(mode, clientes, args.rounds, args.parallel, now)
+        stats[mode] = {
+            'p50_ms': round(latencies[len(latencies) // 2], 2),
+            'p95_ms': round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+        }
+
+    print(f"\n{'modo':<12} {'p50 ms':>9} {'p95 ms':>9} {'média ms':>9}")
+    for mode, values in stats.items():
+        print(f"{mode:<12} {values['p50_ms']:>9.2f} {values['p95_ms']:>9.2f} {values['mean_ms']:>9.2f}")
+
+    winner = min(summary_queries.SUMMARY_MODES, key=lambda mode: (stats[mode]['p50_ms'], stats[mode]['p95_ms']))
+    print(f"\n🏆 Modo mais rápido: {winner}")
+    if args.dry_run:
+        return
+    save_winner(winner, {'parallel': args.parallel, 'clientes': len(clientes), 'rounds': args.rounds, 'modes': stats})
+    print("✅ Modo gravado em api_query_settings (SUMMARY_QUERY_MODE=auto)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Summary Queries - Fase 3
+Formas de executar o resumo de um cliente (total do mês, top 3 serviços,
+alertas críticos e economia potencial):
+
+- combined: uma única consulta (CTE + UNION ALL), uma ida ao banco
+- concurrent: as 4 consultas em paralelo, cada uma numa conexão do pool próprio
+- sequential: as 4 consultas em sequência na mesma conexão
+
+SUMMARY_QUERY_MODE fixa o modo; 'auto' (padrão) usa o vencedor gravado por
+summary_benchmark.py em api_query_settings
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql
+
+import queries
+from data_access import ConnectionPool, get_db, record_db_time
+from rollup_router import build_query
+
+SUMMARY_MODES = ('combined', 'concurrent', 'sequential')
+# Sem benchmark gravado, uma ida ao banco é a aposta mais segura
+DEFAULT_MODE = 'combined'
+CONFIGURED_MODE = os.environ.get('SUMMARY_QUERY_MODE', 'auto')
+MODE_TTL = float(os.environ.get('SUMMARY_MODE_TTL', 300))
+# Threads do modo concurrent (cada consulta ocupa uma conexão de concurrent_pool)
+CONCURRENT_WORKERS = int(os.environ.get('SUMMARY_CONCURRENT_WORKERS', 8))
+
+SETTINGS_TABLE = """
+    CREATE TABLE IF NOT EXISTS api_query_settings (
+        setting_name VARCHAR(64) PRIMARY KEY,
+        setting_value VARCHAR(255) NOT NULL,
+        details TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+"""
+MODE_SQL = "SELECT setting_value FROM api_query_settings WHERE setting_name = 'summary_query_mode'"
+
+def combined_summary(cliente, now):
+    """Plano do resumo em uma única consulta
+
+    Cada fato vira um ramo do UNION ALL (fato, posição, serviço, valor); o top 3
+    sai de uma CTE com a mesma consulta de rollup do modo separado.
+    """
+    current_month = now.strftime('%Y-%m')
+    top_sql, top_params = build_query(
+        group_by=['service'], grain='month',
+        measures={'total_cost': 'total_cost'},
+        filters={'client': cliente},
+        period_from=current_month, period_to=current_month,
+        order_by='total_cost DESC', limit=3
+    )
+    total_sql, total_params = build_query(
+        group_by=[], grain='month',
+        measures={'current_month_total': 'total_cost'},
+        filters={'client': cliente},
+        period_from=current_month, period_to=current_month
+    )
+    statements = {
+        'summary': (f"""
+            WITH top_services AS ({top_sql})
+            SELECT 'current_total' AS fact, 0 AS fact_order, NULL AS service_name,
+                   month_total.current_month_total AS value
+            FROM ({total_sql}) month_total
+            UNION ALL
+            SELECT 'top_services', ROW_NUMBER() OVER (ORDER BY total_cost DESC), service_name, total_cost
+            FROM top_services
+            UNION ALL
+            SELECT 'critical_alerts', 0, NULL, COUNT(*)
+            FROM cost_trends
+            WHERE cliente = %s AND alert_level IN ('high', 'critical')
+            UNION ALL
+            SELECT 'potential_savings', 0, NULL, SUM(estimated_savings)
+            FROM rightsizing_recommendations
+            WHERE cliente = %s AND status = 'Active'
+            ORDER BY fact, fact_order
+        """, top_params + total_params + [cliente, cliente], 'all'),
+    }
+
+    def build(results):
+        facts = {'top_services': []}
+        for row in results['summary']:
+            if row['fact'] == 'top_services':
+                facts['top_services'].append({'service_name': row['service_name'], 'total_cost': row['value']})
+            else:
+                facts[row['fact']] = row['value']
+        return queries.summary_card(
+            cliente, current_month, facts.get('current_total'), facts['top_services'],
+            int(facts.get('critical_alerts') or 0), facts.get('potential_savings'), now
+        )
+    return statements, build
+
+def summary_plan(cliente, now, mode):
+    """Plano do resumo para o modo (concurrent e sequential usam as 4 consultas)"""
+    if mode == 'combined':
+        return combined_summary(cliente, now)
+    return queries.client_summary(cliente, now)
+
+def pick_mode(stored):
+    """SUMMARY_QUERY_MODE explícito ou, em 'auto', o modo gravado pelo benchmark"""
+    if CONFIGURED_MODE in SUMMARY_MODES:
+        return CONFIGURED_MODE
+    return stored if stored in SUMMARY_MODES else DEFAULT_MODE
+
+_mode = {'value': None, 'checked': None}
+_mode_lock = threading.Lock()
+
+def get_summary_mode():
+    """Modo do resumo no Flask; o valor gravado é relido no máximo a cada MODE_TTL"""
+    if CONFIGURED_MODE in SUMMARY_MODES:
+        return CONFIGURED_MODE
+    with _mode_lock:
+        if _mode['checked'] is not None and time.monotonic() - _mode['checked'] < MODE_TTL:
+            return _mode['value']
+    try:
+        cursor = get_db().cursor()
+        cursor.execute(MODE_SQL)
+        row = cursor.fetchone()
+        cursor.close()
+        stored = row['setting_value'] if row else None
+    except Exception:
+        stored = None
+    with _mode_lock:
+        _mode.update(value=pick_mode(stored), checked=time.monotonic())
+        return _mode['value']
+
+_executor = ThreadPoolExecutor(max_workers=CONCURRENT_WORKERS, thread_name_prefix='summary')
+# Pool separado do pool das requisições: a requisição já segura uma conexão
+# dele, e as consultas paralelas não podem disputar o restante
+concurrent_pool = ConnectionPool(size=CONCURRENT_WORKERS)
+
+def run_statement(statement):
+    """Executa uma consulta numa conexão de concurrent_pool"""
+    sql, params, fetch = statement
+    conn = concurrent_pool.acquire()
+    broken = False
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        result = cursor.fetchall() if fetch == 'all' else cursor.fetchone()
+        cursor.close()
+        return result
+    except pymysql.err.OperationalError:
+        broken = True
+        raise
+    finally:
+        concurrent_pool.release(conn, broken=broken)
+
+def run_concurrent(statements):
+    """Executa as consultas em paralelo, cada uma numa conexão de concurrent_pool
+
+    Há uma conexão por thread do executor, então nenhuma consulta espera por
+    conexão; resumos além de CONCURRENT_WORKERS consultas esperam na fila do
+    executor, sem tocar no pool das requisições (DB_POOL_SIZE).
+    """
+    started = time.perf_counter()
+    try:
+        results = list(_executor.map(run_statement, statements.values()))
+    finally:
+        # As threads não veem o contexto da requisição: registra o tempo de parede
+        record_db_time(time.perf_counter() - started, len(statements))
+    return dict(zip(statements, results))
@@ -4,6 +4,7 @@ Analytics Processor - Fase 1
 Processa dados coletados e gera métricas e tendências
 """
 
+import argparse
 import json
 import boto3
 import pymysql
@@ -11,6 +12,8 @@ from datetime import datetime, timedelta
 import os
 from decimal import Decimal
 
+from dimension_keys import DimensionKeyCache, setup_dimension_tables
+
 def get_database_credentials():
     """Recupera credenciais do banco de dados do AWS Secrets Manager"""
     secret_name = "glpidatabaseadmin"
@@ -33,8 +36,12 @@ def get_database_credentials():
         print(f"✗ Erro ao carregar credenciais: {e}")
         raise
 
-def calculate_growth_rates(db_config):
-    """Calcula taxas de crescimento mês a mês"""
+def setup_analytics_state(db_config):
+    """Cria as tabelas de estado usadas pelo processamento incremental"""
+    from trend_engine import setup_trend_tables
+    
+    setup_dimension_tables(db_config)
+    
     conn = pymysql.connect(
         host=db_config['host'], 
         user=db_config['username'], 
@@ -45,33 +52,42 @@ def calculate_growth_rates(db_config):
     )
     
     cursor = conn.cursor()
-    
-    # Calcular growth rate comparando com mês anterior
     cursor.execute("""
-        UPDATE monthly_service_costs msc1
-        JOIN monthly_service_costs msc2 ON 
-            msc1.cliente = msc2.cliente AND
-            msc1.account_id = msc2.account_id AND
-            msc1.service_name = msc2.service_name AND
-            msc1.region = msc2.region AND
-            DATE_ADD(STR_TO_DATE(CONCAT(msc2.year_month, '-01'), '%Y-%m-%d'), INTERVAL 1 MONTH) = 
-            STR_TO_DATE(CONCAT(msc1.year_month, '-01'), '%Y-%m-%d')
-        SET msc1.growth_rate = 
-            CASE 
-                WHEN msc2.total_cost > 0 THEN 
-                    ((msc1.total_cost - msc2.total_cost) / msc2.total_cost) * 100
-                ELSE NULL
-            END
-        WHERE msc1.growth_rate IS NULL
-    """)
+        CREATE TABLE IF NOT EXISTS growth_rate_state (
+            year_month VARCHAR(7) PRIMARY KEY,
+            row_count INT NOT NULL,
+            checksum BIGINT UNSIGNED NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )""")
+    
+    # Chave única necessária para o upsert de generate_cost_metrics
+    cursor.execute("SHOW INDEX FROM cost_metrics WHERE Key_name = 'unique_metric'")
+    if not cursor.fetchall():
+        cursor.execute("""
+            ALTER TABLE cost_metrics 
+            ADD UNIQUE KEY unique_metric (cliente, account_id, metric_type, metric_period)
+        """)
+    
+    setup_trend_tables(cursor)
     
     conn.commit()
     cursor.close()
     conn.close()
-    print("✓ Taxas de crescimento calculadas")
 
-def generate_cost_metrics(db_config):
-    """Gera métricas agregadas para análise"""
+def shift_month(year_month, months):
+    """Desloca um período YYYY-MM em N meses"""
+    year, month = map(int, year_month.split('-'))
+    index = year * 12 + (month - 1) + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+def calculate_growth_rates(db_config, months_per_batch=12):
+    """Calcula taxas de crescimento mês a mês com LAG() sobre o índice do mês
+    
+    Cada mês tem uma assinatura (quantidade de linhas + checksum dos totais)
+    guardada em growth_rate_state. Só são recalculados os meses cuja
+    assinatura mudou e o mês seguinte a cada um deles, pois o crescimento
+    de um mês depende do total do mês anterior.
+    """
     conn = pymysql.connect(
         host=db_config['host'], 
         user=db_config['username'], 
@@ -82,68 +98,250 @@ def generate_cost_metrics(db_config):
     )
     
     cursor = conn.cursor()
-    current_month = datetime.now().strftime('%Y-%m')
     
-    # Limpar métricas do mês atual
-    cursor.execute("DELETE FROM cost_metrics WHERE metric_period = %s", (current_month,))
-    
-    # Métrica: Total mensal por cliente
+    # Assinatura atual de cada mês
     cursor.execute("""
-        INSERT INTO cost_metrics (cliente, account_id, metric_type, metric_period, metric_value)
         SELECT 
-            cliente,
-            account_id,
-            'total_monthly',
             year_month,
-            SUM(total_cost)
-        FROM monthly_service_costs 
-        WHERE year_month = %s
-        GROUP BY cliente, account_id, year_month
-    """, (current_month,))
+            COUNT(*),
+            COALESCE(SUM(CRC32(CONCAT_WS('|', client_key, account_key, service_key, region_key, total_cost))), 0)
+        FROM fact_monthly_service_costs 
+        GROUP BY year_month
+    """)
+    current = {row[0]: (int(row[1]), int(row[2])) for row in cursor.fetchall()}
     
-    # Métrica: Serviço com maior custo por cliente
-    cursor.execute("""
-        INSERT INTO cost_metrics (cliente, account_id, metric_type, metric_period, metric_value, metric_text)
+    cursor.execute("SELECT year_month, row_count, checksum FROM growth_rate_state")
+    stored = {row[0]: (int(row[1]), int(row[2])) for row in cursor.fetchall()}
+    
+    changed = sorted(month for month, signature in current.items() if stored.get(month) != signature)
+    affected = sorted(set(changed) | 
+                      {shift_month(month, 1) for month in changed if shift_month(month, 1) in current})
+    
+    for i in range(0, len(affected), months_per_batch):
+        batch = affected[i:i + months_per_batch]
+        # Meses recalculados + seus antecessores, necessários para o LAG()
+        window_months = sorted(set(batch) | {shift_month(month, -1) for month in batch})
+        
+        batch_placeholders = ', '.join(['%s'] * len(batch))
+        window_placeholders = ', '.join(['%s'] * len(window_months))
+        
+        cursor.execute(f"""
+            UPDATE fact_monthly_service_costs msc
+            JOIN (
+                SELECT 
+                    id,
+                    month_index,
+                    LAG(total_cost) OVER w as prev_cost,
+                    LAG(month_index) OVER w as prev_index
+                FROM (
+                    SELECT 
+                        id, client_key, account_key, service_key, region_key, total_cost,
+                        CAST(LEFT(year_month, 4) AS UNSIGNED) * 12 + CAST(SUBSTRING(year_month, 6, 2) AS UNSIGNED) as month_index
+                    FROM fact_monthly_service_costs 
+                    WHERE year_month IN ({window_placeholders})
+                ) indexed
+                WINDOW w AS (PARTITION BY client_key, account_key, service_key, region_key ORDER BY month_index)
+            ) lagged ON lagged.id = msc.id
+            SET msc.growth_rate = 
+                CASE 
+                    WHEN lagged.prev_index = lagged.month_index - 1 AND lagged.prev_cost > 0 THEN 
+                        -- Limita ao intervalo de DECIMAL(8,4)
+                        LEAST(9999.9999, ((msc.total_cost - lagged.prev_cost) / lagged.prev_cost) * 100)
+                    ELSE NULL
+                END
+            WHERE msc.year_month IN ({batch_placeholders})
+        """, window_months + batch)
+    
+    # Registrar assinaturas processadas
+    if changed:
+        cursor.executemany("""
+            INSERT INTO growth_rate_state (year_month, row_count, checksum)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                row_count = VALUES(row_count),
+                checksum = VALUES(checksum)
+        """, [(month, current[month][0], current[month][1]) for month in changed])
+    
+    removed = [month for month in stored if month not in current]
+    if removed:
+        cursor.execute(f"DELETE FROM growth_rate_state WHERE year_month IN ({', '.join(['%s'] * len(removed))})", removed)
+    
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"✓ Taxas de crescimento calculadas ({len(affected)} meses recalculados)")
+
+# Uma linha por cliente/conta para o serviço mais caro e outra para o de
+# maior crescimento (podem coincidir), já com o total do grupo
+COST_METRICS_QUERY = """
+    SELECT 
+        cliente,
+        account_id,
+        service_name,
+        total_cost,
+        growth_rate,
+        group_total,
+        cost_rank,
+        growth_rank
+    FROM (
         SELECT 
             cliente,
             account_id,
-            'top_service',
-            year_month,
-            MAX(total_cost),
-            (SELECT service_name FROM monthly_service_costs msc2 
-             WHERE msc2.cliente = msc1.cliente AND msc2.account_id = msc1.account_id 
-             AND msc2.year_month = msc1.year_month
-             ORDER BY total_cost DESC LIMIT 1)
-        FROM monthly_service_costs msc1
+            service_name,
+            total_cost,
+            growth_rate,
+            SUM(total_cost) OVER (PARTITION BY cliente, account_id) as group_total,
+            ROW_NUMBER() OVER (PARTITION BY cliente, account_id ORDER BY total_cost DESC) as cost_rank,
+            ROW_NUMBER() OVER (PARTITION BY cliente, account_id ORDER BY growth_rate IS NULL, growth_rate DESC) as growth_rank
+        FROM monthly_service_costs 
         WHERE year_month = %s
-        GROUP BY cliente, account_id, year_month
-    """, (current_month,))
+    ) ranked
+    WHERE cost_rank = 1 OR growth_rank = 1
+"""
+
+# Serviços com crescimento alto (>20%)
+GROWTH_TRENDS_QUERY = """
+    SELECT 
+        cliente,
+        account_id,
+        service_name,
+        'increasing',
+        year_month,
+        growth_rate,
+        CASE 
+            WHEN growth_rate > 100 THEN 'critical'
+            WHEN growth_rate > 50 THEN 'high'
+            WHEN growth_rate > 20 THEN 'medium'
+            ELSE 'low'
+        END,
+        CONCAT('Serviço ', service_name, ' teve crescimento de ', ROUND(growth_rate, 2), '%% no mês')
+    FROM monthly_service_costs 
+    WHERE year_month = %s AND growth_rate > 20
+"""
+
+# Serviços com custo alto (top 10% por cliente)
+TOP_COST_TRENDS_QUERY = """
+    SELECT 
+        cliente,
+        account_id,
+        service_name,
+        'stable',
+        year_month,
+        0,
+        'medium',
+        CONCAT('Serviço ', service_name, ' é um dos maiores custos: $', ROUND(total_cost, 2))
+    FROM (
+        SELECT *,
+               ROW_NUMBER() OVER (PARTITION BY cliente, account_id ORDER BY total_cost DESC) as cost_rank,
+               COUNT(*) OVER (PARTITION BY cliente, account_id) as total_services
+        FROM monthly_service_costs 
+        WHERE year_month = %s
+    ) ranked
+    WHERE cost_rank <= GREATEST(1, total_services * 0.1) AND total_cost > 100
+"""
+
+def build_cost_metrics(rows):
+    """Monta as métricas a partir das linhas de COST_METRICS_QUERY"""
+    metrics = {}
+    for cliente, account_id, service_name, total_cost, growth_rate, group_total, cost_rank, growth_rank in rows:
+        if cost_rank == 1:
+            metrics[(cliente, account_id, 'total_monthly')] = (group_total, None)
+            metrics[(cliente, account_id, 'top_service')] = (total_cost, service_name)
+        if growth_rank == 1 and growth_rate is not None:
+            metrics[(cliente, account_id, 'fastest_growing')] = (growth_rate, service_name)
+    return metrics
+
+def save_cost_metrics(cursor, metric_period, metrics):
+    """Grava as métricas do período com upsert em lote e remove as obsoletas"""
+    if metrics:
+        cursor.executemany("""
+            INSERT INTO cost_metrics (cliente, account_id, metric_type, metric_period, metric_value, metric_text)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                metric_value = VALUES(metric_value),
+                metric_text = VALUES(metric_text),
+                created_at = CURRENT_TIMESTAMP
+        """, [
+            (cliente, account_id, metric_type, metric_period, value, text)
+            for (cliente, account_id, metric_type), (value, text) in metrics.items()
+        ])
     
-    # Métrica: Serviço com maior crescimento
+    # Remover métricas de grupos que deixaram de existir no período
     cursor.execute("""
-        INSERT INTO cost_metrics (cliente, account_id, metric_type, metric_period, metric_value, metric_text)
-        SELECT 
-            cliente,
-            account_id,
-            'fastest_growing',
-            year_month,
-            MAX(growth_rate),
-            (SELECT service_name FROM monthly_service_costs msc2 
-             WHERE msc2.cliente = msc1.cliente AND msc2.account_id = msc1.account_id 
-             AND msc2.year_month = msc1.year_month AND msc2.growth_rate IS NOT NULL
-             ORDER BY growth_rate DESC LIMIT 1)
-        FROM monthly_service_costs msc1
-        WHERE year_month = %s AND growth_rate IS NOT NULL
-        GROUP BY cliente, account_id, year_month
-    """, (current_month,))
+        SELECT id, cliente, account_id, metric_type
+        FROM cost_metrics 
+        WHERE metric_period = %s AND metric_type IN ('total_monthly', 'top_service', 'fastest_growing')
+    """, (metric_period,))
+    stale_ids = [row[0] for row in cursor.fetchall() if (row[1], row[2], row[3]) not in metrics]
+    if stale_ids:
+        cursor.execute(f"DELETE FROM cost_metrics WHERE id IN ({', '.join(['%s'] * len(stale_ids))})", stale_ids)
+
+def generate_cost_metrics(db_config, year_month=None):
+    """Gera métricas agregadas para análise
+    
+    Uma única leitura de monthly_service_costs com funções de janela produz,
+    por cliente/conta, o total mensal, o serviço mais caro e o serviço com
+    maior crescimento. As métricas são gravadas com upsert em lote.
+    """
+    conn = pymysql.connect(
+        host=db_config['host'], 
+        user=db_config['username'], 
+        password=db_config['password'], 
+        database='aws_costs', 
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+    
+    cursor = conn.cursor()
+    metric_period = year_month or datetime.now().strftime('%Y-%m')
+    
+    cursor.execute(COST_METRICS_QUERY, (metric_period,))
+    metrics = build_cost_metrics(cursor.fetchall())
+    save_cost_metrics(cursor, metric_period, metrics)
     
     conn.commit()
     cursor.close()
     conn.close()
-    print("✓ Métricas de custo geradas")
+    print(f"✓ Métricas de custo geradas ({len(metrics)} métricas para {metric_period})")
+
+def save_cost_trends(cursor, trend_period, trends):
+    """Regrava as tendências do período em fact_cost_trends
+    
+    As linhas chegam no formato de GROWTH_TRENDS_QUERY/TOP_COST_TRENDS_QUERY
+    (cliente, conta e serviço por nome) e são gravadas com as chaves das dimensões.
+    Uma série nas duas consultas fica com a linha de crescimento. O estado do
+    engine incremental é descartado para o período, que volta a ser regravado.
+    """
+    cursor.execute("DELETE FROM fact_cost_trends WHERE trend_period = %s", (trend_period,))
+    cursor.execute("DELETE FROM trend_series_state WHERE trend_period = %s", (trend_period,))
+    trends = list({tuple(trend[:3]): trend for trend in reversed(trends)}.values())
+    if not trends:
+        return
+    
+    cache = DimensionKeyCache(cursor)
+    client_keys = cache.get_keys('client', [trend[0] for trend in trends])
+    account_keys = cache.get_keys('account', [trend[1] for trend in trends])
+    service_keys = cache.get_keys('service', [trend[2] for trend in trends])
+    
+    cursor.executemany("""
+        INSERT INTO fact_cost_trends 
+        (client_key, account_key, service_key, trend_type, trend_period, growth_percentage, alert_level, description)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, [
+        (client_keys[cliente], account_keys[account_id], service_keys.get(service_name), *details)
+        for cliente, account_id, service_name, *details in trends
+    ])
 
-def detect_cost_trends(db_config):
-    """Detecta tendências e gera alertas"""
+def detect_cost_trends(db_config, year_month=None, full=False):
+    """Detecta tendências e gera alertas do mês (padrão: mês atual)
+    
+    Por padrão usa o engine incremental (trend_engine), que só reavalia as
+    séries tocadas pela coleta; full=True regrava o mês pelas consultas SQL.
+    """
+    if not full:
+        from trend_engine import update_trends
+        return update_trends(db_config, year_month)
+    
     conn = pymysql.connect(
         host=db_config['host'], 
         user=db_config['username'], 
@@ -154,62 +352,22 @@ def detect_cost_trends(db_config):
     )
     
     cursor = conn.cursor()
-    current_month = datetime.now().strftime('%Y-%m')
+    current_month = year_month or datetime.now().strftime('%Y-%m')
     
-    # Limpar tendências do mês atual
-    cursor.execute("DELETE FROM cost_trends WHERE trend_period = %s", (current_month,))
+    trends = []
+    for trends_query in (GROWTH_TRENDS_QUERY, TOP_COST_TRENDS_QUERY):
+        cursor.execute(trends_query, (current_month,))
+        trends.extend(cursor.fetchall())
     
-    # Detectar serviços com crescimento alto (>50%)
-    cursor.execute("""
-        INSERT INTO cost_trends 
-        (cliente, account_id, service_name, trend_type, trend_period, growth_percentage, alert_level, description)
-        SELECT 
-            cliente,
-            account_id,
-            service_name,
-            'increasing',
-            year_month,
-            growth_rate,
-            CASE 
-                WHEN growth_rate > 100 THEN 'critical'
-                WHEN growth_rate > 50 THEN 'high'
-                WHEN growth_rate > 20 THEN 'medium'
-                ELSE 'low'
-            END,
-            CONCAT('Serviço ', service_name, ' teve crescimento de ', ROUND(growth_rate, 2), '% no mês')
-        FROM monthly_service_costs 
-        WHERE year_month = %s AND growth_rate > 20
-    """, (current_month,))
-    
-    # Detectar serviços com custo alto (top 10% por cliente)
-    cursor.execute("""
-        INSERT INTO cost_trends 
-        (cliente, account_id, service_name, trend_type, trend_period, growth_percentage, alert_level, description)
-        SELECT 
-            cliente,
-            account_id,
-            service_name,
-            'stable',
-            year_month,
-            0,
-            'medium',
-            CONCAT('Serviço ', service_name, ' é um dos maiores custos: $', ROUND(total_cost, 2))
-        FROM (
-            SELECT *,
-                   ROW_NUMBER() OVER (PARTITION BY cliente, account_id ORDER BY total_cost DESC) as cost_rank,
-                   COUNT(*) OVER (PARTITION BY cliente, account_id) as total_services
-            FROM monthly_service_costs 
-            WHERE year_month = %s
-        ) ranked
-        WHERE cost_rank <= GREATEST(1, total_services * 0.1) AND total_cost > 100
-    """, (current_month,))
+    # Limpar e regravar as tendências do mês
+    save_cost_trends(cursor, current_month, trends)
     
     conn.commit()
     cursor.close()
     conn.close()
-    print("✓ Tendências e alertas detectados")
+    print(f"✓ Tendências e alertas detectados ({len(trends)} registros)")
 
-def generate_summary_report(db_config):
+def generate_summary_report(db_config, year_month=None):
     """Gera relatório resumo das análises"""
     conn = pymysql.connect(
         host=db_config['host'], 
@@ -221,7 +379,7 @@ def generate_summary_report(db_config):
     )
     
     cursor = conn.cursor()
-    current_month = datetime.now().strftime('%Y-%m')
+    current_month = year_month or datetime.now().strftime('%Y-%m')
     
     print(f"\n📊 RELATÓRIO DE ANÁLISE - {current_month}")
     print("=" * 50)
@@ -270,15 +428,34 @@ def generate_summary_report(db_config):
 
 def main():
     """Função principal do processador de analytics"""
+    parser = argparse.ArgumentParser(description="Processador de analytics de custos")
+    parser.add_argument('--month', help="Período das métricas (YYYY-MM); padrão: mês atual")
+    parser.add_argument('--engine', choices=['mysql', 'duckdb'], default='mysql',
+                        help="Onde executar as agregações")
+    parser.add_argument('--source', choices=['mysql', 'parquet'], default='mysql',
+                        help="Origem dos dados para o engine duckdb")
+    parser.add_argument('--parquet-root', default=os.environ.get('EXPORT_ROOT'),
+                        help="Raiz dos exports Parquet (--source parquet)")
+    parser.add_argument('--full-trends', action='store_true',
+                        help="Regrava as tendências do mês pelas consultas SQL em vez do engine incremental")
+    args = parser.parse_args()
+    if args.source == 'parquet' and not args.parquet_root:
+        parser.error("--source parquet exige --parquet-root (ou EXPORT_ROOT)")
+    
     print("🔍 Iniciando processamento de analytics...")
     
     db_config = get_database_credentials()
+    setup_analytics_state(db_config)
     
     # Executar análises
-    calculate_growth_rates(db_config)
-    generate_cost_metrics(db_config)
-    detect_cost_trends(db_config)
-    generate_summary_report(db_config)
+    if args.engine == 'duckdb':
+        from duckdb_engine import run_analytics
+        run_analytics(db_config, args.month, args.source, args.parquet_root)
+    else:
+        calculate_growth_rates(db_config)
+        generate_cost_metrics(db_config, args.month)
+        detect_cost_trends(db_config, args.month, args.full_trends)
+    generate_summary_report(db_config, args.month)
     
     print("\n✅ Processamento de analytics concluído!")
 
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Anomaly Detector - Fase 3
+Detector próprio de anomalias sobre fact_daily_costs: mediana/MAD móvel,
+z-score EWMA e saltos dia a dia calculados para todas as séries de uma vez
+(matrizes série × dia). Cada execução pontua apenas os dias ingeridos desde a
+última marca d'água e grava os achados em cost_anomalies
+"""
+
+import argparse
+import hashlib
+from datetime import date, timedelta
+
+import numpy as np
+import pymysql
+
+from analytics_processor import get_database_credentials
+from forecast_daily import get_daily_history
+
+DETECTOR_NAME = 'daily_costs'
+WINDOW_DAYS = 28
+EWMA_ALPHA = 0.1
+EWMA_WARMUP_DAYS = 60
+INITIAL_DAYS = 30
+MIN_ACTIVE_DAYS = 7
+# O coletor regrava os últimos 7 dias: os 6 anteriores à marca d'água mudam
+RESCORE_DAYS = 6
+
+MAD_THRESHOLD = 5.0
+EWMA_THRESHOLD = 4.0
+JUMP_THRESHOLD = 1.0
+JUMP_MIN_Z = 3.0
+MIN_IMPACT = 10.0
+
+STATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS anomaly_detector_state (
+        detector VARCHAR(50) PRIMARY KEY,
+        last_scored_date DATE NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+"""
+
+def get_connection(db_config):
+    """Cria conexão com o banco aws_costs"""
+    return pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+
+def setup_detector_tables(cursor):
+    """Cria o estado do detector e a chave única de cost_anomalies (uma única vez)"""
+    cursor.execute(STATE_TABLE)
+    cursor.execute("SHOW INDEX FROM cost_anomalies WHERE Key_name = 'unique_anomaly'")
+    if not cursor.fetchall():
+        # INSERT IGNORE do coletor avançado nunca deduplicou (não havia chave única)
+        cursor.execute("""
+            DELETE a FROM cost_anomalies a
+            JOIN cost_anomalies b ON a.account_id = b.account_id AND a.anomaly_id = b.anomaly_id AND a.id > b.id
+        """)
+        cursor.execute("ALTER TABLE cost_anomalies ADD UNIQUE KEY unique_anomaly (account_id, anomaly_id)")
+
+def get_watermark(cursor):
+    """Último dia já pontuado e último dia com custos"""
+    cursor.execute("SELECT last_scored_date FROM anomaly_detector_state WHERE detector = %s", (DETECTOR_NAME,))
+    row = cursor.fetchone()
+    cursor.execute("SELECT MAX(cost_date) FROM fact_daily_costs")
+    return (row[0] if row else None), cursor.fetchone()[0]
+
+def pack_calendar(daily_rows, start_date, end_date):
+    """Matriz densa custos[série, dia] de start_date a end_date (dias sem linha = 0)"""
+    index = {}
+    rows, columns, amounts = [], [], []
+    start = start_date.toordinal()
+    for cliente, account_id, service_name, cost_date, amount in daily_rows:
+        rows.append(index.setdefault((cliente, account_id, service_name), len(index)))
+        columns.append(cost_date.toordinal() - start)
+        amounts.append(float(amount))
+
+    costs = np.zeros((len(index), end_date.toordinal() - start + 1))
+    if index:
+        np.add.at(costs, (np.array(rows), np.array(columns)), amounts)
+    return list(index), costs
+
+def ewma_state(costs, alpha=EWMA_ALPHA):
+    """Média e variância EWMA de cada série antes de cada dia (colunas deslocadas)"""
+    mean = np.zeros_like(costs)
+    variance = np.zeros_like(costs)
+    current_mean = costs[:, 0].copy()
+    current_variance = np.zeros(costs.shape[0])
+    for day in range(1, costs.shape[1]):
+        mean[:, day] = current_mean
+        variance[:, day] = current_variance
+        delta = costs[:, day] - current_mean
+        current_mean = current_mean + alpha * delta
+        current_variance = (1 - alpha) * (current_variance + alpha * delta ** 2)
+    return mean, variance
+
+def score_days(costs, first_scored):
+    """Pontua as colunas a partir de first_scored para todas as séries
+
+    Retorna arrays [séries, dias pontuados]: esperado (mediana móvel), z MAD,
+    z EWMA, salto relativo ao dia anterior, dias com custo na janela anterior.
+    """
+    scored = costs[:, first_scored:]
+    mean, variance = ewma_state(costs)
+
+    expected = np.zeros_like(scored)
+    mad_z = np.zeros_like(scored)
+    active_days = np.zeros(scored.shape, dtype=int)
+    for offset, day in enumerate(range(first_scored, costs.shape[1])):
+        window = costs[:, max(0, day - WINDOW_DAYS):day]
+        median = np.median(window, axis=1)
+        mad = np.median(np.abs(window - median[:, np.newaxis]), axis=1) * 1.4826
+        # MAD zero (série constante) usaria divisão por zero: piso de 5% da mediana
+        scale = np.maximum(mad, np.maximum(0.05 * median, 1.0))
+        expected[:, offset] = median
+        mad_z[:, offset] = (costs[:, day] - median) / scale
+        active_days[:, offset] = (window > 0).sum(axis=1)
+
+    ewma_scale = np.maximum(np.sqrt(variance[:, first_scored:]), np.maximum(0.05 * mean[:, first_scored:], 1.0))
+    ewma_z = (scored - mean[:, first_scored:]) / ewma_scale
+    previous = costs[:, first_scored - 1:-1]
+    jump = (scored - previous) / np.maximum(previous, 1.0)
+    return expected, mad_z, ewma_z, jump, active_days
+
+def detect_anomalies(keys, costs, start_date, first_scored):
+    """Achados para os dias pontuados: impacto mínimo e ao menos um detector acima do limite
+
+    Séries com menos de MIN_ACTIVE_DAYS dias de custo na janela só geram
+    'new_service' (no primeiro dia); as estatísticas delas ainda não são estáveis.
+    O salto dia a dia só conta com z MAD >= JUMP_MIN_Z: a passagem de fim de
+    semana para dia útil dobra o custo de muitos serviços sem ser anomalia.
+    Dias acima do limite sem salto são 'service_change' (novo patamar de custo).
+    """
+    expected, mad_z, ewma_z, jump, active_days = score_days(costs, first_scored)
+    actual = costs[:, first_scored:]
+    impact = actual - expected
+    new_series = active_days == 0
+
+    hits = (impact >= MIN_IMPACT) & (new_series | (active_days >= MIN_ACTIVE_DAYS) & (
+        (mad_z >= MAD_THRESHOLD) | (ewma_z >= EWMA_THRESHOLD) | (jump >= JUMP_THRESHOLD) & (mad_z >= JUMP_MIN_Z)
+    ))
+    score = np.maximum.reduce([mad_z / MAD_THRESHOLD, ewma_z / EWMA_THRESHOLD, jump / JUMP_THRESHOLD])
+
+    anomalies = []
+    for row, offset in zip(*np.nonzero(hits)):
+        cliente, account_id, service_name = keys[row]
+        anomaly_date = date.fromordinal(start_date.toordinal() + first_scored + offset)
+        if new_series[row, offset]:
+            anomaly_type = 'new_service'
+        elif jump[row, offset] >= JUMP_THRESHOLD / 2:
+            anomaly_type = 'cost_spike'
+        else:
+            anomaly_type = 'service_change'
+        service_hash = hashlib.md5(service_name.encode()).hexdigest()[:16]
+        anomalies.append({
+            'cliente': cliente,
+            'account_id': account_id,
+            'anomaly_id': f"local-{anomaly_date:%Y%m%d}-{service_hash}",
+            'service_name': service_name,
+            'anomaly_date': anomaly_date,
+            'anomaly_score': float(min(score[row, offset], 9999)),
+            'impact_value': float(impact[row, offset]),
+            'expected_value': float(expected[row, offset]),
+            'actual_value': float(actual[row, offset]),
+            'anomaly_type': anomaly_type,
+            'root_cause': (f"mad_z={mad_z[row, offset]:.1f}; ewma_z={ewma_z[row, offset]:.1f}; "
+                           f"salto={jump[row, offset] * 100:+.0f}%")
+        })
+    return anomalies
+
+def save_anomalies(cursor, anomalies):
+    """Grava os achados; reexecuções atualizam as medidas e preservam o status"""
+    cursor.executemany("""
+        INSERT INTO cost_anomalies
+        (cliente, account_id, anomaly_id, service_name, anomaly_date, anomaly_score,
+         impact_value, expected_value, actual_value, anomaly_type, root_cause)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            anomaly_score = VALUES(anomaly_score),
+            impact_value = VALUES(impact_value),
+            expected_value = VALUES(expected_value),
+            actual_value = VALUES(actual_value),
+            anomaly_type = VALUES(anomaly_type),
+            root_cause = VALUES(root_cause)
+    """, [
+        (a['cliente'], a['account_id'], a['anomaly_id'], a['service_name'], a['anomaly_date'],
+         a['anomaly_score'], a['impact_value'], a['expected_value'], a['actual_value'],
+         a['anomaly_type'], a['root_cause'])
+        for a in anomalies
+    ])
+
+def run_detector(db_config, rescore_days=RESCORE_DAYS):
+    """Pontua os dias após a marca d'água (menos rescore_days) e avança a marca"""
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+    setup_detector_tables(cursor)
+    conn.commit()
+
+    watermark, last_day = get_watermark(cursor)
+    if last_day is None:
+        print("⚠️ Nenhum custo diário para analisar")
+        cursor.close()
+        conn.close()
+        return []
+
+    first_day = (watermark + timedelta(days=1 - rescore_days)) if watermark else last_day - timedelta(days=INITIAL_DAYS - 1)
+    if first_day > last_day:
+        print(f"✓ Nenhum dia novo desde {watermark}")
+        cursor.close()
+        conn.close()
+        return []
+
+    # Histórico extra antes do primeiro dia pontuado para a janela e o aquecimento do EWMA
+    start_date = first_day - timedelta(days=max(WINDOW_DAYS, EWMA_WARMUP_DAYS))
+    keys, costs = pack_calendar(get_daily_history(db_config, start_date=start_date), start_date, last_day)
+    anomalies = detect_anomalies(keys, costs, start_date, (first_day - start_date).days) if keys else []
+
+    save_anomalies(cursor, anomalies)
+    cursor.execute("""
+        INSERT INTO anomaly_detector_state (detector, last_scored_date) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE last_scored_date = VALUES(last_scored_date)
+    """, (DETECTOR_NAME, last_day))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    print(f"✓ {len(keys)} séries, dias {first_day} a {last_day}: {len(anomalies)} anomalias")
+    return anomalies
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Detecção de anomalias nos custos diários")
+    parser.add_argument('--rescore-days', type=int, default=RESCORE_DAYS,
+                        help="Dias antes da marca d'água pontuados novamente (custos recoletados)")
+    args = parser.parse_args()
+
+    print("🚨 Iniciando detecção de anomalias...")
+    db_config = get_database_credentials()
+    anomalies = run_detector(db_config, args.rescore_days)
+    for anomaly in sorted(anomalies, key=lambda a: -a['impact_value'])[:10]:
+        print(f"  {anomaly['anomaly_date']} {anomaly['cliente']} {anomaly['service_name']}: "
+              f"+${anomaly['impact_value']:,.2f} ({anomaly['anomaly_type']}, {anomaly['root_cause']})")
+    print("✅ Detecção de anomalias concluída!")
+
+if __name__ == "__main__":
+    main()
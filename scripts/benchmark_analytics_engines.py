@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Fase 3
+Compara o caminho MySQL do analytics_processor/cost_forecasting com o
+engine DuckDB embarcado, etapa por etapa
+"""
+
+import argparse
+import os
+import time
+
+import pymysql
+
+import analytics_processor
+import cost_forecasting
+from analytics_processor import get_database_credentials
+from duckdb_engine import DuckDBAnalyticsEngine
+
+def timed(label, results, func, *args):
+    """Executa func e registra o tempo da etapa"""
+    started = time.perf_counter()
+    value = func(*args)
+    results.append((label, time.perf_counter() - started))
+    return value
+
+def reset_growth_state(db_config):
+    """Esvazia growth_rate_state para medir o recálculo completo"""
+    conn = pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM growth_rate_state")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def run_mysql_path(db_config, month, cold):
+    """Mede as etapas executadas no RDS"""
+    results = []
+    if cold:
+        reset_growth_state(db_config)
+    timed('growth', results, analytics_processor.calculate_growth_rates, db_config)
+    timed('metrics', results, analytics_processor.generate_cost_metrics, db_config, month)
+    timed('trends', results, analytics_processor.detect_cost_trends, db_config, month, True)
+    timed('forecast_inputs', results, cost_forecasting.get_historical_data, db_config)
+    return results
+
+def run_duckdb_path(db_config, month, source, parquet_root):
+    """Mede as etapas no DuckDB, incluindo a carga das tabelas"""
+    results = []
+    engine = timed('load', results, DuckDBAnalyticsEngine, db_config, source, parquet_root)
+    try:
+        timed('growth', results, engine.calculate_growth_rates)
+        timed('metrics', results, engine.generate_cost_metrics, month)
+        timed('trends', results, engine.detect_cost_trends, month)
+        timed('forecast_inputs', results, engine.load_forecast_inputs)
+    finally:
+        engine.close()
+    return results
+
+def print_comparison(mysql_runs, duckdb_runs):
+    """Imprime a mediana de cada etapa nos dois caminhos"""
+    def medians(runs):
+        steps = {}
+        for run in runs:
+            for label, seconds in run:
+                steps.setdefault(label, []).append(seconds)
+        return {label: sorted(values)[len(values) // 2] for label, values in steps.items()}
+
+    mysql_steps = medians(mysql_runs)
+    duckdb_steps = medians(duckdb_runs)
+
+    def cell(seconds):
+        return f"{seconds:>12.3f}" if seconds is not None else f"{'-':>12}"
+
+    print(f"\n{'etapa':<18}{'mysql (s)':>12}{'duckdb (s)':>12}{'speedup':>10}")
+    print("-" * 52)
+    for label in ['load', 'growth', 'metrics', 'trends', 'forecast_inputs']:
+        mysql_seconds = mysql_steps.get(label)
+        duckdb_seconds = duckdb_steps.get(label)
+        speedup = f"{mysql_seconds / duckdb_seconds:.1f}x" if mysql_seconds and duckdb_seconds else '-'
+        print(f"{label:<18}{cell(mysql_seconds)}{cell(duckdb_seconds)}{speedup:>10}")
+
+    mysql_total = sum(mysql_steps.values())
+    duckdb_total = sum(duckdb_steps.values())
+    print("-" * 52)
+    print(f"{'total':<18}{cell(mysql_total)}{cell(duckdb_total)}{mysql_total / duckdb_total:>9.1f}x")
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Benchmark MySQL vs DuckDB para o pipeline de analytics")
+    parser.add_argument('--month', help="Período das métricas (YYYY-MM)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--cold', action='store_true',
+                        help="Força o recálculo completo do growth no MySQL a cada rodada")
+    parser.add_argument('--source', choices=['mysql', 'parquet'], default='mysql')
+    parser.add_argument('--parquet-root', default=os.environ.get('EXPORT_ROOT'))
+    args = parser.parse_args()
+
+    print("⏱️ Benchmark de engines de analytics (grava resultados no banco configurado)")
+    db_config = get_database_credentials()
+    analytics_processor.setup_analytics_state(db_config)
+
+    mysql_runs, duckdb_runs = [], []
+    for i in range(args.repeat):
+        print(f"\n🔁 Rodada {i + 1}/{args.repeat}")
+        mysql_runs.append(run_mysql_path(db_config, args.month, args.cold))
+        duckdb_runs.append(run_duckdb_path(db_config, args.month, args.source, args.parquet_root))
+
+    print_comparison(mysql_runs, duckdb_runs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Budget Alerts - Fase 3
+Avaliação dos limites de budget no momento da ingestão: a cada gravação de
+custos diários, o gasto do mês (MTD) das contas tocadas é comparado aos
+limites guardados em budget_thresholds e cada cruzamento de limite é emitido
+uma única vez por budget e mês
+"""
+
+import os
+
+import boto3
+import pymysql
+
+DEFAULT_THRESHOLDS = '50,80,100'
+
+BUDGET_ALERT_TABLES = [
+    """CREATE TABLE IF NOT EXISTS budget_thresholds (
+        account_id VARCHAR(20) NOT NULL,
+        budget_name VARCHAR(200) NOT NULL,
+        cliente VARCHAR(100) NOT NULL,
+        budget_limit DECIMAL(10,2) NOT NULL,
+        time_period VARCHAR(20) NOT NULL,
+        thresholds VARCHAR(100) NOT NULL DEFAULT '50,80,100',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (account_id, budget_name)
+    )""",
+    """CREATE TABLE IF NOT EXISTS budget_threshold_events (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        cliente VARCHAR(100) NOT NULL,
+        account_id VARCHAR(20) NOT NULL,
+        budget_name VARCHAR(200) NOT NULL,
+        budget_period VARCHAR(7) NOT NULL,
+        threshold DECIMAL(5,2) NOT NULL,
+        budget_limit DECIMAL(10,2) NOT NULL,
+        mtd_spend DECIMAL(12,4) NOT NULL,
+        percentage_used DECIMAL(8,2) NOT NULL,
+        crossed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE KEY unique_crossing (account_id, budget_name, budget_period, threshold),
+        INDEX idx_bte_cliente (cliente, crossed_at)
+    )""",
+]
+
+def setup_budget_alert_tables(db_config):
+    """Cria as tabelas de limites e de cruzamentos"""
+    conn = pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+    cursor = conn.cursor()
+    for ddl in BUDGET_ALERT_TABLES:
+        cursor.execute(ddl)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def sync_budget_limits(cursor, budget_data):
+    """Atualiza os limites a partir da coleta de budgets (preserva thresholds customizados)"""
+    if not budget_data:
+        return
+    cursor.executemany("""
+        INSERT INTO budget_thresholds (account_id, budget_name, cliente, budget_limit, time_period)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            cliente = VALUES(cliente),
+            budget_limit = VALUES(budget_limit),
+            time_period = VALUES(time_period)
+    """, [
+        (record['account_id'], record['budget_name'], record['cliente'], record['budget_limit'], record['time_period'])
+        for record in budget_data
+    ])
+
+def parse_thresholds(thresholds):
+    """'50,80,100' -> [50.0, 80.0, 100.0] (valores inválidos são ignorados)"""
+    values = []
+    for value in (thresholds or DEFAULT_THRESHOLDS).split(','):
+        try:
+            values.append(float(value))
+        except ValueError:
+            continue
+    return sorted(values)
+
+class BudgetAlertEvaluator:
+    """Limites e MTD por conta em memória; emite cada cruzamento uma única vez
+
+    Os budgets mensais das contas são carregados uma vez por avaliador. Os
+    cruzamentos já gravados ficam em memória, e o INSERT IGNORE na chave única
+    de budget_threshold_events garante a deduplicação entre coletas concorrentes.
+    Budgets com filtros (serviço, tag) são avaliados contra o total da conta.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.budgets = {}
+        self.crossed = set()
+        self.loaded_periods = set()
+
+    def load_budgets(self, account_ids):
+        """Budgets mensais das contas ainda não carregadas"""
+        missing = [account_id for account_id in set(account_ids) if account_id not in self.budgets]
+        if not missing:
+            return
+        for account_id in missing:
+            self.budgets[account_id] = []
+        self.cursor.execute(f"""
+            SELECT account_id, budget_name, cliente, budget_limit, thresholds
+            FROM budget_thresholds
+            WHERE time_period = 'MONTHLY' AND budget_limit > 0
+            AND account_id IN ({', '.join(['%s'] * len(missing))})
+        """, missing)
+        for account_id, budget_name, cliente, budget_limit, thresholds in self.cursor.fetchall():
+            self.budgets[account_id].append((budget_name, cliente, float(budget_limit), parse_thresholds(thresholds)))
+
+    def load_crossings(self, account_ids, budget_period):
+        """Cruzamentos já registrados no período para as contas"""
+        pending = [account_id for account_id in set(account_ids) if (account_id, budget_period) not in self.loaded_periods]
+        if not pending:
+            return
+        self.cursor.execute(f"""
+            SELECT account_id, budget_name, threshold
+            FROM budget_threshold_events
+            WHERE budget_period = %s AND account_id IN ({', '.join(['%s'] * len(pending))})
+        """, [budget_period] + pending)
+        for account_id, budget_name, threshold in self.cursor.fetchall():
+            self.crossed.add((account_id, budget_name, budget_period, float(threshold)))
+        self.loaded_periods.update((account_id, budget_period) for account_id in pending)
+
+    def month_to_date(self, account_pairs, budget_period):
+        """Gasto do mês por conta a partir de fact_daily_costs (pares cliente/conta)"""
+        self.cursor.execute(f"""
+            SELECT account_key, SUM(amount)
+            FROM fact_daily_costs
+            WHERE (client_key, account_key) IN ({', '.join(['(%s, %s)'] * len(account_pairs))})
+            AND cost_date >= STR_TO_DATE(CONCAT(%s, '-01'), '%%Y-%%m-%%d')
+            AND cost_date < STR_TO_DATE(CONCAT(%s, '-01'), '%%Y-%%m-%%d') + INTERVAL 1 MONTH
+            GROUP BY account_key
+        """, [key for pair in account_pairs for key in pair] + [budget_period, budget_period])
+        return {account_key: float(total) for account_key, total in self.cursor.fetchall()}
+
+    def evaluate(self, cost_data, client_keys, account_keys):
+        """Avalia os budgets das contas e meses presentes em cost_data
+
+        Retorna os cruzamentos novos (já gravados na transação do cursor).
+        """
+        periods = {}
+        for record in cost_data:
+            budget_period = str(record['cost_date'])[:7]
+            periods.setdefault(budget_period, {})[record['account_id']] = record['cliente']
+
+        self.load_budgets({account_id for accounts in periods.values() for account_id in accounts})
+
+        events = []
+        for budget_period, accounts in sorted(periods.items()):
+            accounts = {account_id: cliente for account_id, cliente in accounts.items() if self.budgets[account_id]}
+            if not accounts:
+                continue
+            self.load_crossings(accounts, budget_period)
+            spend = self.month_to_date(
+                sorted({(client_keys[cliente], account_keys[account_id]) for account_id, cliente in accounts.items()}),
+                budget_period
+            )
+            for account_id in accounts:
+                mtd_spend = spend.get(account_keys[account_id], 0.0)
+                for budget_name, cliente, budget_limit, thresholds in self.budgets[account_id]:
+                    percentage_used = mtd_spend / budget_limit * 100
+                    for threshold in thresholds:
+                        crossing = (account_id, budget_name, budget_period, threshold)
+                        if percentage_used < threshold or crossing in self.crossed:
+                            continue
+                        self.crossed.add(crossing)
+                        self.cursor.execute("""
+                            INSERT IGNORE INTO budget_threshold_events
+                            (cliente, account_id, budget_name, budget_period, threshold, budget_limit,
+                             mtd_spend, percentage_used)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                        """, (cliente, account_id, budget_name, budget_period, threshold, budget_limit,
+                              mtd_spend, min(round(percentage_used, 2), 999999.99)))
+                        # rowcount 0: outra coleta registrou o mesmo cruzamento
+                        if self.cursor.rowcount:
+                            events.append({
+                                'cliente': cliente,
+                                'account_id': account_id,
+                                'budget_name': budget_name,
+                                'budget_period': budget_period,
+                                'threshold': threshold,
+                                'budget_limit': budget_limit,
+                                'mtd_spend': mtd_spend,
+                                'percentage_used': percentage_used,
+                            })
+        return events
+
+def notify_crossings(events, topic_arn=None):
+    """Emite os cruzamentos no log e, com BUDGET_ALERT_TOPIC_ARN, no SNS
+
+    Falhas de publicação não interrompem a ingestão.
+    """
+    topic_arn = topic_arn or os.environ.get('BUDGET_ALERT_TOPIC_ARN')
+    sns_client = boto3.client('sns') if topic_arn and events else None
+    for event in events:
+        message = (f"Budget {event['budget_name']} ({event['cliente']} - {event['account_id']}) "
+                   f"atingiu {event['threshold']:.0f}% em {event['budget_period']}: "
+                   f"${event['mtd_spend']:,.2f} de ${event['budget_limit']:,.2f} "
+                   f"({event['percentage_used']:.1f}%)")
+        print(f"🚨 {message}")
+        if sns_client:
+            try:
+                sns_client.publish(TopicArn=topic_arn, Subject=f"Budget {event['threshold']:.0f}% - {event['cliente']}"[:100],
+                                   Message=message)
+            except Exception as e:
+                print(f"✗ Erro ao publicar alerta de budget: {e}")
+    if events:
+        print(f"✓ {len(events)} cruzamentos de limite de budget emitidos")
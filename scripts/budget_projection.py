@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Budget Projection - Fase 3
+Projeção de consumo dos budgets mensais: carrega a série diária de todas as
+contas com budget em uma única leitura e calcula, para todos os budgets de
+uma vez, a taxa de consumo ponderada pelo dia da semana, o gasto projetado
+do mês com banda de confiança e o dia previsto de esgotamento
+"""
+
+import argparse
+import calendar
+from datetime import date, timedelta
+
+import numpy as np
+import pymysql
+
+from analytics_processor import get_database_credentials
+
+HISTORY_DAYS = 56
+MIN_WEEKDAY_DAYS = 14
+Z_95 = 1.96
+
+PROJECTION_TABLE = """
+    CREATE TABLE IF NOT EXISTS budget_projections (
+        account_id VARCHAR(20) NOT NULL,
+        budget_name VARCHAR(200) NOT NULL,
+        budget_period VARCHAR(7) NOT NULL,
+        cliente VARCHAR(100) NOT NULL,
+        as_of_date DATE NOT NULL,
+        budget_limit DECIMAL(10,2) NOT NULL,
+        mtd_spend DECIMAL(12,4) NOT NULL,
+        burn_rate DECIMAL(12,4) NOT NULL,
+        projected_spend DECIMAL(12,4) NOT NULL,
+        projected_lower DECIMAL(12,4) NOT NULL,
+        projected_upper DECIMAL(12,4) NOT NULL,
+        projected_percentage DECIMAL(8,2) NOT NULL,
+        exhaustion_date DATE NULL,
+        earliest_exhaustion_date DATE NULL,
+        computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (account_id, budget_name, budget_period),
+        INDEX idx_bp_cliente (cliente, budget_period),
+        INDEX idx_bp_exhaustion (budget_period, exhaustion_date)
+    )
+"""
+
+def get_connection(db_config):
+    """Cria conexão com o banco aws_costs"""
+    return pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+
+def load_budget_inputs(cursor, as_of=None):
+    """Budgets mensais e custo diário das contas com budget
+
+    Retorna (budgets, linhas diárias (conta, dia, custo), dia de referência).
+    O dia de referência é o último dia coletado (a coleta tem atraso de um dia).
+    """
+    cursor.execute("""
+        SELECT account_id, budget_name, cliente, budget_limit
+        FROM budget_thresholds
+        WHERE time_period = 'MONTHLY' AND budget_limit > 0
+    """)
+    budgets = cursor.fetchall()
+    if not budgets:
+        return budgets, [], None
+
+    if as_of is None:
+        cursor.execute("SELECT MAX(cost_date) FROM fact_daily_costs")
+        as_of = cursor.fetchone()[0]
+        if as_of is None:
+            return budgets, [], None
+
+    cursor.execute("""
+        SELECT a.account_id, f.cost_date, CAST(SUM(f.amount) AS DOUBLE)
+        FROM fact_daily_costs f
+        JOIN dim_account a ON a.id = f.account_key
+        WHERE f.cost_date BETWEEN %s AND %s
+        AND a.account_id IN (SELECT account_id FROM budget_thresholds
+                             WHERE time_period = 'MONTHLY' AND budget_limit > 0)
+        GROUP BY a.account_id, f.cost_date
+    """, (as_of.replace(day=1) - timedelta(days=HISTORY_DAYS), as_of))
+    return budgets, cursor.fetchall(), as_of
+
+def weekday_factors(costs, weekdays, observed):
+    """Peso de cada dia da semana por conta (média 1 na semana)
+
+    observed marca, por conta, os dias desde o primeiro custo; contas com menos
+    de MIN_WEEKDAY_DAYS dias observados usam peso 1.
+    """
+    accounts = costs.shape[0]
+    factors = np.ones((accounts, 7))
+    for weekday in range(7):
+        selected = observed & (weekdays == weekday)[np.newaxis, :]
+        count = selected.sum(axis=1)
+        factors[:, weekday] = np.divide((costs * selected).sum(axis=1), count,
+                                        out=np.zeros(accounts), where=count > 0)
+    mean = factors.mean(axis=1, keepdims=True)
+    factors = np.divide(factors, mean, out=np.ones_like(factors), where=mean > 0)
+    # Dia da semana sem custo nenhum no histórico não zera a projeção
+    factors = np.maximum(factors, 0.05)
+    factors /= factors.mean(axis=1, keepdims=True)
+    enough = (observed.sum(axis=1) >= MIN_WEEKDAY_DAYS)[:, np.newaxis]
+    return np.where(enough, factors, 1.0)
+
+def project_budgets(budgets, daily_rows, as_of):
+    """Projeção vetorizada de todos os budgets do mês de as_of
+
+    Cada conta é observada a partir do primeiro dia com custo, para que uma conta
+    nova não herde semanas de zeros. A taxa base é o MTD dividido pela soma dos
+    pesos dos dias decorridos (ou a média do histórico quando o mês ainda não
+    tem dias observados). A banda combina a variação diária e a incerteza da
+    taxa base.
+    """
+    month_start = as_of.replace(day=1)
+    month_end = month_start.replace(day=calendar.monthrange(as_of.year, as_of.month)[1])
+    window_start = month_start - timedelta(days=HISTORY_DAYS)
+
+    account_index = {account_id: row for row, account_id in enumerate(sorted({b[0] for b in budgets}))}
+    width = (month_end - window_start).days + 1
+    costs = np.zeros((len(account_index), width))
+    for account_id, cost_date, amount in daily_rows:
+        costs[account_index[account_id], (cost_date - window_start).days] = amount
+
+    columns = np.arange(width)
+    weekdays = (window_start.weekday() + columns) % 7
+    as_of_column = (as_of - window_start).days
+    first_column = (month_start - window_start).days
+    collected = columns <= as_of_column
+    with_cost = (costs > 0) & collected
+    first_seen = np.where(with_cost.any(axis=1), with_cost.argmax(axis=1), as_of_column + 1)
+    observed = (columns >= first_seen[:, np.newaxis]) & collected
+    elapsed = observed & (columns >= first_column)
+    remaining = columns > as_of_column
+    days_elapsed = as_of_column - first_column + 1
+
+    factors = weekday_factors(costs, weekdays, observed)
+    weights = factors[:, weekdays]
+
+    # Custo "dessazonalizado" de cada dia observado: média, dispersão e taxa base
+    adjusted = costs / weights
+    observed_days = observed.sum(axis=1)
+    history_rate = np.divide((adjusted * observed).sum(axis=1), observed_days,
+                             out=np.zeros(len(costs)), where=observed_days > 0)
+    deviations = np.where(observed, adjusted - history_rate[:, np.newaxis], 0)
+    daily_std = np.sqrt(np.divide((deviations ** 2).sum(axis=1), observed_days - 1,
+                                  out=np.zeros(len(costs)), where=observed_days > 1))
+
+    mtd = (costs * elapsed).sum(axis=1)
+    elapsed_weight = (weights * elapsed).sum(axis=1)
+    burn_rate = np.divide(mtd, elapsed_weight, out=history_rate.copy(), where=elapsed_weight > 0)
+    rate_days = elapsed.sum(axis=1)
+    rate_variance = daily_std ** 2 / np.maximum(np.where(rate_days > 0, rate_days, observed_days), 1)
+
+    projected_daily = np.where(remaining, burn_rate[:, np.newaxis] * weights, 0)
+    path = np.cumsum(np.where(elapsed, costs, projected_daily), axis=1)[:, first_column:]
+    remaining_weights = np.where(remaining, weights, 0)[:, first_column:]
+    half_band = Z_95 * np.sqrt(daily_std[:, np.newaxis] ** 2 * np.cumsum(remaining_weights ** 2, axis=1)
+                               + rate_variance[:, np.newaxis] * np.cumsum(remaining_weights, axis=1) ** 2)
+
+    # Budgets apontam para a linha da conta
+    rows = np.array([account_index[account_id] for account_id, *_ in budgets])
+    limits = np.array([float(budget[3]) for budget in budgets])
+    budget_path = path[rows]
+    budget_upper = budget_path + half_band[rows]
+
+    def first_crossing(values):
+        crossed = values >= limits[:, np.newaxis]
+        return np.where(crossed.any(axis=1), crossed.argmax(axis=1), -1)
+
+    expected_day = first_crossing(budget_path)
+    earliest_day = first_crossing(budget_upper)
+    projected = budget_path[:, -1]
+    band = half_band[rows, -1]
+
+    projections = []
+    for i, (account_id, budget_name, cliente, budget_limit) in enumerate(budgets):
+        row = rows[i]
+        projections.append({
+            'account_id': account_id,
+            'budget_name': budget_name,
+            'budget_period': month_start.strftime('%Y-%m'),
+            'cliente': cliente,
+            'as_of_date': as_of,
+            'budget_limit': float(budget_limit),
+            'mtd_spend': float(mtd[row]),
+            'burn_rate': float(burn_rate[row]),
+            'projected_spend': float(projected[i]),
+            'projected_lower': float(max(mtd[row], projected[i] - band[i])),
+            'projected_upper': float(projected[i] + band[i]),
+            'projected_percentage': float(min(projected[i] / limits[i] * 100, 999999.99)),
+            'exhaustion_date': month_start + timedelta(days=int(expected_day[i])) if expected_day[i] >= 0 else None,
+            'earliest_exhaustion_date': month_start + timedelta(days=int(earliest_day[i])) if earliest_day[i] >= 0 else None,
+        })
+    print(f"✓ {len(projections)} budgets projetados ({len(account_index)} contas, {days_elapsed} dias decorridos)")
+    return projections
+
+def save_projections(cursor, projections):
+    """Grava as projeções do período (upsert por budget e mês)"""
+    columns = ['account_id', 'budget_name', 'budget_period', 'cliente', 'as_of_date', 'budget_limit',
+               'mtd_spend', 'burn_rate', 'projected_spend', 'projected_lower', 'projected_upper',
+               'projected_percentage', 'exhaustion_date', 'earliest_exhaustion_date']
+    updates = ', '.join(f"{column} = VALUES({column})" for column in columns[3:])
+    cursor.executemany(f"""
+        INSERT INTO budget_projections ({', '.join(columns)})
+        VALUES ({', '.join(['%s'] * len(columns))})
+        ON DUPLICATE KEY UPDATE {updates}
+    """, [tuple(projection[column] for column in columns) for projection in projections])
+
+def run_projection(db_config, as_of=None):
+    """Projeta todos os budgets mensais a partir do custo diário"""
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+    cursor.execute(PROJECTION_TABLE)
+
+    budgets, daily_rows, as_of = load_budget_inputs(cursor, as_of)
+    if not budgets or as_of is None:
+        print("⚠️ Nenhum budget mensal ou custo diário para projetar")
+        cursor.close()
+        conn.close()
+        return []
+
+    projections = project_budgets(budgets, daily_rows, as_of)
+    save_projections(cursor, projections)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return projections
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Projeção de consumo dos budgets mensais")
+    parser.add_argument('--as-of', type=date.fromisoformat,
+                        help="Último dia considerado (YYYY-MM-DD); padrão: último dia coletado")
+    args = parser.parse_args()
+
+    print("💸 Projetando consumo dos budgets...")
+    db_config = get_database_credentials()
+    projections = run_projection(db_config, args.as_of)
+
+    at_risk = [p for p in projections if p['exhaustion_date'] or p['earliest_exhaustion_date']]
+    for projection in sorted(at_risk, key=lambda p: -p['projected_percentage'])[:10]:
+        exhaustion = projection['exhaustion_date'] or f"até {projection['earliest_exhaustion_date']} (banda)"
+        print(f"  {projection['cliente']} {projection['budget_name']}: "
+              f"${projection['projected_spend']:,.2f} de ${projection['budget_limit']:,.2f} "
+              f"({projection['projected_percentage']:.0f}%), esgota {exhaustion}")
+    print("✅ Projeção de budgets concluída!")
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,9 @@ import pymysql
 from datetime import datetime
 import os
 
+from budget_alerts import setup_budget_alert_tables, sync_budget_limits
+from snapshot_refresher import setup_snapshot_tables, refresh_budget_snapshots
+
 def get_database_credentials():
     """Recupera credenciais do banco de dados do AWS Secrets Manager"""
     secret_name = "glpidatabaseadmin"
@@ -77,6 +80,7 @@ def setup_budget_table(db_config):
             time_period VARCHAR(20),
             data_coleta DATE,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_ba_touched (created_at),
             UNIQUE KEY unique_budget (cliente, account_id, budget_name, data_coleta)
         )""")
     conn.commit()
@@ -159,6 +163,9 @@ def save_budgets_to_mysql(budget_data, db_config):
             record["percentage_used"], record["alert_threshold"], record["alert_triggered"],
             record["time_period"], today))
     
+    # Limites usados pela avaliação de budgets na ingestão dos custos diários
+    sync_budget_limits(cursor, budget_data)
+    
     conn.commit()
     conn.close()
 
@@ -167,6 +174,7 @@ def main():
     db_config = get_database_credentials()
     print(f"Conectando no MySQL: {db_config['host']}")
     setup_budget_table(db_config)
+    setup_budget_alert_tables(db_config)
     
     # Carrega roles do S3 ao invés de arquivo local
     roles_data = load_roles_from_s3()
@@ -186,10 +194,14 @@ def main():
             budget["account_id"] = role["account_id"]
             budget_data.append(budget)
             
-        print(f"✓ {role["cliente"]} - {role["account_id"]} - {len(budgets)} budgets")
+        print(f"✓ {role['cliente']} - {role['account_id']} - {len(budgets)} budgets")
     
     save_budgets_to_mysql(budget_data, db_config)
     print(f"✓ Dados de budget salvos no MySQL: {len(budget_data)} registros")
+    
+    # Atualiza os snapshots lidos pelo Metabase
+    setup_snapshot_tables(db_config)
+    refresh_budget_snapshots(db_config)
 
 if __name__ == "__main__":
     main()
@@ -4,7 +4,10 @@ Cost Forecasting - Fase 2
 Gera previsões de custos usando dados históricos
 """
 
+import argparse
+import hashlib
 import json
+import os
 import boto3
 import pymysql
 import numpy as np
@@ -14,6 +17,13 @@ from sklearn.preprocessing import PolynomialFeatures
 import warnings
 warnings.filterwarnings('ignore')
 
+from dimension_keys import DimensionKeyCache
+from forecast_backtest import select_models
+from forecast_batch import HistoryArrays, forecast_periods, generate_forecasts_batch, history_from_rows
+from forecast_daily import DEFAULT_DAYS_BACK, generate_daily_forecasts, get_daily_history
+from forecast_reconciliation import DEFAULT_METHOD, METHODS, RECONCILED_TABLE, reconcile_forecasts
+from forecast_models import MODELS, DEFAULT_CHUNK_SIZE, DEFAULT_TIME_BUDGET, generate_forecasts_parallel
+
 def get_database_credentials():
     """Recupera credenciais do banco de dados do AWS Secrets Manager"""
     secret_name = "glpidatabaseadmin"
@@ -56,10 +66,11 @@ def get_historical_data(db_config, months_back=6):
             account_id,
             service_name,
             year_month,
-            total_cost,
-            STR_TO_DATE(CONCAT(year_month, '-01'), '%Y-%m-%d') as month_date
+            SUM(total_cost) as total_cost,
+            STR_TO_DATE(CONCAT(year_month, '-01'), '%%Y-%%m-%%d') as month_date
         FROM monthly_service_costs 
         WHERE year_month >= DATE_FORMAT(DATE_SUB(CURDATE(), INTERVAL %s MONTH), '%%Y-%%m')
+        GROUP BY cliente, account_id, service_name, year_month
         ORDER BY cliente, account_id, service_name, year_month
     """, (months_back,))
     
@@ -69,6 +80,131 @@ def get_historical_data(db_config, months_back=6):
     
     return results
 
+def load_history_arrays(db_config, months_back=6, fetch_size=10000):
+    """Carrega o histórico mensal direto em arrays NumPy (HistoryArrays)
+    
+    Usa cursor do lado do servidor (SSCursor) e grava cada linha em matrizes
+    pré-alocadas [série, mês]; o ORDER BY pelas chaves deixa cada série
+    contígua, então a troca de série é detectada durante a leitura.
+    """
+    conn = pymysql.connect(
+        host=db_config['host'], 
+        user=db_config['username'], 
+        password=db_config['password'], 
+        database='aws_costs', 
+        port=db_config['port'],
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.SSCursor
+    )
+    
+    cursor = conn.cursor()
+    
+    names = {}
+    for dimension, table, column in (('client', 'dim_client', 'cliente'), ('account', 'dim_account', 'account_id'),
+                                     ('service', 'aws_services', 'service_name')):
+        cursor.execute(f"SELECT id, {column} FROM {table}")
+        names[dimension] = dict(cursor.fetchall())
+    
+    cursor.execute("SELECT DATE_FORMAT(DATE_SUB(CURDATE(), INTERVAL %s MONTH), '%%Y-%%m')", (months_back,))
+    first_month = cursor.fetchone()[0]
+    
+    year, month = int(first_month[:4]), int(first_month[5:])
+    months = []
+    for _ in range(months_back + 1):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    month_index = {year_month: column for column, year_month in enumerate(months)}
+    
+    cursor.execute("""
+        SELECT client_key, account_key, service_key, year_month, CAST(SUM(total_cost) AS DOUBLE)
+        FROM fact_monthly_service_costs
+        WHERE year_month >= %s
+        GROUP BY client_key, account_key, service_key, year_month
+        ORDER BY client_key, account_key, service_key, year_month
+    """, (first_month,))
+    
+    capacity = 1024
+    costs = np.zeros((capacity, len(months)))
+    mask = np.zeros((capacity, len(months)), dtype=bool)
+    keys = []
+    previous = None
+    row = -1
+    
+    while True:
+        batch = cursor.fetchmany(fetch_size)
+        if not batch:
+            break
+        for client_key, account_key, service_key, year_month, total_cost in batch:
+            if (client_key, account_key, service_key) != previous:
+                previous = (client_key, account_key, service_key)
+                row += 1
+                if row == capacity:
+                    capacity *= 2
+                    costs = np.resize(costs, (capacity, len(months)))
+                    mask = np.resize(mask, (capacity, len(months)))
+                    costs[row:] = 0
+                    mask[row:] = False
+                keys.append((names['client'][client_key], names['account'][account_key],
+                             names['service'][service_key]))
+            column = month_index.get(year_month)
+            if column is not None:
+                costs[row, column] = total_cost
+                mask[row, column] = True
+    
+    cursor.close()
+    conn.close()
+    
+    return HistoryArrays(keys, months, costs[:row + 1].copy(), mask[:row + 1].copy())
+
+def series_fingerprints(history, model):
+    """Impressão digital (MD5) do histórico de entrada de cada série
+    
+    Inclui o modelo e os períodos previstos, então a série volta a ser ajustada
+    quando o histórico, o modelo ou o mês de referência mudam.
+    """
+    if not isinstance(history, HistoryArrays):
+        history = history_from_rows(history)
+    
+    prefix = repr((model, forecast_periods())).encode()
+    months = np.array(history.months)
+    rounded = np.round(history.costs, 4)
+    fingerprints = {}
+    for row, key in enumerate(history.keys):
+        digest = hashlib.md5(prefix)
+        digest.update(','.join(months[history.mask[row]]).encode())
+        digest.update(rounded[row, history.mask[row]].tobytes())
+        fingerprints[key] = digest.hexdigest()
+    return fingerprints
+
+def get_stored_fingerprints(db_config):
+    """(cliente, conta, serviço, impressão digital) das previsões já gravadas"""
+    conn = pymysql.connect(
+        host=db_config['host'], 
+        user=db_config['username'], 
+        password=db_config['password'], 
+        database='aws_costs', 
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+    
+    cursor = conn.cursor()
+    periods = forecast_periods()
+    cursor.execute(f"""
+        SELECT DISTINCT c.cliente, a.account_id, s.service_name, f.input_fingerprint
+        FROM fact_cost_forecasts f
+        JOIN dim_client c ON c.id = f.client_key
+        JOIN dim_account a ON a.id = f.account_key
+        JOIN aws_services s ON s.id = f.service_key
+        WHERE f.forecast_period IN ({', '.join(['%s'] * len(periods))})
+        AND f.input_fingerprint IS NOT NULL
+    """, periods)
+    
+    stored = set(cursor.fetchall())
+    cursor.close()
+    conn.close()
+    
+    return stored
+
 def calculate_trend_direction(costs):
     """Calcula direção da tendência"""
     if len(costs) < 2:
@@ -111,10 +247,43 @@ def forecast_linear(costs, periods_ahead=3):
     
     return predictions, confidence
 
-def generate_forecasts(db_config):
-    """Gera previsões para todos os clientes e serviços"""
-    historical_data = get_historical_data(db_config)
-    
+def generate_forecasts(db_config, historical_data=None, engine='batch', model='linear_regression',
+                       workers=None, chunk_size=DEFAULT_CHUNK_SIZE, time_budget=DEFAULT_TIME_BUDGET):
+    """Gera previsões para todos os clientes e serviços
+    
+    engine='batch' ajusta todas as séries de uma vez (forecast_batch);
+    engine='loop' mantém o ajuste por série com sklearn.
+    Outros modelos (holt, holt_winters) rodam por série em um pool de
+    processos (forecast_models), com fallback para o linear.
+    model='auto' usa o modelo escolhido pelo backtest de cada série e grava
+    1 - WAPE do backtest como prediction_accuracy.
+    """
+    if historical_data is None:
+        historical_data = load_history_arrays(db_config)
+    elif not isinstance(historical_data, HistoryArrays):
+        historical_data = history_from_rows(historical_data)
+    
+    if model == 'auto':
+        selection = select_models(db_config, historical_data)
+        selected = np.array([selection.get(key, ('linear_regression',))[0] for key in historical_data.keys])
+        
+        forecasts = []
+        for selected_model in set(selected):
+            forecasts += generate_forecasts(db_config, historical_data.subset(selected == selected_model), engine,
+                                            selected_model, workers, chunk_size, time_budget)
+        for forecast in forecasts:
+            wape = selection.get((forecast['cliente'], forecast['account_id'], forecast['service_name']), (None, None))[1]
+            if wape is not None:
+                forecast['prediction_accuracy'] = max(0.0, 1 - wape) * 100
+        return forecasts
+    if model != 'linear_regression':
+        return generate_forecasts_parallel(historical_data, model, workers, chunk_size, time_budget)
+    if engine == 'batch':
+        return generate_forecasts_batch(historical_data)
+    return generate_forecasts_loop(historical_data.rows())
+
+def generate_forecasts_loop(historical_data):
+    """Gera previsões ajustando um modelo sklearn por série"""
     # Organizar dados por cliente/conta/serviço
     data_groups = {}
     for row in historical_data:
@@ -192,31 +361,42 @@ def save_forecasts(forecasts, db_config):
     
     cursor = conn.cursor()
     
-    # Limpar previsões antigas
-    cursor.execute("DELETE FROM cost_forecasts WHERE created_at < DATE_SUB(NOW(), INTERVAL 7 DAY)")
-    
-    for forecast in forecasts:
-        cursor.execute("""
-            INSERT INTO cost_forecasts 
-            (cliente, account_id, service_name, forecast_period, forecast_type,
-             predicted_cost, confidence_interval_lower, confidence_interval_upper,
-             prediction_accuracy, trend_direction, growth_rate)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                predicted_cost = VALUES(predicted_cost),
-                confidence_interval_lower = VALUES(confidence_interval_lower),
-                confidence_interval_upper = VALUES(confidence_interval_upper),
-                prediction_accuracy = VALUES(prediction_accuracy),
-                trend_direction = VALUES(trend_direction),
-                growth_rate = VALUES(growth_rate),
-                created_at = CURRENT_TIMESTAMP
-        """, (
-            forecast['cliente'], forecast['account_id'], forecast['service_name'],
+    # Limpar previsões de períodos já encerrados (séries reaproveitadas mantêm created_at)
+    cursor.execute("DELETE FROM fact_cost_forecasts WHERE forecast_period < DATE_FORMAT(CURDATE(), '%Y-%m')")
+    
+    cache = DimensionKeyCache(cursor)
+    client_keys = cache.get_keys('client', [forecast['cliente'] for forecast in forecasts])
+    account_keys = cache.get_keys('account', [forecast['account_id'] for forecast in forecasts])
+    service_keys = cache.get_keys('service', [forecast['service_name'] for forecast in forecasts])
+    
+    cursor.executemany("""
+        INSERT INTO fact_cost_forecasts 
+        (client_key, account_key, service_key, forecast_period, forecast_type,
+         predicted_cost, confidence_interval_lower, confidence_interval_upper,
+         prediction_accuracy, trend_direction, growth_rate, model_used, input_fingerprint)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            predicted_cost = VALUES(predicted_cost),
+            confidence_interval_lower = VALUES(confidence_interval_lower),
+            confidence_interval_upper = VALUES(confidence_interval_upper),
+            prediction_accuracy = VALUES(prediction_accuracy),
+            trend_direction = VALUES(trend_direction),
+            growth_rate = VALUES(growth_rate),
+            model_used = VALUES(model_used),
+            input_fingerprint = VALUES(input_fingerprint),
+            created_at = CURRENT_TIMESTAMP
+    """, [
+        (
+            client_keys[forecast['cliente']], account_keys[forecast['account_id']],
+            service_keys[forecast['service_name']],
             forecast['forecast_period'], forecast['forecast_type'],
             forecast['predicted_cost'], forecast['confidence_interval_lower'],
             forecast['confidence_interval_upper'], forecast['prediction_accuracy'],
-            forecast['trend_direction'], forecast['growth_rate']
-        ))
+            forecast['trend_direction'], forecast['growth_rate'],
+            forecast.get('model_used', 'linear_regression'), forecast.get('input_fingerprint')
+        )
+        for forecast in forecasts
+    ])
     
     conn.commit()
     cursor.close()
@@ -241,15 +421,20 @@ def generate_forecast_summary(db_config):
     # Previsões por cliente para próximo mês
     next_month = (datetime.now() + timedelta(days=30)).strftime('%Y-%m')
     
+    # Total do cliente reconciliado (coerente com contas e serviços), quando houver
+    cursor.execute(RECONCILED_TABLE)
     cursor.execute("""
         SELECT 
-            cliente,
-            SUM(predicted_cost) as total_predicted,
-            AVG(prediction_accuracy) as avg_accuracy,
-            COUNT(DISTINCT service_name) as services_count
-        FROM cost_forecasts 
-        WHERE forecast_period = %s
-        GROUP BY cliente
+            f.cliente,
+            COALESCE(MAX(r.reconciled_forecast), SUM(f.predicted_cost)) as total_predicted,
+            AVG(f.prediction_accuracy) as avg_accuracy,
+            COUNT(DISTINCT f.service_name) as services_count
+        FROM cost_forecasts f
+        JOIN dim_client c ON c.cliente = f.cliente
+        LEFT JOIN cost_forecasts_reconciled r
+            ON r.level = 'client' AND r.client_key = c.id AND r.forecast_period = f.forecast_period
+        WHERE f.forecast_period = %s
+        GROUP BY f.cliente
         ORDER BY total_predicted DESC
         LIMIT 10
     """, (next_month,))
@@ -281,6 +466,36 @@ def generate_forecast_summary(db_config):
 
 def main():
     """Função principal"""
+    parser = argparse.ArgumentParser(description="Geração de previsões de custos")
+    parser.add_argument('--engine', choices=['mysql', 'duckdb'], default='mysql',
+                        help="Onde montar o histórico de entrada")
+    parser.add_argument('--source', choices=['mysql', 'parquet'], default='mysql',
+                        help="Origem dos dados para o engine duckdb")
+    parser.add_argument('--parquet-root', default=os.environ.get('EXPORT_ROOT'),
+                        help="Raiz dos exports Parquet (--source parquet)")
+    parser.add_argument('--forecast-engine', choices=['batch', 'loop'], default='batch',
+                        help="Ajuste em lote (NumPy) ou por série (sklearn)")
+    parser.add_argument('--model', choices=sorted(MODELS) + ['auto'], default='linear_regression',
+                        help="Modelo de previsão; modelos não lineares rodam em pool de processos e "
+                             "auto escolhe por série via backtest")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processos do pool (padrão: número de CPUs)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Séries enviadas por tarefa ao pool")
+    parser.add_argument('--time-budget', type=float, default=DEFAULT_TIME_BUDGET,
+                        help="Segundos por série antes do fallback linear")
+    parser.add_argument('--months-back', type=int, default=6,
+                        help="Meses de histórico (holt_winters precisa de 24)")
+    parser.add_argument('--full-refit', action='store_true',
+                        help="Reajusta todas as séries, mesmo sem mudança no histórico")
+    parser.add_argument('--reconciliation', choices=list(METHODS) + ['none'], default=DEFAULT_METHOD,
+                        help="Reconciliação hierárquica serviço → conta → cliente")
+    parser.add_argument('--days-back', type=int, default=DEFAULT_DAYS_BACK,
+                        help="Dias de histórico da previsão diária")
+    parser.add_argument('--skip-daily', action='store_true',
+                        help="Não gera a previsão diária (fechamento do mês e séries novas)")
+    args = parser.parse_args()
+    
     print("🔮 Iniciando geração de previsões de custos...")
     
     try:
@@ -288,16 +503,49 @@ def main():
         
         # Gerar previsões
         print("📊 Analisando dados históricos...")
-        forecasts = generate_forecasts(db_config)
+        historical_data = None
+        if args.engine == 'mysql':
+            historical_data = load_history_arrays(db_config, args.months_back)
+        if args.engine == 'duckdb':
+            from duckdb_engine import DuckDBAnalyticsEngine
+            engine = DuckDBAnalyticsEngine(db_config, args.source, args.parquet_root)
+            historical_data = history_from_rows(engine.load_forecast_inputs(args.months_back))
+            engine.close()
+        
+        # Só reajusta as séries cujo histórico de entrada mudou
+        fingerprints = series_fingerprints(historical_data, args.model)
+        stored = set() if args.full_refit else get_stored_fingerprints(db_config)
+        reused = {key for key, fingerprint in fingerprints.items() if key + (fingerprint,) in stored}
+        changed_data = historical_data.subset([key not in reused for key in historical_data.keys])
+        print(f"♻️ {len(reused)} séries reaproveitadas, {len(fingerprints) - len(reused)} reajustadas")
+        
+        forecasts = generate_forecasts(db_config, changed_data, args.forecast_engine, args.model,
+                                       args.workers, args.chunk_size, args.time_budget)
+        for forecast in forecasts:
+            forecast['input_fingerprint'] = fingerprints[(forecast['cliente'], forecast['account_id'],
+                                                          forecast['service_name'])]
+        
+        # Fechamento do mês para todas as séries; meses seguintes só para as
+        # séries sem histórico mensal suficiente (gravada por último, prevalece)
+        if not args.skip_daily:
+            covered = reused | {(f['cliente'], f['account_id'], f['service_name']) for f in forecasts}
+            forecasts += generate_daily_forecasts(get_daily_history(db_config, args.days_back), covered)
         
         if forecasts:
             print(f"💾 Salvando {len(forecasts)} previsões...")
             save_forecasts(forecasts, db_config)
-            
+        
+        if args.reconciliation != 'none':
+            print("🧮 Reconciliando previsões entre serviço, conta e cliente...")
+            reconcile_forecasts(db_config, historical_data, args.reconciliation)
+        
+        if forecasts:
             # Gerar resumo
             generate_forecast_summary(db_config)
             
             print(f"\n✅ Previsões geradas com sucesso!")
+        elif reused:
+            print("✅ Nenhuma série mudou; previsões mantidas")
         else:
             print("⚠️ Dados históricos insuficientes para previsões")
     
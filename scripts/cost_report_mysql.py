@@ -6,6 +6,8 @@ from datetime import datetime, timedelta
 import calendar
 import os
 
+from snapshot_refresher import setup_snapshot_tables, refresh_cost_report_snapshots
+
 def get_database_credentials():
     """Recupera credenciais do banco de dados do AWS Secrets Manager"""
     secret_name = "glpidatabaseadmin"
@@ -195,6 +197,10 @@ def main():
         print(f"✓ {role['cliente']} - {role['account_id']}")
     save_to_mysql(cost_data, db_config)
     print(f"✓ Dados salvos no MySQL: {len(cost_data)} registros")
+    
+    # Atualiza os snapshots lidos pelo Metabase
+    setup_snapshot_tables(db_config)
+    refresh_cost_report_snapshots(db_config)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Daily Costs Retention - Fase 3
+Mantém em daily_costs apenas os meses recentes: meses além do horizonte são
+compactados em monthly_service_costs, arquivados em Parquet e removidos da
+tabela quente em lotes pequenos
+"""
+
+import argparse
+import os
+import posixpath
+import time
+from datetime import datetime
+
+import pyarrow.parquet as pq
+
+from analytics_processor import get_database_credentials, shift_month
+from enhanced_cost_collector import calculate_monthly_aggregates
+from parquet_exporter import (
+    DEFAULT_BATCH_SIZE, get_connection, get_filesystem, export_partition, partition_path
+)
+from snapshot_refresher import month_bounds
+
+DEFAULT_RETENTION_MONTHS = int(os.environ.get('DAILY_RETENTION_MONTHS', 13))
+DEFAULT_ARCHIVE_ROOT = os.environ.get('ARCHIVE_ROOT', './daily_costs_archive')
+DEFAULT_DELETE_BATCH = 2000
+DEFAULT_DELETE_PAUSE = 0.5
+
+def setup_retention_state(db_config):
+    """Cria a tabela que registra os meses arquivados e expurgados"""
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_costs_archive_log (
+            year_month VARCHAR(7) PRIMARY KEY,
+            archive_root VARCHAR(500) NOT NULL,
+            rows_archived INT NOT NULL,
+            max_id BIGINT NOT NULL,
+            status ENUM('archived', 'purged') NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            purged_at TIMESTAMP NULL
+        )""")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def get_expired_months(db_config, retention_months):
+    """Meses com linhas em daily_costs anteriores ao horizonte de retenção"""
+    cutoff_month = shift_month(datetime.now().strftime('%Y-%m'), -retention_months)
+    cutoff_date, _ = month_bounds(cutoff_month)
+
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+    # Varredura apenas do intervalo expirado, coberta por idx_fdc_date
+    cursor.execute("""
+        SELECT DISTINCT DATE_FORMAT(cost_date, '%%Y-%%m') as year_month
+        FROM fact_daily_costs
+        WHERE cost_date < %s
+        ORDER BY year_month
+    """, (cutoff_date,))
+    months = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT year_month, status, rows_archived, max_id FROM daily_costs_archive_log")
+    archive_log = {row[0]: row[1:] for row in cursor.fetchall()}
+    cursor.close()
+    conn.close()
+
+    return months, archive_log
+
+def count_archived_rows(filesystem, root, year_month, cliente):
+    """Lê do rodapé do Parquet quantas linhas foram gravadas na partição"""
+    path = posixpath.join(root, partition_path('daily_costs', year_month, cliente), 'part-0.parquet')
+    with filesystem.open_input_file(path) as source:
+        return pq.ParquetFile(source).metadata.num_rows
+
+def archive_month(db_config, archive_root, year_month):
+    """Compacta e arquiva um mês; retorna (linhas, maior id) ou None se vazio
+
+    O agregado mensal é recalculado antes do arquivamento, enquanto todas as
+    linhas diárias do mês ainda estão na tabela. Cada partição é relida do
+    Parquet e comparada com a contagem do banco antes de liberar o expurgo.
+    """
+    first_day, last_day = month_bounds(year_month)
+
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT cliente, COUNT(*), MAX(id)
+        FROM daily_costs
+        WHERE cost_date BETWEEN %s AND %s
+        GROUP BY cliente
+    """, (first_day, last_day))
+    partitions = cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+    if not partitions:
+        return None
+
+    calculate_monthly_aggregates(db_config, year_month)
+
+    filesystem, root_path = get_filesystem(archive_root)
+    for cliente, row_count, _ in partitions:
+        export_partition(db_config, filesystem, root_path, 'daily_costs', year_month, cliente, DEFAULT_BATCH_SIZE)
+        archived_rows = count_archived_rows(filesystem, root_path, year_month, cliente)
+        if archived_rows < row_count:
+            raise RuntimeError(
+                f"Arquivo de {year_month}/{cliente} tem {archived_rows} linhas, banco tem {row_count}"
+            )
+
+    return sum(row[1] for row in partitions), max(row[2] for row in partitions)
+
+def purge_month(db_config, year_month, max_id, batch_size, pause):
+    """Remove as linhas arquivadas do mês em lotes, com pausa entre eles
+
+    Cada lote é uma transação curta sobre o índice de cost_date, então os
+    locks duram pouco e a replicação não acumula atraso. Linhas com id acima
+    do registrado no arquivamento não estão no arquivo e são preservadas.
+    """
+    first_day, last_day = month_bounds(year_month)
+
+    conn = get_connection(db_config)
+    conn.autocommit(True)
+    cursor = conn.cursor()
+
+    deleted = 0
+    while True:
+        cursor.execute("""
+            DELETE FROM fact_daily_costs
+            WHERE cost_date BETWEEN %s AND %s AND id <= %s
+            LIMIT %s
+        """, (first_day, last_day, max_id, batch_size))
+        deleted += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            break
+        time.sleep(pause)
+
+    cursor.execute("""
+        UPDATE daily_costs_archive_log
+        SET status = 'purged', purged_at = CURRENT_TIMESTAMP
+        WHERE year_month = %s
+    """, (year_month,))
+
+    cursor.close()
+    conn.close()
+    return deleted
+
+def record_archive(db_config, year_month, archive_root, rows_archived, max_id):
+    """Registra o mês como arquivado (pronto para expurgo)"""
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO daily_costs_archive_log (year_month, archive_root, rows_archived, max_id, status)
+        VALUES (%s, %s, %s, %s, 'archived')
+        ON DUPLICATE KEY UPDATE
+            archive_root = VALUES(archive_root),
+            rows_archived = VALUES(rows_archived),
+            max_id = VALUES(max_id),
+            status = 'archived',
+            archived_at = CURRENT_TIMESTAMP,
+            purged_at = NULL
+    """, (year_month, archive_root, rows_archived, max_id))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def apply_retention(db_config, retention_months=DEFAULT_RETENTION_MONTHS, archive_root=DEFAULT_ARCHIVE_ROOT,
+                    batch_size=DEFAULT_DELETE_BATCH, pause=DEFAULT_DELETE_PAUSE, dry_run=False):
+    """Arquiva e expurga os meses de daily_costs além do horizonte de retenção"""
+    months, archive_log = get_expired_months(db_config, retention_months)
+    if not months:
+        print(f"✓ Nenhum mês de daily_costs além de {retention_months} meses")
+        return 0
+
+    total_deleted = 0
+    for year_month in months:
+        status, rows_archived, max_id = archive_log.get(year_month, (None, None, None))
+
+        if dry_run:
+            print(f"  {year_month}: {status or 'pendente'}")
+            continue
+
+        if status == 'purged':
+            # Linhas chegaram depois do expurgo; ficam na tabela até revisão manual
+            print(f"⚠️ {year_month} já foi expurgado, mas ainda tem linhas em daily_costs")
+            continue
+
+        if status is None:
+            archived = archive_month(db_config, archive_root, year_month)
+            if archived is None:
+                continue
+            rows_archived, max_id = archived
+            record_archive(db_config, year_month, archive_root, rows_archived, max_id)
+            print(f"📦 {year_month}: {rows_archived} linhas compactadas e arquivadas")
+
+        # status 'archived': o expurgo anterior foi interrompido; o arquivo
+        # já está completo e não é regravado a partir de uma tabela parcial
+        deleted = purge_month(db_config, year_month, max_id, batch_size, pause)
+        total_deleted += deleted
+        print(f"🧹 {year_month}: {deleted} linhas removidas de daily_costs")
+
+    return total_deleted
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Retenção e compactação de daily_costs")
+    parser.add_argument('--retention-months', type=int, default=DEFAULT_RETENTION_MONTHS,
+                        help="Meses mantidos com granularidade diária")
+    parser.add_argument('--archive-root', default=DEFAULT_ARCHIVE_ROOT,
+                        help="Diretório local ou URI s3:// dos arquivos (diferente do EXPORT_ROOT)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_DELETE_BATCH, help="Linhas removidas por lote")
+    parser.add_argument('--pause', type=float, default=DEFAULT_DELETE_PAUSE, help="Segundos entre lotes")
+    parser.add_argument('--dry-run', action='store_true', help="Apenas lista os meses que seriam processados")
+    args = parser.parse_args()
+
+    # O exportador apaga do EXPORT_ROOT as partições que saem do banco
+    if os.environ.get('EXPORT_ROOT') and os.environ['EXPORT_ROOT'].rstrip('/') == args.archive_root.rstrip('/'):
+        parser.error("--archive-root não pode ser o mesmo diretório do EXPORT_ROOT")
+
+    print(f"🗄️ Aplicando retenção de {args.retention_months} meses em daily_costs...")
+    db_config = get_database_credentials()
+    setup_retention_state(db_config)
+
+    total_deleted = apply_retention(
+        db_config, args.retention_months, args.archive_root, args.batch_size, args.pause, args.dry_run
+    )
+    print(f"✅ Retenção concluída ({total_deleted} linhas removidas)")
+
+if __name__ == "__main__":
+    main()
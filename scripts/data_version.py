@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Data Version - Fase 3
+Versão dos dados publicada pelo pipeline: incrementada ao final de cada
+coleta completa, invalida de uma vez o cache de respostas da API
+"""
+
+import pymysql
+
+from analytics_processor import get_database_credentials
+
+VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS pipeline_data_version (
+        id TINYINT UNSIGNED PRIMARY KEY,
+        version BIGINT UNSIGNED NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+"""
+
+def bump_data_version(db_config):
+    """Incrementa a versão dos dados e retorna o novo valor"""
+    conn = pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+    cursor = conn.cursor()
+    cursor.execute(VERSION_TABLE)
+    cursor.execute("""
+        INSERT INTO pipeline_data_version (id, version) VALUES (1, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """)
+    cursor.execute("SELECT version FROM pipeline_data_version WHERE id = 1")
+    version = cursor.fetchone()[0]
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return version
+
+def main():
+    """Função principal"""
+    db_config = get_database_credentials()
+    version = bump_data_version(db_config)
+    print(f"✓ Versão dos dados publicada: {version}")
+
+if __name__ == "__main__":
+    main()
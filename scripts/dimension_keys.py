@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Dimension Keys - Fase 3
+Dimensões com chaves inteiras (cliente, conta, serviço, região, uso) para as
+tabelas fato de custos, cache de chaves em memória e migração das tabelas
+antigas para views de compatibilidade
+"""
+
+import pymysql
+
+# Dimensão -> (tabela, colunas naturais). Serviços usam o catálogo aws_services
+DIMENSIONS = {
+    'client': ('dim_client', ('cliente',)),
+    'account': ('dim_account', ('account_id',)),
+    'service': ('aws_services', ('service_name',)),
+    'region': ('dim_region', ('region',)),
+    'usage': ('dim_usage', ('usage_type', 'operation')),
+}
+
+LOOKUP_CHUNK_SIZE = 500
+
+DIMENSION_TABLES = [
+    """CREATE TABLE IF NOT EXISTS dim_client (
+        id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+        cliente VARCHAR(100) NOT NULL,
+        UNIQUE KEY unique_cliente (cliente)
+    )""",
+    """CREATE TABLE IF NOT EXISTS dim_account (
+        id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+        account_id VARCHAR(20) NOT NULL,
+        UNIQUE KEY unique_account (account_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS dim_region (
+        id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+        region VARCHAR(50) NOT NULL,
+        UNIQUE KEY unique_region (region)
+    )""",
+    """CREATE TABLE IF NOT EXISTS dim_usage (
+        id INT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+        usage_type VARCHAR(200) NOT NULL DEFAULT '',
+        operation VARCHAR(200) NOT NULL DEFAULT '',
+        UNIQUE KEY unique_usage (usage_type, operation)
+    )""",
+]
+
+FACT_TABLES = [
+    """CREATE TABLE IF NOT EXISTS fact_daily_costs (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        client_key SMALLINT UNSIGNED NOT NULL,
+        account_key SMALLINT UNSIGNED NOT NULL,
+        service_key INT NOT NULL,
+        region_key SMALLINT UNSIGNED NOT NULL,
+        usage_key INT UNSIGNED NOT NULL,
+        cost_date DATE NOT NULL,
+        amount DECIMAL(12,4) NOT NULL,
+        currency CHAR(3) DEFAULT 'USD',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_fdc_main (client_key, account_key, cost_date),
+        INDEX idx_fdc_service (service_key, cost_date),
+        INDEX idx_fdc_date (cost_date),
+        INDEX idx_fdc_touched (created_at),
+        UNIQUE KEY unique_daily_cost (client_key, account_key, service_key, region_key, cost_date, usage_key)
+    )""",
+    """CREATE TABLE IF NOT EXISTS fact_monthly_service_costs (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        client_key SMALLINT UNSIGNED NOT NULL,
+        account_key SMALLINT UNSIGNED NOT NULL,
+        service_key INT NOT NULL,
+        region_key SMALLINT UNSIGNED NOT NULL,
+        year_month VARCHAR(7) NOT NULL,
+        total_cost DECIMAL(12,4) NOT NULL,
+        avg_daily_cost DECIMAL(12,4),
+        max_daily_cost DECIMAL(12,4),
+        min_daily_cost DECIMAL(12,4),
+        days_with_usage INT DEFAULT 0,
+        growth_rate DECIMAL(8,4),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_fmsc_main (client_key, account_key, year_month),
+        INDEX idx_fmsc_service (service_key, year_month),
+        INDEX idx_fmsc_month (year_month),
+        INDEX idx_fmsc_growth (growth_rate DESC),
+        INDEX idx_fmsc_touched (created_at),
+        UNIQUE KEY unique_monthly_service (client_key, account_key, service_key, region_key, year_month)
+    )""",
+    """CREATE TABLE IF NOT EXISTS fact_cost_forecasts (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        client_key SMALLINT UNSIGNED NOT NULL,
+        account_key SMALLINT UNSIGNED NOT NULL,
+        service_key INT,
+        forecast_period VARCHAR(20) NOT NULL,
+        forecast_type ENUM('monthly', 'quarterly', 'annual') NOT NULL,
+        predicted_cost DECIMAL(12,4) NOT NULL,
+        confidence_interval_lower DECIMAL(12,4),
+        confidence_interval_upper DECIMAL(12,4),
+        prediction_accuracy DECIMAL(5,2),
+        trend_direction ENUM('increasing', 'decreasing', 'stable') NOT NULL,
+        seasonal_factor DECIMAL(8,4),
+        growth_rate DECIMAL(8,4),
+        model_used VARCHAR(50) DEFAULT 'linear_regression',
+        input_fingerprint CHAR(32),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_fcf_main (client_key, account_key, forecast_period),
+        INDEX idx_fcf_service (service_key, forecast_period),
+        INDEX idx_fcf_period (forecast_period),
+        INDEX idx_fcf_client_period (client_key, forecast_period, predicted_cost DESC),
+        INDEX idx_fcf_touched (created_at),
+        UNIQUE KEY unique_forecast (client_key, account_key, service_key, forecast_period, forecast_type)
+    )""",
+    """CREATE TABLE IF NOT EXISTS fact_cost_trends (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        client_key SMALLINT UNSIGNED NOT NULL,
+        account_key SMALLINT UNSIGNED NOT NULL,
+        service_key INT,
+        trend_type ENUM('increasing', 'decreasing', 'stable', 'volatile') NOT NULL,
+        trend_period VARCHAR(20) NOT NULL,
+        growth_percentage DECIMAL(8,4),
+        confidence_score DECIMAL(5,2),
+        alert_level ENUM('low', 'medium', 'high', 'critical') DEFAULT 'low',
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_fct_main (client_key, account_key, trend_type),
+        INDEX idx_fct_period (trend_period),
+        INDEX idx_fct_alert (alert_level, created_at),
+        UNIQUE KEY unique_trend (client_key, account_key, service_key, trend_period)
+    )""",
+]
+
+# Views com o nome e as colunas das tabelas antigas (leitura)
+COMPATIBILITY_VIEWS = {
+    'daily_costs': """
+        SELECT f.id, c.cliente, a.account_id, s.service_name, r.region, f.cost_date, f.amount,
+               f.currency, NULLIF(u.usage_type, '') as usage_type, NULLIF(u.operation, '') as operation,
+               f.created_at
+        FROM fact_daily_costs f
+        JOIN dim_client c ON c.id = f.client_key
+        JOIN dim_account a ON a.id = f.account_key
+        JOIN aws_services s ON s.id = f.service_key
+        JOIN dim_region r ON r.id = f.region_key
+        JOIN dim_usage u ON u.id = f.usage_key""",
+    'monthly_service_costs': """
+        SELECT f.id, c.cliente, a.account_id, s.service_name, r.region, f.year_month, f.total_cost,
+               f.avg_daily_cost, f.max_daily_cost, f.min_daily_cost, f.days_with_usage, f.growth_rate,
+               f.created_at
+        FROM fact_monthly_service_costs f
+        JOIN dim_client c ON c.id = f.client_key
+        JOIN dim_account a ON a.id = f.account_key
+        JOIN aws_services s ON s.id = f.service_key
+        JOIN dim_region r ON r.id = f.region_key""",
+    'cost_forecasts': """
+        SELECT f.id, c.cliente, a.account_id, s.service_name, f.forecast_period, f.forecast_type,
+               f.predicted_cost, f.confidence_interval_lower, f.confidence_interval_upper,
+               f.prediction_accuracy, f.trend_direction, f.seasonal_factor, f.growth_rate,
+               f.model_used, f.created_at
+        FROM fact_cost_forecasts f
+        JOIN dim_client c ON c.id = f.client_key
+        JOIN dim_account a ON a.id = f.account_key
+        LEFT JOIN aws_services s ON s.id = f.service_key""",
+    'cost_trends': """
+        SELECT f.id, c.cliente, a.account_id, s.service_name, f.trend_type, f.trend_period,
+               f.growth_percentage, f.confidence_score, f.alert_level, f.description, f.created_at
+        FROM fact_cost_trends f
+        JOIN dim_client c ON c.id = f.client_key
+        JOIN dim_account a ON a.id = f.account_key
+        LEFT JOIN aws_services s ON s.id = f.service_key""",
+}
+
+# Cópia das linhas antigas para as tabelas fato (ids preservados; reexecutável)
+LEGACY_MIGRATIONS = {
+    'daily_costs': """
+        INSERT INTO fact_daily_costs
+        (id, client_key, account_key, service_key, region_key, usage_key, cost_date, amount, currency, created_at)
+        SELECT l.id, c.id, a.id, s.id, r.id, u.id, l.cost_date, l.amount, l.currency, l.created_at
+        FROM {source} l
+        JOIN dim_client c ON c.cliente = l.cliente
+        JOIN dim_account a ON a.account_id = l.account_id
+        JOIN aws_services s ON s.service_name = l.service_name
+        JOIN dim_region r ON r.region = COALESCE(l.region, 'global')
+        JOIN dim_usage u ON u.usage_type = COALESCE(l.usage_type, '') AND u.operation = COALESCE(l.operation, '')
+        ORDER BY l.id
+        ON DUPLICATE KEY UPDATE amount = VALUES(amount), created_at = VALUES(created_at)""",
+    'monthly_service_costs': """
+        INSERT INTO fact_monthly_service_costs
+        (id, client_key, account_key, service_key, region_key, year_month, total_cost, avg_daily_cost,
+         max_daily_cost, min_daily_cost, days_with_usage, growth_rate, created_at)
+        SELECT l.id, c.id, a.id, s.id, r.id, l.year_month, l.total_cost, l.avg_daily_cost,
+               l.max_daily_cost, l.min_daily_cost, l.days_with_usage, l.growth_rate, l.created_at
+        FROM {source} l
+        JOIN dim_client c ON c.cliente = l.cliente
+        JOIN dim_account a ON a.account_id = l.account_id
+        JOIN aws_services s ON s.service_name = l.service_name
+        JOIN dim_region r ON r.region = COALESCE(l.region, 'global')
+        ON DUPLICATE KEY UPDATE total_cost = VALUES(total_cost), growth_rate = VALUES(growth_rate)""",
+    'cost_forecasts': """
+        INSERT INTO fact_cost_forecasts
+        (id, client_key, account_key, service_key, forecast_period, forecast_type, predicted_cost,
+         confidence_interval_lower, confidence_interval_upper, prediction_accuracy, trend_direction,
+         seasonal_factor, growth_rate, model_used, created_at)
+        SELECT l.id, c.id, a.id, s.id, l.forecast_period, l.forecast_type, l.predicted_cost,
+               l.confidence_interval_lower, l.confidence_interval_upper, l.prediction_accuracy, l.trend_direction,
+               l.seasonal_factor, l.growth_rate, l.model_used, l.created_at
+        FROM {source} l
+        JOIN dim_client c ON c.cliente = l.cliente
+        JOIN dim_account a ON a.account_id = l.account_id
+        LEFT JOIN aws_services s ON s.service_name = l.service_name
+        ON DUPLICATE KEY UPDATE predicted_cost = VALUES(predicted_cost)""",
+    'cost_trends': """
+        INSERT INTO fact_cost_trends
+        (id, client_key, account_key, service_key, trend_type, trend_period, growth_percentage,
+         confidence_score, alert_level, description, created_at)
+        SELECT l.id, c.id, a.id, s.id, l.trend_type, l.trend_period, l.growth_percentage,
+               l.confidence_score, l.alert_level, l.description, l.created_at
+        FROM {source} l
+        JOIN dim_client c ON c.cliente = l.cliente
+        JOIN dim_account a ON a.account_id = l.account_id
+        LEFT JOIN aws_services s ON s.service_name = l.service_name
+        ON DUPLICATE KEY UPDATE description = VALUES(description)""",
+}
+
+# Valores naturais de cada tabela antiga, para popular as dimensões
+LEGACY_DIMENSION_VALUES = {
+    'daily_costs': [
+        ('client', "SELECT DISTINCT cliente FROM {source}"),
+        ('account', "SELECT DISTINCT account_id FROM {source}"),
+        ('service', "SELECT DISTINCT service_name FROM {source}"),
+        ('region', "SELECT DISTINCT COALESCE(region, 'global') FROM {source}"),
+        ('usage', "SELECT DISTINCT COALESCE(usage_type, ''), COALESCE(operation, '') FROM {source}"),
+    ],
+    'monthly_service_costs': [
+        ('client', "SELECT DISTINCT cliente FROM {source}"),
+        ('account', "SELECT DISTINCT account_id FROM {source}"),
+        ('service', "SELECT DISTINCT service_name FROM {source}"),
+        ('region', "SELECT DISTINCT COALESCE(region, 'global') FROM {source}"),
+    ],
+    'cost_forecasts': [
+        ('client', "SELECT DISTINCT cliente FROM {source}"),
+        ('account', "SELECT DISTINCT account_id FROM {source}"),
+        ('service', "SELECT DISTINCT service_name FROM {source} WHERE service_name IS NOT NULL"),
+    ],
+    'cost_trends': [
+        ('client', "SELECT DISTINCT cliente FROM {source}"),
+        ('account', "SELECT DISTINCT account_id FROM {source}"),
+        ('service', "SELECT DISTINCT service_name FROM {source} WHERE service_name IS NOT NULL"),
+    ],
+}
+
+class DimensionKeyCache:
+    """Cache em memória das chaves das dimensões com get-or-create em lote
+
+    Valores ausentes do cache são buscados em uma consulta por lote; os que
+    não existem no banco são inseridos com INSERT IGNORE (seguro com coletas
+    concorrentes) e relidos. A busca junta os valores pedidos à dimensão, então
+    a chave segue a collation da coluna, como na chave única das tabelas antigas.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.keys = {dimension: {} for dimension in DIMENSIONS}
+
+    def _lookup(self, dimension, values):
+        """Carrega no cache as chaves já existentes para os valores"""
+        table, columns = DIMENSIONS[dimension]
+        cache = self.keys[dimension]
+        for i in range(0, len(values), LOOKUP_CHUNK_SIZE):
+            chunk = values[i:i + LOOKUP_CHUNK_SIZE]
+            requested = ' UNION ALL '.join(
+                'SELECT ' + ', '.join(f"%s as v{n}" for n in range(len(columns)))
+                for _ in chunk
+            )
+            join_on = ' AND '.join(f"d.{column} = requested.v{n}" for n, column in enumerate(columns))
+            selected = ', '.join(f"requested.v{n}" for n in range(len(columns)))
+            self.cursor.execute(
+                f"SELECT {selected}, d.id FROM ({requested}) requested JOIN {table} d ON {join_on}",
+                [part for value in chunk for part in self._as_row(dimension, value)]
+            )
+            for row in self.cursor.fetchall():
+                natural = row[:-1]
+                cache[natural if len(columns) > 1 else natural[0]] = row[-1]
+
+    @staticmethod
+    def _as_row(dimension, value):
+        return value if len(DIMENSIONS[dimension][1]) > 1 else (value,)
+
+    def get_keys(self, dimension, values):
+        """Retorna {valor: chave} para os valores, criando os que faltarem"""
+        table, columns = DIMENSIONS[dimension]
+        cache = self.keys[dimension]
+
+        missing = list({value for value in values if value is not None and value not in cache})
+        if missing:
+            self._lookup(dimension, missing)
+            missing = [value for value in missing if value not in cache]
+        if missing:
+            self.cursor.executemany(
+                f"INSERT IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                [self._as_row(dimension, value) for value in missing]
+            )
+            self._lookup(dimension, missing)
+        return cache
+
+    def key(self, dimension, value):
+        """Chave de um único valor (None permanece None)"""
+        if value is None:
+            return None
+        return self.get_keys(dimension, [value])[value]
+
+def usage_value(usage_type, operation):
+    """Valor natural da dimensão de uso (NULL é gravado como '')"""
+    return (usage_type or '', operation or '')
+
+def get_table_type(cursor, table):
+    """'BASE TABLE', 'VIEW' ou None"""
+    cursor.execute("""
+        SELECT TABLE_TYPE FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def migrate_legacy_table(cursor, table):
+    """Copia uma tabela antiga para a tabela fato e a substitui por uma view
+
+    A cópia é reexecutável (upsert por id), então uma migração interrompida
+    antes do RENAME é refeita por inteiro na próxima execução.
+    """
+    cache = DimensionKeyCache(cursor)
+    for dimension, values_query in LEGACY_DIMENSION_VALUES[table]:
+        cursor.execute(values_query.format(source=table))
+        rows = cursor.fetchall()
+        cache.get_keys(dimension, [row if len(row) > 1 else row[0] for row in rows])
+
+    cursor.execute(LEGACY_MIGRATIONS[table].format(source=table))
+    cursor.execute(f"RENAME TABLE {table} TO {table}_legacy")
+    cursor.execute(f"CREATE VIEW {table} AS {COMPATIBILITY_VIEWS[table]}")
+    print(f"✓ {table} migrada para fact_{table} ({table}_legacy mantida para conferência)")
+
+def setup_dimension_tables(db_config):
+    """Cria dimensões e tabelas fato e migra as tabelas antigas (uma única vez)"""
+    conn = pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+    cursor = conn.cursor()
+
+    for ddl in DIMENSION_TABLES + FACT_TABLES:
+        cursor.execute(ddl)
+
+    # aws_services passa a ser a dimensão de serviço, com chave pelo nome do Cost Explorer
+    cursor.execute("SHOW INDEX FROM aws_services WHERE Key_name = 'unique_service_name'")
+    if not cursor.fetchall():
+        cursor.execute("""
+            ALTER TABLE aws_services
+            MODIFY service_code VARCHAR(50) NULL,
+            ADD UNIQUE KEY unique_service_name (service_name)
+        """)
+
+    # Impressão digital do histórico de entrada (previsão incremental)
+    cursor.execute("SHOW COLUMNS FROM fact_cost_forecasts LIKE 'input_fingerprint'")
+    if not cursor.fetchall():
+        cursor.execute("""
+            ALTER TABLE fact_cost_forecasts
+            ADD COLUMN input_fingerprint CHAR(32) AFTER model_used,
+            ADD INDEX idx_fcf_period (forecast_period)
+        """)
+
+    # Previsões sem serviço (service_name NULL) entram com service_key NULL
+    cursor.execute("SHOW COLUMNS FROM fact_cost_forecasts LIKE 'service_key'")
+    if cursor.fetchone()[2] == 'NO':
+        cursor.execute("ALTER TABLE fact_cost_forecasts MODIFY service_key INT NULL")
+        if get_table_type(cursor, 'cost_forecasts') == 'VIEW':
+            cursor.execute(f"CREATE OR REPLACE VIEW cost_forecasts AS {COMPATIBILITY_VIEWS['cost_forecasts']}")
+
+    # Paginação por keyset de /api/forecasts (cliente, período, custo decrescente, id)
+    cursor.execute("SHOW INDEX FROM fact_cost_forecasts WHERE Key_name = 'idx_fcf_client_period'")
+    if not cursor.fetchall():
+        cursor.execute("""
+            ALTER TABLE fact_cost_forecasts
+            ADD INDEX idx_fcf_client_period (client_key, forecast_period, predicted_cost DESC)
+        """)
+
+    for table in COMPATIBILITY_VIEWS:
+        table_type = get_table_type(cursor, table)
+        if table_type == 'BASE TABLE':
+            migrate_legacy_table(cursor, table)
+            conn.commit()
+        elif table_type is None:
+            cursor.execute(f"CREATE VIEW {table} AS {COMPATIBILITY_VIEWS[table]}")
+
+    conn.commit()
+    cursor.close()
+    conn.close()
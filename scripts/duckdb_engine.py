@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+DuckDB Analytics Engine - Fase 3
+Executa growth, métricas, tendências e entradas de previsão em um DuckDB
+embarcado (a partir do RDS ou dos exports Parquet) e devolve ao MySQL
+apenas as tabelas de resultado, em lote
+"""
+
+import posixpath
+from datetime import datetime
+
+import duckdb
+import pymysql
+
+from analytics_processor import (
+    COST_METRICS_QUERY, GROWTH_TRENDS_QUERY, TOP_COST_TRENDS_QUERY,
+    build_cost_metrics, save_cost_metrics, save_cost_trends
+)
+
+SOURCE_TABLES = ['monthly_service_costs']
+
+WRITEBACK_BATCH_SIZE = 5000
+
+def to_duckdb_sql(query):
+    """Adapta uma query parametrizada do pymysql para o DuckDB"""
+    return query.replace('%s', '?').replace('%%', '%')
+
+def sql_literal(value):
+    """Literal de texto do DuckDB (aspas simples duplicadas)"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+class DuckDBAnalyticsEngine:
+    """Motor analítico em DuckDB com write-back em lote no MySQL"""
+
+    def __init__(self, db_config, source='mysql', parquet_root=None, tables=None):
+        self.db_config = db_config
+        self.con = duckdb.connect()
+        self.load_tables(source, parquet_root, tables or SOURCE_TABLES)
+
+    def load_tables(self, source, parquet_root, tables):
+        """Materializa as tabelas de origem no DuckDB (uma leitura por tabela)"""
+        if source == 'parquet':
+            if parquet_root.startswith('s3://'):
+                self.con.execute("INSTALL httpfs")
+                self.con.execute("LOAD httpfs")
+                self.con.execute("CREATE SECRET (TYPE S3, PROVIDER CREDENTIAL_CHAIN)")
+            for table in tables:
+                pattern = posixpath.join(parquet_root, table, '**', '*.parquet')
+                self.con.execute(f"CREATE TABLE {table} AS SELECT * FROM read_parquet('{pattern}')")
+        else:
+            self.con.execute("INSTALL mysql")
+            self.con.execute("LOAD mysql")
+            # ATTACH e CREATE SECRET não aceitam parâmetros: valores vão como literais
+            self.con.execute(f"""
+                CREATE OR REPLACE SECRET rds_secret (
+                    TYPE mysql,
+                    HOST {sql_literal(self.db_config['host'])},
+                    USER {sql_literal(self.db_config['username'])},
+                    PASSWORD {sql_literal(self.db_config['password'])},
+                    PORT {int(self.db_config['port'])},
+                    DATABASE 'aws_costs'
+                )""")
+            try:
+                self.con.execute("ATTACH '' AS rds (TYPE mysql, SECRET rds_secret, READ_ONLY)")
+                for table in tables:
+                    self.con.execute(f"CREATE TABLE {table} AS SELECT * FROM rds.{table}")
+                self.con.execute("DETACH rds")
+            finally:
+                self.con.execute("DROP SECRET rds_secret")
+
+    def get_mysql_connection(self):
+        """Conexão MySQL usada apenas para o write-back"""
+        return pymysql.connect(
+            host=self.db_config['host'],
+            user=self.db_config['username'],
+            password=self.db_config['password'],
+            database='aws_costs',
+            port=self.db_config['port'],
+            charset='utf8mb4'
+        )
+
+    def calculate_growth_rates(self):
+        """Recalcula todas as taxas com LAG() e grava só as que mudaram"""
+        self.con.execute("""
+            CREATE OR REPLACE TEMP TABLE growth_changes AS
+            SELECT id, new_growth_rate as growth_rate
+            FROM (
+                SELECT *,
+                    CASE
+                        WHEN prev_index = month_index - 1 AND prev_cost > 0 THEN
+                            CAST(LEAST(9999.9999, ROUND((total_cost - prev_cost) / prev_cost * 100, 4)) AS DECIMAL(8,4))
+                        ELSE NULL
+                    END as new_growth_rate
+                FROM (
+                    SELECT *,
+                        LAG(total_cost) OVER w as prev_cost,
+                        LAG(month_index) OVER w as prev_index
+                    FROM (
+                        SELECT *,
+                            CAST(LEFT(year_month, 4) AS INTEGER) * 12 + CAST(SUBSTRING(year_month, 6, 2) AS INTEGER) as month_index
+                        FROM monthly_service_costs
+                    )
+                    WINDOW w AS (PARTITION BY cliente, account_id, service_name, region ORDER BY month_index)
+                )
+            )
+            WHERE new_growth_rate IS DISTINCT FROM growth_rate
+        """)
+        changed = self.con.execute("SELECT id, growth_rate FROM growth_changes").fetchall()
+
+        if changed:
+            conn = self.get_mysql_connection()
+            cursor = conn.cursor()
+            # Carrega as taxas em uma tabela temporária e aplica com um único UPDATE ... JOIN
+            cursor.execute("""
+                CREATE TEMPORARY TABLE growth_writeback (
+                    id BIGINT PRIMARY KEY,
+                    growth_rate DECIMAL(8,4)
+                )""")
+            for i in range(0, len(changed), WRITEBACK_BATCH_SIZE):
+                cursor.executemany(
+                    "INSERT INTO growth_writeback (id, growth_rate) VALUES (%s, %s)",
+                    changed[i:i + WRITEBACK_BATCH_SIZE]
+                )
+            cursor.execute("""
+                UPDATE fact_monthly_service_costs msc
+                JOIN growth_writeback gw ON gw.id = msc.id
+                SET msc.growth_rate = gw.growth_rate
+            """)
+            cursor.execute("DROP TEMPORARY TABLE growth_writeback")
+            conn.commit()
+            cursor.close()
+            conn.close()
+
+        # Mantém a cópia local coerente para as etapas seguintes
+        self.con.execute("""
+            UPDATE monthly_service_costs
+            SET growth_rate = growth_changes.growth_rate
+            FROM growth_changes
+            WHERE monthly_service_costs.id = growth_changes.id
+        """)
+        self.con.execute("DROP TABLE growth_changes")
+
+        print(f"✓ [duckdb] Taxas de crescimento calculadas ({len(changed)} linhas alteradas)")
+        return len(changed)
+
+    def generate_cost_metrics(self, year_month=None):
+        """Calcula as métricas do mês no DuckDB e faz upsert em lote no MySQL"""
+        metric_period = year_month or datetime.now().strftime('%Y-%m')
+        rows = self.con.execute(to_duckdb_sql(COST_METRICS_QUERY), [metric_period]).fetchall()
+        metrics = build_cost_metrics(rows)
+
+        conn = self.get_mysql_connection()
+        cursor = conn.cursor()
+        save_cost_metrics(cursor, metric_period, metrics)
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        print(f"✓ [duckdb] Métricas de custo geradas ({len(metrics)} métricas para {metric_period})")
+        return len(metrics)
+
+    def detect_cost_trends(self, year_month=None):
+        """Detecta tendências do mês no DuckDB e regrava o período no MySQL"""
+        trend_period = year_month or datetime.now().strftime('%Y-%m')
+        trends = []
+        for trends_query in (GROWTH_TRENDS_QUERY, TOP_COST_TRENDS_QUERY):
+            trends.extend(self.con.execute(to_duckdb_sql(trends_query), [trend_period]).fetchall())
+
+        conn = self.get_mysql_connection()
+        cursor = conn.cursor()
+        save_cost_trends(cursor, trend_period, trends)
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        print(f"✓ [duckdb] Tendências e alertas detectados ({len(trends)} registros)")
+        return len(trends)
+
+    def load_forecast_inputs(self, months_back=6):
+        """Histórico mensal por cliente/conta/serviço no formato de get_historical_data"""
+        first_month = self.con.execute(
+            "SELECT strftime(date_trunc('month', current_date) - to_months(?), '%Y-%m')", [months_back]
+        ).fetchone()[0]
+        return self.con.execute("""
+            SELECT
+                cliente,
+                account_id,
+                service_name,
+                year_month,
+                SUM(total_cost) as total_cost,
+                CAST(year_month || '-01' AS DATE) as month_date
+            FROM monthly_service_costs
+            WHERE year_month >= ?
+            GROUP BY cliente, account_id, service_name, year_month
+            ORDER BY cliente, account_id, service_name, year_month
+        """, [first_month]).fetchall()
+
+    def close(self):
+        self.con.close()
+
+def run_analytics(db_config, year_month=None, source='mysql', parquet_root=None):
+    """Executa growth, métricas e tendências no DuckDB"""
+    engine = DuckDBAnalyticsEngine(db_config, source, parquet_root, ['monthly_service_costs'])
+    try:
+        engine.calculate_growth_rates()
+        engine.generate_cost_metrics(year_month)
+        engine.detect_cost_trends(year_month)
+    finally:
+        engine.close()
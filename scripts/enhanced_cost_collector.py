@@ -12,6 +12,9 @@ import calendar
 import os
 from decimal import Decimal
 
+from budget_alerts import BudgetAlertEvaluator, notify_crossings, setup_budget_alert_tables
+from dimension_keys import DimensionKeyCache, setup_dimension_tables, usage_value
+
 def get_database_credentials():
     """Recupera credenciais do banco de dados do AWS Secrets Manager"""
     secret_name = "glpidatabaseadmin"
@@ -181,27 +184,46 @@ def save_daily_costs(cost_data, db_config):
     
     cursor = conn.cursor()
     
+    # Traduz os valores das dimensões para chaves inteiras (get-or-create em lote)
+    cache = DimensionKeyCache(cursor)
+    client_keys = cache.get_keys('client', [record['cliente'] for record in cost_data])
+    account_keys = cache.get_keys('account', [record['account_id'] for record in cost_data])
+    service_keys = cache.get_keys('service', [record['service_name'] for record in cost_data])
+    region_keys = cache.get_keys('region', [record['region'] for record in cost_data])
+    usage_keys = cache.get_keys('usage', [
+        usage_value(record.get('usage_type'), record.get('operation')) for record in cost_data
+    ])
+    
     # Insert ou update dos custos diários
-    for record in cost_data:
-        cursor.execute("""
-            INSERT INTO daily_costs 
-            (cliente, account_id, service_name, region, cost_date, amount)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                amount = VALUES(amount),
-                created_at = CURRENT_TIMESTAMP
-        """, (
-            record['cliente'], 
-            record['account_id'], 
-            record['service_name'],
-            record['region'],
+    cursor.executemany("""
+        INSERT INTO fact_daily_costs 
+        (client_key, account_key, service_key, region_key, usage_key, cost_date, amount)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            amount = VALUES(amount),
+            created_at = CURRENT_TIMESTAMP
+    """, [
+        (
+            client_keys[record['cliente']],
+            account_keys[record['account_id']],
+            service_keys[record['service_name']],
+            region_keys[record['region']],
+            usage_keys[usage_value(record.get('usage_type'), record.get('operation'))],
             record['cost_date'],
             record['amount']
-        ))
+        )
+        for record in cost_data
+    ])
+    
+    # Gasto do mês das contas recém-gravadas contra os limites de budget
+    events = BudgetAlertEvaluator(cursor).evaluate(cost_data, client_keys, account_keys)
     
     conn.commit()
     cursor.close()
     conn.close()
+    
+    # Notifica só depois do commit dos custos e dos cruzamentos
+    notify_crossings(events)
 
 def calculate_monthly_aggregates(db_config, year_month):
     """Calcula agregados mensais por serviço"""
@@ -218,23 +240,24 @@ def calculate_monthly_aggregates(db_config, year_month):
     
     # Calcular agregados mensais
     cursor.execute("""
-        INSERT INTO monthly_service_costs 
-        (cliente, account_id, service_name, region, year_month, total_cost, 
+        INSERT INTO fact_monthly_service_costs 
+        (client_key, account_key, service_key, region_key, year_month, total_cost, 
          avg_daily_cost, max_daily_cost, min_daily_cost, days_with_usage)
         SELECT 
-            cliente,
-            account_id,
-            service_name,
-            region,
+            client_key,
+            account_key,
+            service_key,
+            region_key,
             %s as year_month,
             SUM(amount) as total_cost,
             AVG(amount) as avg_daily_cost,
             MAX(amount) as max_daily_cost,
             MIN(amount) as min_daily_cost,
             COUNT(DISTINCT cost_date) as days_with_usage
-        FROM daily_costs 
-        WHERE DATE_FORMAT(cost_date, '%%Y-%%m') = %s
-        GROUP BY cliente, account_id, service_name, region
+        FROM fact_daily_costs 
+        WHERE cost_date >= STR_TO_DATE(CONCAT(%s, '-01'), '%%Y-%%m-%%d')
+          AND cost_date < STR_TO_DATE(CONCAT(%s, '-01'), '%%Y-%%m-%%d') + INTERVAL 1 MONTH
+        GROUP BY client_key, account_key, service_key, region_key
         ON DUPLICATE KEY UPDATE
             total_cost = VALUES(total_cost),
             avg_daily_cost = VALUES(avg_daily_cost),
@@ -242,7 +265,7 @@ def calculate_monthly_aggregates(db_config, year_month):
             min_daily_cost = VALUES(min_daily_cost),
             days_with_usage = VALUES(days_with_usage),
             created_at = CURRENT_TIMESTAMP
-    """, (year_month, year_month))
+    """, (year_month, year_month, year_month))
     
     conn.commit()
     cursor.close()
@@ -255,6 +278,8 @@ def main():
     # Configurar banco
     db_config = get_database_credentials()
     setup_enhanced_database(db_config)
+    setup_dimension_tables(db_config)
+    setup_budget_alert_tables(db_config)
     
     # Carregar roles
     roles_data = load_roles_from_s3()
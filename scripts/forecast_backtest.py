@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Forecast Backtest - Fase 3
+Backtest com origem móvel de todos os modelos candidatos sobre todas as séries
+de uma vez (NumPy vetorizado): MAPE/WAPE por série, escolha do melhor modelo e
+cache da escolha em forecast_model_selection
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pymysql
+
+from dimension_keys import DimensionKeyCache
+from forecast_batch import MIN_POINTS, PERIODS_AHEAD, as_packed, fit_batch
+from forecast_models import DAMPING_GRID, SMOOTHING_GRID
+
+CANDIDATES = ('linear_regression', 'holt', 'naive')
+DEFAULT_MODEL = 'linear_regression'
+HOLT_BLOCK_SIZE = 2048
+MATERIAL_CHANGE = 0.05
+
+SELECTION_TABLE = """
+    CREATE TABLE IF NOT EXISTS forecast_model_selection (
+        client_key SMALLINT UNSIGNED NOT NULL,
+        account_key SMALLINT UNSIGNED NOT NULL,
+        service_key INT NOT NULL,
+        selected_model VARCHAR(50) NOT NULL,
+        wape DECIMAL(10,4),
+        mape DECIMAL(10,4),
+        n_points INT NOT NULL,
+        history_total DECIMAL(14,4) NOT NULL,
+        evaluated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (client_key, account_key, service_key)
+    )
+"""
+
+def holt_origin_forecasts(costs, origins, horizon):
+    """Previsões do HoltModel em cada origem, para todas as séries
+
+    Percorre o tempo uma única vez com o estado (nível, tendência) de toda a
+    grade α/β/φ; em cada origem escolhe, por série, a combinação com menor erro
+    de um passo até ali (o mesmo critério de HoltModel.forecast).
+    Retorna {origem: previsões[séries, horizon]}.
+    """
+    alpha, beta, phi = np.meshgrid(SMOOTHING_GRID, SMOOTHING_GRID, DAMPING_GRID, indexing='ij')
+    alpha, beta, phi = alpha.ravel(), beta.ravel(), phi.ravel()
+    damped = np.cumsum(phi[:, np.newaxis] ** np.arange(1, horizon + 1)[np.newaxis, :], axis=1)
+
+    results = {origin: np.zeros((costs.shape[0], horizon)) for origin in origins}
+    for start in range(0, costs.shape[0], HOLT_BLOCK_SIZE):
+        block = costs[start:start + HOLT_BLOCK_SIZE]
+        level = np.repeat(block[:, :1], alpha.size, axis=1)
+        trend = np.repeat(block[:, 1:2] - block[:, :1], alpha.size, axis=1)
+        sse = np.zeros_like(level)
+        for t in range(1, max(origins)):
+            fitted = level + phi * trend
+            sse += (block[:, t:t + 1] - fitted) ** 2
+            new_level = alpha * block[:, t:t + 1] + (1 - alpha) * fitted
+            trend = beta * (new_level - level) + (1 - beta) * phi * trend
+            level = new_level
+            if t + 1 in results:
+                best = np.argmin(sse, axis=1)
+                rows = np.arange(len(block))
+                results[t + 1][start:start + len(block)] = (
+                    level[rows, best][:, np.newaxis] + damped[best] * trend[rows, best][:, np.newaxis]
+                )
+    return results
+
+def backtest(costs, mask, horizon=PERIODS_AHEAD, min_train=MIN_POINTS):
+    """Backtest com origem móvel de CANDIDATES sobre séries alinhadas à esquerda
+
+    Em cada origem o (de min_train até o último mês) cada modelo é ajustado com
+    os o primeiros pontos e prevê até horizon meses à frente; os erros contra os
+    meses reais disponíveis são acumulados por série.
+    Retorna {modelo: {'wape', 'mape', 'evaluated'}} com arrays por série.
+    """
+    series, width = costs.shape
+    n = mask.sum(axis=1)
+    origins = list(range(min_train, width))
+    columns = np.arange(width)[np.newaxis, :]
+
+    holt = holt_origin_forecasts(costs, origins, horizon) if origins else {}
+    totals = {model: {'abs_error': np.zeros(series), 'abs_actual': np.zeros(series),
+                      'ape': np.zeros(series), 'ape_count': np.zeros(series)} for model in CANDIDATES}
+
+    for origin in origins:
+        steps = min(horizon, width - origin)
+        actual = costs[:, origin:origin + steps]
+        valid = (origin + np.arange(steps))[np.newaxis, :] < n[:, np.newaxis]
+
+        predictions = {
+            'linear_regression': fit_batch(costs, mask & (columns < origin), steps)['predictions'],
+            'holt': holt[origin][:, :steps],
+            'naive': np.repeat(costs[:, origin - 1:origin], steps, axis=1),
+        }
+        positive = valid & (actual > 0)
+        for model, predicted in predictions.items():
+            error = np.abs(predicted - actual)
+            total = totals[model]
+            total['abs_error'] += np.where(valid, error, 0).sum(axis=1)
+            total['abs_actual'] += np.where(valid, np.abs(actual), 0).sum(axis=1)
+            total['ape'] += np.divide(error, actual, out=np.zeros_like(error), where=positive).sum(axis=1)
+            total['ape_count'] += positive.sum(axis=1)
+
+    metrics = {}
+    for model, total in totals.items():
+        metrics[model] = {
+            'wape': np.divide(total['abs_error'], total['abs_actual'],
+                              out=np.where(total['abs_error'] > 0, np.inf, 0.0), where=total['abs_actual'] > 0),
+            'mape': np.divide(total['ape'], total['ape_count'],
+                              out=np.full(series, np.nan), where=total['ape_count'] > 0),
+            'evaluated': n > min_train,
+        }
+    return metrics
+
+def select_best(metrics):
+    """Modelo de menor WAPE por série (empate ou sem backtest: DEFAULT_MODEL)"""
+    wape = np.vstack([metrics[model]['wape'] for model in CANDIDATES])
+    mape = np.vstack([metrics[model]['mape'] for model in CANDIDATES])
+    best = np.argmin(wape, axis=0)
+    evaluated = metrics[DEFAULT_MODEL]['evaluated']
+    best = np.where(evaluated, best, CANDIDATES.index(DEFAULT_MODEL))
+    rows = np.arange(wape.shape[1])
+    return best, np.where(evaluated, wape[best, rows], np.nan), np.where(evaluated, mape[best, rows], np.nan)
+
+def get_connection(db_config):
+    """Cria conexão com o banco aws_costs"""
+    return pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+
+def get_cached_selection(cursor):
+    """Seleções gravadas: {(cliente, conta, serviço): (modelo, wape, mape, pontos, total)}"""
+    cursor.execute("""
+        SELECT c.cliente, a.account_id, s.service_name,
+               m.selected_model, m.wape, m.mape, m.n_points, m.history_total
+        FROM forecast_model_selection m
+        JOIN dim_client c ON c.id = m.client_key
+        JOIN dim_account a ON a.id = m.account_key
+        JOIN aws_services s ON s.id = m.service_key
+    """)
+    return {tuple(row[:3]): row[3:] for row in cursor.fetchall()}
+
+def is_material_change(cached, n_points, history_total):
+    """Um mês novo ou variação do custo total acima de MATERIAL_CHANGE"""
+    if cached is None or cached[3] != n_points:
+        return True
+    cached_total = float(cached[4])
+    return abs(history_total - cached_total) > MATERIAL_CHANGE * max(abs(cached_total), 1e-9)
+
+def select_models(db_config, historical_data, force=False):
+    """Escolhe o modelo de cada série, reavaliando só as que mudaram
+
+    Retorna {(cliente, conta, serviço): (modelo, wape, mape)}.
+    """
+    keys, costs, mask = as_packed(historical_data)
+    if not keys:
+        return {}
+    n = mask.sum(axis=1)
+    history_total = costs.sum(axis=1)
+
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+    cursor.execute(SELECTION_TABLE)
+    cached = {} if force else get_cached_selection(cursor)
+
+    stale = np.array([is_material_change(cached.get(key), int(n[row]), float(history_total[row]))
+                      for row, key in enumerate(keys)], dtype=bool)
+    selection = {key: cached[key][:3] for row, key in enumerate(keys) if not stale[row]}
+
+    rows = np.flatnonzero(stale)
+    if len(rows):
+        width = int(n[rows].max())
+        metrics = backtest(costs[rows, :width], mask[rows, :width])
+        best, wape, mape = select_best(metrics)
+
+        records = []
+        for i, row in enumerate(rows):
+            record = (CANDIDATES[best[i]],
+                      None if np.isnan(wape[i]) or np.isinf(wape[i]) else float(wape[i]),
+                      None if np.isnan(mape[i]) else float(mape[i]))
+            selection[keys[row]] = record
+            records.append((keys[row], record, int(n[row]), float(history_total[row])))
+
+        key_cache = DimensionKeyCache(cursor)
+        client_keys = key_cache.get_keys('client', [key[0] for key, *_ in records])
+        account_keys = key_cache.get_keys('account', [key[1] for key, *_ in records])
+        service_keys = key_cache.get_keys('service', [key[2] for key, *_ in records])
+        cursor.executemany("""
+            INSERT INTO forecast_model_selection
+            (client_key, account_key, service_key, selected_model, wape, mape, n_points, history_total)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                selected_model = VALUES(selected_model),
+                wape = VALUES(wape),
+                mape = VALUES(mape),
+                n_points = VALUES(n_points),
+                history_total = VALUES(history_total)
+        """, [
+            (client_keys[key[0]], account_keys[key[1]], service_keys[key[2]],
+             model, wape_value, mape_value, n_points, total)
+            for key, (model, wape_value, mape_value), n_points, total in records
+        ])
+        conn.commit()
+
+    cursor.close()
+    conn.close()
+
+    counts = {}
+    for model, _, _ in selection.values():
+        counts[model] = counts.get(model, 0) + 1
+    print(f"✓ Seleção de modelos: {len(rows)} séries reavaliadas, {len(keys) - len(rows)} do cache "
+          f"({', '.join(f'{model}: {count}' for model, count in sorted(counts.items()))})")
+    return selection
+
+def synthetic_series(series_count, months, seed=42):
+    """Séries mensais sintéticas (tendência, sazonalidade, ruído e séries curtas)"""
+    rng = np.random.default_rng(seed)
+    x = np.arange(months)[np.newaxis, :]
+    base = rng.uniform(10, 5000, (series_count, 1))
+    slope = rng.normal(0, 0.03, (series_count, 1)) * base
+    season = np.sin(2 * np.pi * x / 12) * rng.uniform(0, 0.2, (series_count, 1)) * base
+    costs = np.maximum(0, base + slope * x + season + rng.normal(0, 0.05, (series_count, months)) * base)
+    lengths = rng.integers(MIN_POINTS, months + 1, series_count)
+    mask = x < lengths[:, np.newaxis]
+    return np.where(mask, costs, 0), mask
+
+def run_benchmark(sizes, months):
+    """Mede o backtest vetorizado para quantidades crescentes de séries"""
+    for series_count in sizes:
+        costs, mask = synthetic_series(series_count, months)
+        started = time.perf_counter()
+        metrics = backtest(costs, mask)
+        best, wape, _ = select_best(metrics)
+        elapsed = time.perf_counter() - started
+        shares = np.bincount(best, minlength=len(CANDIDATES)) / series_count * 100
+        print(f"  {series_count:>7} séries × {months} meses: {elapsed:.2f}s "
+              f"({series_count / elapsed:,.0f} séries/s, WAPE mediano {np.nanmedian(wape[np.isfinite(wape)]):.3f}) "
+              f"{', '.join(f'{model} {share:.0f}%' for model, share in zip(CANDIDATES, shares))}")
+
+def main():
+    """Reavalia a seleção de modelos ou executa o benchmark"""
+    parser = argparse.ArgumentParser(description="Backtest e seleção de modelos de previsão")
+    parser.add_argument('--months-back', type=int, default=12)
+    parser.add_argument('--force', action='store_true', help="Ignora o cache e reavalia todas as séries")
+    parser.add_argument('--benchmark', type=int, nargs='*', metavar='SERIES',
+                        help="Benchmark com séries sintéticas (padrão: 1000 10000 50000)")
+    parser.add_argument('--benchmark-months', type=int, default=12)
+    args = parser.parse_args()
+
+    if args.benchmark is not None:
+        print("⏱️ Benchmark do backtest vetorizado")
+        run_benchmark(args.benchmark or [1000, 10000, 50000], args.benchmark_months)
+        return
+
+    from cost_forecasting import get_database_credentials, load_history_arrays
+
+    db_config = get_database_credentials()
+    history = load_history_arrays(db_config, args.months_back)
+    print(f"🧪 Backtest de {len(CANDIDATES)} modelos ({len(history.keys)} séries)")
+    select_models(db_config, history, args.force)
+
+if __name__ == "__main__":
+    main()
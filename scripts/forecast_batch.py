@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Forecast Batch - Fase 3
+Regressão linear de todas as séries (cliente × conta × serviço) de uma vez:
+as séries são empacotadas em matrizes 2-D com máscara e ajustadas por mínimos
+quadrados em forma fechada, sem laço Python por série
+"""
+
+import argparse
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+MIN_POINTS = 3
+PERIODS_AHEAD = 3
+
+def forecast_periods(periods_ahead=PERIODS_AHEAD):
+    """Períodos YYYY-MM previstos a partir de hoje (passos de 30 dias)"""
+    current_date = datetime.now()
+    return [(current_date + timedelta(days=30 * (i + 1))).strftime('%Y-%m') for i in range(periods_ahead)]
+
+class HistoryArrays(namedtuple('HistoryArrays', 'keys months costs mask')):
+    """Histórico alinhado por mês: costs/mask[séries, meses], months em ordem"""
+
+    def subset(self, selected):
+        """Somente as séries selecionadas (máscara booleana ou índices)"""
+        rows = np.flatnonzero(selected) if np.asarray(selected).dtype == bool else np.asarray(selected, dtype=int)
+        return HistoryArrays([self.keys[row] for row in rows], self.months, self.costs[rows], self.mask[rows])
+
+    def rows(self):
+        """Linhas no formato de get_historical_data (para o modelo por série)"""
+        for row, column in zip(*np.nonzero(self.mask)):
+            cliente, account_id, service_name = self.keys[row]
+            month = self.months[column]
+            yield (cliente, account_id, service_name, month, float(self.costs[row, column]),
+                   datetime.strptime(month, '%Y-%m'))
+
+def history_from_rows(historical_data):
+    """HistoryArrays a partir das linhas de get_historical_data (meses repetidos são somados)"""
+    index, months = {}, {}
+    rows, columns, amounts = [], [], []
+    for cliente, account_id, service_name, year_month, total_cost, _ in historical_data:
+        rows.append(index.setdefault((cliente, account_id, service_name), len(index)))
+        columns.append(year_month)
+        amounts.append(float(total_cost))
+        months[year_month] = None
+
+    months = sorted(months)
+    column_index = {month: column for column, month in enumerate(months)}
+    columns = np.array([column_index[month] for month in columns], dtype=int)
+    rows = np.array(rows, dtype=int)
+    costs = np.zeros((len(index), len(months)))
+    mask = np.zeros((len(index), len(months)), dtype=bool)
+    np.add.at(costs, (rows, columns), amounts)
+    mask[rows, columns] = True
+    return HistoryArrays(list(index), months, costs, mask)
+
+def left_align(costs, mask):
+    """Desloca os pontos de cada série para a esquerda, em ordem de mês (como pack_series)"""
+    order = np.argsort(~mask, axis=1, kind='stable')
+    return np.where(np.take_along_axis(mask, order, axis=1), np.take_along_axis(costs, order, axis=1), 0), \
+        np.take_along_axis(mask, order, axis=1)
+
+def as_packed(history):
+    """(chaves, custos, máscara) alinhados à esquerda de HistoryArrays ou de linhas"""
+    if isinstance(history, HistoryArrays):
+        return (history.keys,) + left_align(history.costs, history.mask)
+    return pack_series(history)
+
+def pack_series(historical_data):
+    """Empacota o histórico em (chaves, custos[séries, meses], máscara)
+
+    Os pontos de cada série ficam alinhados à esquerda, em ordem de mês, e as
+    posições vazias à direita são zeradas e marcadas como False na máscara.
+    Linhas repetidas no mesmo mês (regiões) são somadas.
+    """
+    series = {}
+    for cliente, account_id, service_name, year_month, total_cost, _ in historical_data:
+        months = series.setdefault((cliente, account_id, service_name), {})
+        months[year_month] = months.get(year_month, 0.0) + float(total_cost)
+
+    keys = list(series)
+    width = max((len(months) for months in series.values()), default=0)
+    costs = np.zeros((len(keys), width))
+    mask = np.zeros((len(keys), width), dtype=bool)
+    for row, key in enumerate(keys):
+        values = [series[key][month] for month in sorted(series[key])]
+        costs[row, :len(values)] = values
+        mask[row, :len(values)] = True
+    return keys, costs, mask
+
+def fit_batch(costs, mask, periods_ahead=PERIODS_AHEAD):
+    """Ajusta y = a + b·x para cada linha com x = 0..n-1 (forma fechada)
+
+    Retorna arrays por série: n, slope, intercept, r2, residual_std, std
+    (desvio padrão populacional dos custos) e predictions[séries, periods_ahead].
+    """
+    weights = mask.astype(float)
+    x = np.arange(costs.shape[1], dtype=float)[np.newaxis, :]
+    y = costs * weights
+
+    n = weights.sum(axis=1)
+    safe_n = np.maximum(n, 1)
+    sum_x = (weights * x).sum(axis=1)
+    sum_y = y.sum(axis=1)
+    sum_xx = (weights * x * x).sum(axis=1)
+    sum_xy = (y * x).sum(axis=1)
+
+    denominator = n * sum_xx - sum_x ** 2
+    slope = np.divide(n * sum_xy - sum_x * sum_y, denominator,
+                      out=np.zeros_like(denominator), where=denominator != 0)
+    intercept = (sum_y - slope * sum_x) / safe_n
+
+    fitted = intercept[:, np.newaxis] + slope[:, np.newaxis] * x
+    mean = sum_y / safe_n
+    ss_res = (weights * (costs - fitted) ** 2).sum(axis=1)
+    ss_tot = (weights * (costs - mean[:, np.newaxis]) ** 2).sum(axis=1)
+
+    # Mesma convenção do score() do sklearn quando a série é constante
+    r2 = np.where(ss_tot > 0, 1 - np.divide(ss_res, ss_tot, out=np.zeros_like(ss_res), where=ss_tot > 0),
+                  np.where(ss_res > 0, 0.0, 1.0))
+
+    future_x = n[:, np.newaxis] + np.arange(periods_ahead)[np.newaxis, :]
+    predictions = intercept[:, np.newaxis] + slope[:, np.newaxis] * future_x
+
+    return {
+        'n': n.astype(int),
+        'slope': slope,
+        'intercept': intercept,
+        'r2': r2,
+        'residual_std': np.sqrt(ss_res / np.maximum(n - 2, 1)),
+        'std': np.sqrt(ss_tot / safe_n),
+        'predictions': predictions,
+    }
+
+def generate_forecasts_batch(historical_data, periods_ahead=PERIODS_AHEAD):
+    """Mesmo resultado de cost_forecasting.generate_forecasts, em um único ajuste"""
+    keys, costs, mask = as_packed(historical_data)
+    if not keys:
+        return []
+
+    fit = fit_batch(costs, mask, periods_ahead)
+    n = fit['n']
+    eligible = n >= MIN_POINTS
+
+    confidence = np.clip(fit['r2'], 0.1, 0.95)
+    trend = np.where(fit['slope'] > 0.1, 'increasing', np.where(fit['slope'] < -0.1, 'decreasing', 'stable'))
+
+    first_cost = costs[:, 0]
+    last_cost = costs[np.arange(len(keys)), np.maximum(n - 1, 0)]
+    growth_rate = np.divide((last_cost - first_cost) * 100, first_cost,
+                            out=np.zeros_like(first_cost), where=first_cost > 0)
+
+    # Intervalo de 95% com o desvio dos custos observados (como no modelo por série)
+    interval = fit['std'] * 1.96
+    predictions = fit['predictions']
+    lower = np.maximum(0, predictions - interval[:, np.newaxis])
+    upper = predictions + interval[:, np.newaxis]
+
+    periods = forecast_periods(periods_ahead)
+
+    forecasts = []
+    for row in np.flatnonzero(eligible):
+        cliente, account_id, service_name = keys[row]
+        for i, forecast_period in enumerate(periods):
+            forecasts.append({
+                'cliente': cliente,
+                'account_id': account_id,
+                'service_name': service_name,
+                'forecast_period': forecast_period,
+                'forecast_type': 'monthly',
+                'predicted_cost': max(0, float(predictions[row, i])),
+                'confidence_interval_lower': float(lower[row, i]),
+                'confidence_interval_upper': float(upper[row, i]),
+                'prediction_accuracy': float(confidence[row]) * 100,
+                'trend_direction': str(trend[row]),
+                'growth_rate': float(growth_rate[row])
+            })
+    return forecasts
+
+def compare_engines(historical_data):
+    """Executa o modelo por série e o em lote e compara tempo e resultados"""
+    from cost_forecasting import generate_forecasts_loop
+
+    started = time.perf_counter()
+    loop_forecasts = generate_forecasts_loop(historical_data)
+    loop_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch_forecasts = generate_forecasts_batch(historical_data)
+    batch_seconds = time.perf_counter() - started
+
+    def index(forecasts):
+        return {(f['cliente'], f['account_id'], f['service_name'], f['forecast_period']): f for f in forecasts}
+
+    loop_index, batch_index = index(loop_forecasts), index(batch_forecasts)
+    max_diff = 0.0
+    for key, expected in loop_index.items():
+        actual = batch_index.get(key)
+        if actual is None or actual['trend_direction'] != expected['trend_direction']:
+            max_diff = float('inf')
+            break
+        for field in ('predicted_cost', 'confidence_interval_lower', 'confidence_interval_upper',
+                      'prediction_accuracy', 'growth_rate'):
+            max_diff = max(max_diff, abs(float(actual[field]) - float(expected[field])))
+
+    print(f"  por série: {loop_seconds:.3f}s ({len(loop_forecasts)} previsões)")
+    print(f"  em lote:   {batch_seconds:.3f}s ({len(batch_forecasts)} previsões)")
+    print(f"  speedup:   {loop_seconds / max(batch_seconds, 1e-9):.1f}x, maior diferença: {max_diff:.6f}")
+    return max_diff
+
+def main():
+    """Compara o modelo em lote com o modelo por série sobre o histórico do banco"""
+    parser = argparse.ArgumentParser(description="Compara previsão em lote vs por série")
+    parser.add_argument('--months-back', type=int, default=6)
+    args = parser.parse_args()
+
+    from cost_forecasting import get_database_credentials, get_historical_data
+
+    db_config = get_database_credentials()
+    historical_data = get_historical_data(db_config, args.months_back)
+    print(f"⏱️ Comparando engines de previsão ({len(historical_data)} linhas de histórico)")
+    compare_engines(historical_data)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Forecast Daily - Fase 3
+Previsão em resolução diária a partir de fact_daily_costs: tendência linear mais
+efeito do dia da semana, ajustados de forma vetorizada para todas as séries.
+Gera o fechamento do mês corrente e os próximos meses já nas primeiras semanas
+de histórico de um serviço ou cliente novo
+"""
+
+import argparse
+import pymysql
+from datetime import date, timedelta
+
+import numpy as np
+
+from forecast_batch import PERIODS_AHEAD, fit_batch
+
+MIN_DAYS = 7
+MIN_DAYS_WEEKDAY = 14
+DEFAULT_DAYS_BACK = 120
+BACKFIT_ITERATIONS = 2
+MODEL_NAME = 'daily_weekday'
+
+def get_daily_history(db_config, days_back=DEFAULT_DAYS_BACK, start_date=None):
+    """Custo diário por cliente/conta/serviço dos últimos days_back dias (ou desde start_date)"""
+    conn = pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+    cursor = conn.cursor()
+
+    # Agrega regiões e tipos de uso pelas chaves antes de resolver os nomes
+    cursor.execute("""
+        SELECT c.cliente, a.account_id, s.service_name, f.cost_date, f.amount
+        FROM (
+            SELECT client_key, account_key, service_key, cost_date, SUM(amount) as amount
+            FROM fact_daily_costs
+            WHERE cost_date >= COALESCE(%s, CURDATE() - INTERVAL %s DAY)
+            GROUP BY client_key, account_key, service_key, cost_date
+        ) f
+        JOIN dim_client c ON c.id = f.client_key
+        JOIN dim_account a ON a.id = f.account_key
+        JOIN aws_services s ON s.id = f.service_key
+    """, (start_date, days_back))
+
+    results = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return results
+
+def pack_daily(daily_rows):
+    """Empacota o histórico diário em matrizes densas alinhadas à esquerda
+
+    Cada série começa na coluna 0 no seu primeiro dia com custo e vai até o
+    último dia coletado (comum a todas); dias sem linha valem zero.
+    Retorna (chaves, custos[séries, dias], máscara, dia da semana, último dia).
+    """
+    index = {}
+    rows, dates, amounts = [], [], []
+    for cliente, account_id, service_name, cost_date, amount in daily_rows:
+        rows.append(index.setdefault((cliente, account_id, service_name), len(index)))
+        dates.append(cost_date.toordinal())
+        amounts.append(float(amount))
+
+    keys = list(index)
+    if not keys:
+        return keys, np.zeros((0, 0)), np.zeros((0, 0), dtype=bool), np.zeros((0, 0), dtype=int), None
+
+    rows, dates = np.array(rows), np.array(dates)
+    end_ordinal = dates.max()
+    starts = np.full(len(keys), end_ordinal)
+    np.minimum.at(starts, rows, dates)
+
+    spans = end_ordinal - starts + 1
+    width = int(spans.max())
+    costs = np.zeros((len(keys), width))
+    np.add.at(costs, (rows, dates - starts[rows]), amounts)
+
+    columns = np.arange(width)[np.newaxis, :]
+    mask = columns < spans[:, np.newaxis]
+    # date.weekday() do dia ordinal o é (o + 6) % 7
+    weekdays = (starts[:, np.newaxis] + 6 + columns) % 7
+    return keys, costs, mask, weekdays, int(end_ordinal)
+
+def fit_weekday(costs, mask, weekdays, horizon):
+    """Ajusta y = a + b·t + s[dia da semana] por série (backfitting vetorizado)
+
+    O efeito semanal só é estimado com pelo menos MIN_DAYS_WEEKDAY dias.
+    Retorna slope, r2, residual_std e predictions[séries, horizon] (>= 0).
+    """
+    series, width = costs.shape
+    n = mask.sum(axis=1)
+    rows = np.arange(series)[:, np.newaxis]
+    x = np.arange(width)[np.newaxis, :]
+    use_weekday = (n >= MIN_DAYS_WEEKDAY)[:, np.newaxis]
+
+    effects = np.zeros((series, 7))
+    for _ in range(BACKFIT_ITERATIONS):
+        fit = fit_batch(costs - effects[rows, weekdays], mask, horizon)
+        residual = np.where(mask, costs - (fit['intercept'][:, np.newaxis] + fit['slope'][:, np.newaxis] * x), 0)
+        for weekday in range(7):
+            selected = mask & (weekdays == weekday)
+            count = selected.sum(axis=1)
+            effects[:, weekday] = np.divide((residual * selected).sum(axis=1), count,
+                                            out=np.zeros(series), where=count > 0)
+        effects -= effects.mean(axis=1, keepdims=True)
+        effects = np.where(use_weekday, effects, 0)
+
+    fit = fit_batch(costs - effects[rows, weekdays], mask, horizon)
+    fitted = fit['intercept'][:, np.newaxis] + fit['slope'][:, np.newaxis] * x + effects[rows, weekdays]
+    ss_res = (np.where(mask, costs - fitted, 0) ** 2).sum(axis=1)
+    mean = (costs * mask).sum(axis=1) / np.maximum(n, 1)
+    ss_tot = (np.where(mask, costs - mean[:, np.newaxis], 0) ** 2).sum(axis=1)
+    r2 = np.where(ss_tot > 0, 1 - np.divide(ss_res, ss_tot, out=np.zeros(series), where=ss_tot > 0),
+                  np.where(ss_res > 0, 0.0, 1.0))
+
+    future_weekdays = (weekdays[:, :1] + n[:, np.newaxis] + np.arange(horizon)[np.newaxis, :]) % 7
+    predictions = np.maximum(0, fit['predictions'] + effects[rows, future_weekdays])
+
+    return {
+        'slope': fit['slope'],
+        'r2': r2,
+        'residual_std': np.sqrt(ss_res / np.maximum(n - 2, 1)),
+        'predictions': predictions,
+    }
+
+def next_month(day):
+    """Primeiro dia do mês seguinte"""
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def generate_daily_forecasts(daily_rows, covered=None, periods_ahead=PERIODS_AHEAD):
+    """Fechamento do mês corrente para todas as séries e próximos meses
+
+    O fechamento soma o custo já observado no mês à previsão dos dias restantes.
+    Os próximos periods_ahead meses só são gerados para séries fora de covered
+    (chaves que já têm previsão mensal).
+    """
+    covered = covered or set()
+    keys, costs, mask, weekdays, end_ordinal = pack_daily(daily_rows)
+    if not keys:
+        return []
+
+    end_date = date.fromordinal(end_ordinal)
+    month_start = (end_date + timedelta(days=1)).replace(day=1)
+    month_bounds = [month_start]
+    for _ in range(periods_ahead + 1):
+        month_bounds.append(next_month(month_bounds[-1]))
+
+    # Colunas futuras: dia seguinte ao último coletado até o fim do último mês
+    offsets = [max((bound - end_date).days - 1, 0) for bound in month_bounds]
+    horizon = offsets[-1]
+
+    n = mask.sum(axis=1)
+    eligible = n >= MIN_DAYS
+    fit = fit_weekday(costs, mask, weekdays, horizon)
+    predictions = fit['predictions']
+
+    # Custo já observado no mês do fechamento (zero se o mês ainda não começou)
+    observed_days = (end_date - month_start).days + 1
+    cumulative = np.concatenate([np.zeros((len(keys), 1)), np.cumsum(costs, axis=1)], axis=1)
+    rows = np.arange(len(keys))
+    month_to_date = cumulative[rows, n] - cumulative[rows, np.maximum(n - max(observed_days, 0), 0)]
+
+    confidence = np.clip(fit['r2'], 0.1, 0.95)
+    monthly_slope = fit['slope'] * 30
+    trend = np.where(monthly_slope > 0.1, 'increasing', np.where(monthly_slope < -0.1, 'decreasing', 'stable'))
+
+    week = min(MIN_DAYS, costs.shape[1])
+    first_week = costs[:, :week].mean(axis=1)
+    last_week = (cumulative[rows, n] - cumulative[rows, np.maximum(n - week, 0)]) / week
+    growth_rate = np.divide((last_week - first_week) * 100, first_week,
+                            out=np.zeros_like(first_week), where=first_week > 0)
+
+    forecasts = []
+    for row in np.flatnonzero(eligible):
+        cliente, account_id, service_name = keys[row]
+        months = 1 if keys[row] in covered else periods_ahead + 1
+        for i in range(months):
+            days = predictions[row, offsets[i]:offsets[i + 1]]
+            prediction = float(days.sum()) + (float(month_to_date[row]) if i == 0 else 0.0)
+            interval = 1.96 * float(fit['residual_std'][row]) * np.sqrt(len(days))
+            forecasts.append({
+                'cliente': cliente,
+                'account_id': account_id,
+                'service_name': service_name,
+                'forecast_period': month_bounds[i].strftime('%Y-%m'),
+                'forecast_type': 'monthly',
+                'predicted_cost': prediction,
+                'confidence_interval_lower': max(0, prediction - interval),
+                'confidence_interval_upper': prediction + interval,
+                'prediction_accuracy': float(confidence[row]) * 100,
+                'trend_direction': str(trend[row]),
+                'growth_rate': float(growth_rate[row]),
+                'model_used': MODEL_NAME
+            })
+
+    print(f"✓ Previsão diária: {int(eligible.sum())} séries até {end_date}, "
+          f"{int(sum(1 for row in np.flatnonzero(eligible) if keys[row] not in covered))} sem previsão mensal")
+    return forecasts
+
+def main():
+    """Mostra o fechamento previsto do mês por cliente a partir do histórico diário"""
+    parser = argparse.ArgumentParser(description="Previsão diária com sazonalidade semanal")
+    parser.add_argument('--days-back', type=int, default=DEFAULT_DAYS_BACK)
+    args = parser.parse_args()
+
+    from cost_forecasting import get_database_credentials
+
+    db_config = get_database_credentials()
+    forecasts = generate_daily_forecasts(get_daily_history(db_config, args.days_back))
+
+    totals = {}
+    for forecast in forecasts:
+        key = (forecast['cliente'], forecast['forecast_period'])
+        totals[key] = totals.get(key, 0.0) + forecast['predicted_cost']
+    for (cliente, forecast_period), total in sorted(totals.items()):
+        print(f"  {cliente} {forecast_period}: ${total:,.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Forecast Models - Fase 3
+Interface de modelos de previsão por série e execução em pool de processos:
+as séries são enviadas em lotes, cada série tem um orçamento de tempo e,
+em caso de erro, tempo esgotado ou histórico curto, cai no modelo linear
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from forecast_batch import PERIODS_AHEAD, MIN_POINTS, as_packed, fit_batch, forecast_periods
+
+DEFAULT_CHUNK_SIZE = 256
+DEFAULT_TIME_BUDGET = 0.5
+
+SMOOTHING_GRID = np.linspace(0.1, 0.9, 9)
+DAMPING_GRID = np.array([0.9, 0.95, 0.98, 1.0])
+
+class ForecastTimeout(Exception):
+    """Orçamento de tempo da série esgotado"""
+
+class ForecastModel:
+    """Interface dos modelos: forecast(costs, periods_ahead, deadline)
+
+    Retorna (predictions, half_interval, accuracy, slope); half_interval é a
+    metade do intervalo de 95% e slope define a direção da tendência.
+    Modelos devem chamar check_deadline() dentro de laços longos.
+    """
+
+    name = 'base'
+    min_points = MIN_POINTS
+
+    def forecast(self, costs, periods_ahead, deadline):
+        raise NotImplementedError
+
+    @staticmethod
+    def check_deadline(deadline):
+        if time.perf_counter() > deadline:
+            raise ForecastTimeout()
+
+class LinearModel(ForecastModel):
+    """Regressão linear em forma fechada (mesmo resultado do engine em lote)"""
+
+    name = 'linear_regression'
+
+    def forecast(self, costs, periods_ahead, deadline):
+        fit = fit_batch(costs[np.newaxis, :], np.ones((1, len(costs)), dtype=bool), periods_ahead)
+        return (fit['predictions'][0], fit['std'][0] * 1.96,
+                float(np.clip(fit['r2'][0], 0.1, 0.95)), fit['slope'][0])
+
+class HoltModel(ForecastModel):
+    """Suavização exponencial com tendência amortecida (ETS A,Ad,N)
+
+    alpha, beta e phi são escolhidos por busca em grade minimizando o erro
+    de um passo; a grade inteira é avaliada em paralelo (vetorizada).
+    """
+
+    name = 'holt'
+    min_points = 4
+
+    def smooth(self, costs, deadline):
+        alpha, beta, phi = np.meshgrid(SMOOTHING_GRID, SMOOTHING_GRID, DAMPING_GRID, indexing='ij')
+        alpha, beta, phi = alpha.ravel(), beta.ravel(), phi.ravel()
+
+        level = np.full(alpha.shape, costs[0])
+        trend = np.full(alpha.shape, costs[1] - costs[0])
+        errors = np.zeros((len(costs) - 1, alpha.size))
+        for t in range(1, len(costs)):
+            self.check_deadline(deadline)
+            fitted = level + phi * trend
+            errors[t - 1] = costs[t] - fitted
+            new_level = alpha * costs[t] + (1 - alpha) * fitted
+            trend = beta * (new_level - level) + (1 - beta) * phi * trend
+            level = new_level
+
+        sse = (errors ** 2).sum(axis=0)
+        best = int(np.argmin(sse))
+        return level[best], trend[best], phi[best], errors[:, best]
+
+    def forecast(self, costs, periods_ahead, deadline):
+        level, trend, phi, errors = self.smooth(costs, deadline)
+        steps = np.arange(1, periods_ahead + 1)
+        damped = np.cumsum(phi ** steps)
+        predictions = level + damped * trend
+
+        residual_std = np.sqrt((errors ** 2).mean())
+        ss_tot = ((costs[1:] - costs[1:].mean()) ** 2).sum()
+        r2 = 1 - (errors ** 2).sum() / ss_tot if ss_tot > 0 else 1.0
+        # Intervalo cresce com o horizonte
+        return predictions, residual_std * 1.96 * np.sqrt(steps), float(np.clip(r2, 0.1, 0.95)), trend
+
+class HoltWintersModel(HoltModel):
+    """Holt-Winters aditivo com sazonalidade anual (exige 2 ciclos completos)"""
+
+    name = 'holt_winters'
+    season_length = 12
+    min_points = 24
+
+    def forecast(self, costs, periods_ahead, deadline):
+        m = self.season_length
+        seasonal = costs[:m] - costs[:m].mean()
+        deseasonalized = costs - np.resize(seasonal, len(costs))
+        level, trend, phi, errors = self.smooth(deseasonalized, deadline)
+
+        # Reestima os índices sazonais sobre os resíduos do ajuste
+        season_index = np.arange(len(costs)) % m
+        fitted = deseasonalized[1:] - errors
+        detrended = costs[1:] - fitted
+        seasonal = np.array([detrended[season_index[1:] == k].mean() for k in range(m)])
+        seasonal -= seasonal.mean()
+
+        steps = np.arange(1, periods_ahead + 1)
+        future_season = (len(costs) - 1 + steps) % m
+        predictions = level + np.cumsum(phi ** steps) * trend + seasonal[future_season]
+
+        residuals = detrended - seasonal[season_index[1:]]
+        residual_std = np.sqrt((residuals ** 2).mean())
+        ss_tot = ((costs[1:] - costs[1:].mean()) ** 2).sum()
+        r2 = 1 - (residuals ** 2).sum() / ss_tot if ss_tot > 0 else 1.0
+        return predictions, residual_std * 1.96 * np.sqrt(steps), float(np.clip(r2, 0.1, 0.95)), trend
+
+class NaiveModel(ForecastModel):
+    """Repete o último mês (referência para séries sem tendência estável)"""
+
+    name = 'naive'
+
+    def forecast(self, costs, periods_ahead, deadline):
+        steps = np.arange(1, periods_ahead + 1)
+        errors = np.diff(costs)
+        ss_tot = ((costs[1:] - costs[1:].mean()) ** 2).sum()
+        r2 = 1 - (errors ** 2).sum() / ss_tot if ss_tot > 0 else 1.0
+        residual_std = np.sqrt((errors ** 2).mean())
+        return (np.full(periods_ahead, costs[-1]), residual_std * 1.96 * np.sqrt(steps),
+                float(np.clip(r2, 0.1, 0.95)), errors.mean())
+
+MODELS = {model.name: model for model in (LinearModel, HoltModel, HoltWintersModel, NaiveModel)}
+
+def register_model(model_class):
+    """Registra um modelo adicional (ex.: sazonal por dia da semana)"""
+    MODELS[model_class.name] = model_class
+    return model_class
+
+def forecast_chunk(model_name, chunk, periods_ahead, time_budget):
+    """Executa o modelo sobre um lote de séries (roda no processo do pool)
+
+    chunk: lista de (índice, custos). Retorna (índice, modelo usado,
+    previsões, meio intervalo, acurácia, inclinação) por série.
+    """
+    model = MODELS[model_name]()
+    fallback = LinearModel()
+    results = []
+    for index, costs in chunk:
+        model_used = model
+        try:
+            if len(costs) < model.min_points:
+                raise ForecastTimeout()
+            output = model.forecast(costs, periods_ahead, time.perf_counter() + time_budget)
+            if not np.all(np.isfinite(output[0])):
+                raise ValueError("previsão não finita")
+        except Exception:
+            model_used = fallback
+            output = fallback.forecast(costs, periods_ahead, float('inf'))
+        predictions, half_interval, accuracy, slope = output
+        results.append((index, model_used.name, np.asarray(predictions, dtype=float),
+                        np.broadcast_to(np.asarray(half_interval, dtype=float), (periods_ahead,)),
+                        accuracy, float(slope)))
+    return results
+
+def generate_forecasts_parallel(historical_data, model_name='holt', workers=None,
+                                chunk_size=DEFAULT_CHUNK_SIZE, time_budget=DEFAULT_TIME_BUDGET,
+                                periods_ahead=PERIODS_AHEAD):
+    """Gera previsões com um modelo por série distribuído em processos
+
+    As séries seguem em lotes de chunk_size para diluir o custo de pickle;
+    workers=1 executa no próprio processo.
+    """
+    keys, costs, mask = as_packed(historical_data)
+    lengths = mask.sum(axis=1)
+    series = [(row, costs[row, :lengths[row]]) for row in range(len(keys)) if lengths[row] >= MIN_POINTS]
+    chunks = [series[i:i + chunk_size] for i in range(0, len(series), chunk_size)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) <= 1:
+        chunk_results = [forecast_chunk(model_name, chunk, periods_ahead, time_budget) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_results = list(executor.map(
+                forecast_chunk,
+                [model_name] * len(chunks), chunks,
+                [periods_ahead] * len(chunks), [time_budget] * len(chunks)
+            ))
+
+    periods = forecast_periods(periods_ahead)
+
+    forecasts = []
+    fallbacks = 0
+    for results in chunk_results:
+        for row, model_used, predictions, half_interval, accuracy, slope in results:
+            cliente, account_id, service_name = keys[row]
+            observed = costs[row, :lengths[row]]
+            growth_rate = (observed[-1] - observed[0]) / observed[0] * 100 if observed[0] > 0 else 0
+            trend = 'increasing' if slope > 0.1 else 'decreasing' if slope < -0.1 else 'stable'
+            fallbacks += model_used != model_name
+            for i, forecast_period in enumerate(periods):
+                prediction = float(predictions[i])
+                forecasts.append({
+                    'cliente': cliente,
+                    'account_id': account_id,
+                    'service_name': service_name,
+                    'forecast_period': forecast_period,
+                    'forecast_type': 'monthly',
+                    'predicted_cost': max(0, prediction),
+                    'confidence_interval_lower': max(0, prediction - half_interval[i]),
+                    'confidence_interval_upper': prediction + half_interval[i],
+                    'prediction_accuracy': accuracy * 100,
+                    'trend_direction': trend,
+                    'growth_rate': float(growth_rate),
+                    'model_used': model_used
+                })
+
+    print(f"✓ Modelo {model_name}: {len(series)} séries em {len(chunks)} lotes, "
+          f"{workers} processos, {fallbacks} com fallback linear")
+    return forecasts
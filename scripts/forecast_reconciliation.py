@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Forecast Reconciliation - Fase 3
+Reconciliação hierárquica das previsões (serviço → conta → cliente): monta a
+matriz de soma esparsa S e aplica OLS, WLS estrutural ou MinT diagonal em forma
+fechada (O(séries)) para todas as séries e períodos, gravando previsões
+coerentes em todos os níveis
+"""
+
+import argparse
+
+import numpy as np
+import pymysql
+from scipy import sparse
+
+from dimension_keys import DimensionKeyCache
+from forecast_batch import MIN_POINTS, HistoryArrays, fit_batch, forecast_periods, history_from_rows, left_align
+
+METHODS = ('ols', 'wls_struct', 'mint_diag')
+DEFAULT_METHOD = 'mint_diag'
+
+RECONCILED_TABLE = """
+    CREATE TABLE IF NOT EXISTS cost_forecasts_reconciled (
+        level ENUM('client', 'account', 'service') NOT NULL,
+        client_key SMALLINT UNSIGNED NOT NULL,
+        account_key SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+        service_key INT NOT NULL DEFAULT 0,
+        forecast_period VARCHAR(20) NOT NULL,
+        base_forecast DECIMAL(14,4),
+        reconciled_forecast DECIMAL(14,4) NOT NULL,
+        method VARCHAR(20) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (forecast_period, level, client_key, account_key, service_key),
+        INDEX idx_cfr_client (client_key, forecast_period)
+    )
+"""
+
+def build_hierarchy(bottom_keys):
+    """Nós (clientes, contas, séries) e matriz de soma S[nós, séries] esparsa
+
+    Cada nó é (nível, cliente, conta, serviço), com '' nos níveis acima dele.
+    """
+    clients, accounts = {}, {}
+    rows, columns = [], []
+    for column, (cliente, account_id, _) in enumerate(bottom_keys):
+        rows.append(clients.setdefault(cliente, len(clients)))
+        columns.append(column)
+        rows.append(accounts.setdefault((cliente, account_id), len(accounts)))
+        columns.append(column)
+
+    # Linhas: clientes, depois contas, depois as séries de base
+    rows = np.array(rows)
+    rows[1::2] += len(clients)
+    bottom_rows = len(clients) + len(accounts) + np.arange(len(bottom_keys))
+    rows = np.concatenate([rows, bottom_rows])
+    columns = np.concatenate([columns, np.arange(len(bottom_keys))])
+
+    nodes = ([('client', cliente, '', '') for cliente in clients]
+             + [('account', cliente, account_id, '') for cliente, account_id in accounts]
+             + [('service',) + tuple(key) for key in bottom_keys])
+    summing = sparse.csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(len(nodes), len(bottom_keys)))
+    return nodes, summing
+
+def reconcile(summing, clients, base, method=DEFAULT_METHOD, variances=None):
+    """Previsões coerentes S·(S'W⁻¹S)⁻¹·S'W⁻¹·ŷ para todas as colunas de base
+
+    ols: W = I; wls_struct: W = diag(séries sob cada nó);
+    mint_diag: W = diag(variância dos resíduos de cada nó).
+
+    S vem de build_hierarchy (clients linhas de cliente, depois contas e séries).
+    Em cada cliente, S'W⁻¹S é a diagonal das séries mais um termo de posto 1 por
+    conta e um pelo cliente: Sherman-Morrison aninhado resolve o sistema em
+    O(séries), sem montar nem fatorar a matriz densa de cada cliente.
+    """
+    if method == 'ols':
+        weights = np.ones(summing.shape[0])
+    elif method == 'wls_struct':
+        weights = 1.0 / np.asarray(summing.sum(axis=1)).ravel()
+    else:
+        floor = max(np.median(variances[variances > 0]) * 1e-3, 1e-6) if np.any(variances > 0) else 1.0
+        weights = 1.0 / np.maximum(variances, floor)
+
+    series = summing.shape[1]
+    client_rows, account_rows = summing[:clients], summing[clients:-series]
+    client_weights, account_weights, series_weights = weights[:clients], weights[clients:-series], weights[-series:]
+    inverse_series = 1.0 / series_weights
+
+    def solve_accounts(values):
+        """(D + Σ w_conta·1·1')⁻¹ · values, conta a conta"""
+        scaled = inverse_series[:, np.newaxis] * values
+        gain = account_weights / (1.0 + account_weights * (account_rows @ inverse_series))
+        return scaled - inverse_series[:, np.newaxis] * (account_rows.T @ (gain[:, np.newaxis] * (account_rows @ scaled)))
+
+    rhs = summing.T @ (weights[:, np.newaxis] * base.reshape(summing.shape[0], -1))
+    partial = solve_accounts(rhs)
+    ones = solve_accounts(np.ones((series, 1)))
+    gain = client_weights / (1.0 + client_weights * (client_rows @ ones).ravel())
+    bottom = partial - ones * (client_rows.T @ (gain[:, np.newaxis] * (client_rows @ partial)))
+    return summing @ bottom
+
+def base_forecasts_for_nodes(nodes, summing, bottom_base, history, periods):
+    """Matriz ŷ[nós, períodos] e variância dos resíduos por nó
+
+    Séries de base usam as previsões gravadas; contas e clientes recebem um
+    ajuste linear próprio do histórico agregado por S (soma das bases quando o
+    histórico tem menos de MIN_POINTS meses).
+    """
+    if not isinstance(history, HistoryArrays):
+        history = history_from_rows(history)
+
+    # Histórico das séries de base na ordem das colunas de S (zero sem histórico)
+    bottom_keys = [node[1:] for node in nodes if node[0] == 'service']
+    history_rows = {key: row for row, key in enumerate(history.keys)}
+    bottom_costs = np.zeros((len(bottom_keys), len(history.months)))
+    bottom_mask = np.zeros((len(bottom_keys), len(history.months)), dtype=bool)
+    for column, key in enumerate(bottom_keys):
+        row = history_rows.get(key)
+        if row is not None:
+            bottom_costs[column] = history.costs[row]
+            bottom_mask[column] = history.mask[row]
+
+    node_costs = summing @ bottom_costs
+    node_mask = (summing @ bottom_mask.astype(float)) > 0
+    fit = fit_batch(*left_align(node_costs, node_mask), len(periods))
+
+    variances = fit['residual_std'] ** 2
+    base = np.where((fit['n'] >= MIN_POINTS)[:, np.newaxis], np.maximum(0, fit['predictions']), np.nan)
+    levels = np.array([node[0] for node in nodes])
+    base[levels == 'service'] = [[bottom_base[key][period] for period in periods] for key in bottom_keys]
+
+    # Nós agregados sem ajuste próprio: soma das previsões de base (bottom-up)
+    missing = np.isnan(base).any(axis=1)
+    if missing.any():
+        base[missing] = (summing @ base[-summing.shape[1]:])[missing]
+    return base, variances
+
+def get_connection(db_config):
+    """Cria conexão com o banco aws_costs"""
+    return pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+
+def load_bottom_forecasts(cursor, periods):
+    """Previsões mensais gravadas por série, só das séries com todos os períodos"""
+    cursor.execute(f"""
+        SELECT c.cliente, a.account_id, s.service_name, f.forecast_period, f.predicted_cost
+        FROM fact_cost_forecasts f
+        JOIN dim_client c ON c.id = f.client_key
+        JOIN dim_account a ON a.id = f.account_key
+        JOIN aws_services s ON s.id = f.service_key
+        WHERE f.forecast_type = 'monthly'
+        AND f.forecast_period IN ({', '.join(['%s'] * len(periods))})
+    """, periods)
+
+    forecasts = {}
+    for cliente, account_id, service_name, forecast_period, predicted_cost in cursor.fetchall():
+        forecasts.setdefault((cliente, account_id, service_name), {})[forecast_period] = float(predicted_cost)
+    return {key: values for key, values in forecasts.items() if len(values) == len(periods)}
+
+def save_reconciled(cursor, nodes, periods, base, reconciled, method):
+    """Regrava os períodos reconciliados (0 nas chaves acima do nível do nó)"""
+    cursor.execute(f"DELETE FROM cost_forecasts_reconciled WHERE forecast_period IN ({', '.join(['%s'] * len(periods))})",
+                   periods)
+
+    key_cache = DimensionKeyCache(cursor)
+    client_keys = key_cache.get_keys('client', [node[1] for node in nodes])
+    account_keys = key_cache.get_keys('account', [node[2] for node in nodes if node[2]])
+    service_keys = key_cache.get_keys('service', [node[3] for node in nodes if node[3]])
+
+    cursor.executemany("""
+        INSERT INTO cost_forecasts_reconciled
+        (level, client_key, account_key, service_key, forecast_period, base_forecast, reconciled_forecast, method)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, [
+        (level, client_keys[cliente], account_keys[account_id] if account_id else 0,
+         service_keys[service_name] if service_name else 0, forecast_period,
+         float(base[row, column]), float(reconciled[row, column]), method)
+        for row, (level, cliente, account_id, service_name) in enumerate(nodes)
+        for column, forecast_period in enumerate(periods)
+    ])
+
+def reconcile_forecasts(db_config, historical_data, method=DEFAULT_METHOD):
+    """Reconcilia as previsões gravadas dos próximos períodos e grava todos os níveis"""
+    periods = forecast_periods()
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+    cursor.execute(RECONCILED_TABLE)
+
+    bottom_base = load_bottom_forecasts(cursor, periods)
+    if not bottom_base:
+        print("⚠️ Nenhuma previsão para reconciliar")
+        cursor.close()
+        conn.close()
+        return
+
+    nodes, summing = build_hierarchy(list(bottom_base))
+    base, variances = base_forecasts_for_nodes(nodes, summing, bottom_base, historical_data, periods)
+    clients = sum(1 for node in nodes if node[0] == 'client')
+    reconciled = reconcile(summing, clients, base, method, variances)
+
+    save_reconciled(cursor, nodes, periods, base, reconciled, method)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    print(f"✓ Reconciliação {method}: {summing.shape[1]} séries, {len(nodes)} nós "
+          f"({clients} clientes), {len(periods)} períodos")
+
+def main():
+    """Reconcilia as previsões já gravadas"""
+    parser = argparse.ArgumentParser(description="Reconciliação hierárquica das previsões")
+    parser.add_argument('--method', choices=METHODS, default=DEFAULT_METHOD)
+    parser.add_argument('--months-back', type=int, default=6)
+    args = parser.parse_args()
+
+    from cost_forecasting import get_database_credentials, load_history_arrays
+
+    db_config = get_database_credentials()
+    reconcile_forecasts(db_config, load_history_arrays(db_config, args.months_back), args.method)
+
+if __name__ == "__main__":
+    main()
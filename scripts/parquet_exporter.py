@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Parquet Exporter - Fase 3
+Exporta as tabelas de custo para Parquet particionado por mês e cliente,
+reescrevendo apenas as partições que mudaram desde a última exportação
+"""
+
+import argparse
+import json
+import os
+import posixpath
+from urllib.parse import quote
+
+import pymysql
+import pymysql.cursors
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+from analytics_processor import get_database_credentials, shift_month
+from snapshot_refresher import month_bounds
+
+DEFAULT_EXPORT_ROOT = os.environ.get('EXPORT_ROOT', './warehouse_export')
+DEFAULT_BATCH_SIZE = 50000
+
+MONEY = pa.decimal128(12, 4)
+
+# Para cada tabela: schema Parquet, expressão do mês da partição,
+# predicado (sargável) que seleciona as linhas de um mês e a tabela física
+# cujo created_at (renovado a cada upsert, índice touched_index) marca os
+# meses alterados desde a última exportação; dependent_months estende cada mês
+# alterado aos seguintes cujos valores derivam dele
+EXPORT_TABLES = {
+    'daily_costs': {
+        'schema': pa.schema([
+            ('id', pa.int64()),
+            ('cliente', pa.string()),
+            ('account_id', pa.string()),
+            ('service_name', pa.string()),
+            ('region', pa.string()),
+            ('cost_date', pa.date32()),
+            ('amount', MONEY),
+            ('currency', pa.string()),
+            ('usage_type', pa.string()),
+            ('operation', pa.string()),
+            ('created_at', pa.timestamp('s')),
+        ]),
+        'month_expr': "DATE_FORMAT(cost_date, '%Y-%m')",
+        'month_filter': "cost_date BETWEEN %s AND %s",
+        'month_is_range': True,
+        'source': 'fact_daily_costs',
+        'touched_index': 'idx_fdc_touched',
+        'dependent_months': 0,
+    },
+    'monthly_service_costs': {
+        'schema': pa.schema([
+            ('id', pa.int64()),
+            ('cliente', pa.string()),
+            ('account_id', pa.string()),
+            ('service_name', pa.string()),
+            ('region', pa.string()),
+            ('year_month', pa.string()),
+            ('total_cost', MONEY),
+            ('avg_daily_cost', MONEY),
+            ('max_daily_cost', MONEY),
+            ('min_daily_cost', MONEY),
+            ('days_with_usage', pa.int32()),
+            ('growth_rate', pa.decimal128(8, 4)),
+            ('created_at', pa.timestamp('s')),
+        ]),
+        'month_expr': "year_month",
+        'month_filter': "year_month = %s",
+        'month_is_range': False,
+        'source': 'fact_monthly_service_costs',
+        'touched_index': 'idx_fmsc_touched',
+        # growth_rate do mês seguinte é recalculado sem renovar created_at
+        'dependent_months': 1,
+    },
+    'cost_forecasts': {
+        'schema': pa.schema([
+            ('id', pa.int64()),
+            ('cliente', pa.string()),
+            ('account_id', pa.string()),
+            ('service_name', pa.string()),
+            ('forecast_period', pa.string()),
+            ('forecast_type', pa.string()),
+            ('predicted_cost', MONEY),
+            ('confidence_interval_lower', MONEY),
+            ('confidence_interval_upper', MONEY),
+            ('prediction_accuracy', pa.decimal128(5, 2)),
+            ('trend_direction', pa.string()),
+            ('seasonal_factor', pa.decimal128(8, 4)),
+            ('growth_rate', pa.decimal128(8, 4)),
+            ('model_used', pa.string()),
+            ('created_at', pa.timestamp('s')),
+        ]),
+        'month_expr': "forecast_period",
+        'month_filter': "forecast_period = %s",
+        'month_is_range': False,
+        'source': 'fact_cost_forecasts',
+        'touched_index': 'idx_fcf_touched',
+        'dependent_months': 0,
+    },
+    'budget_alerts': {
+        'schema': pa.schema([
+            ('id', pa.int64()),
+            ('cliente', pa.string()),
+            ('account_id', pa.string()),
+            ('budget_name', pa.string()),
+            ('budget_limit', pa.decimal128(10, 2)),
+            ('actual_spend', pa.decimal128(10, 2)),
+            ('forecasted_spend', pa.decimal128(10, 2)),
+            ('percentage_used', pa.decimal128(5, 2)),
+            ('alert_threshold', pa.decimal128(5, 2)),
+            ('alert_triggered', pa.bool_()),
+            ('time_period', pa.string()),
+            ('data_coleta', pa.date32()),
+            ('created_at', pa.timestamp('s')),
+        ]),
+        'month_expr': "DATE_FORMAT(data_coleta, '%Y-%m')",
+        'month_filter': "data_coleta BETWEEN %s AND %s",
+        'month_is_range': True,
+        'source': 'budget_alerts',
+        'touched_index': 'idx_ba_touched',
+        'dependent_months': 0,
+    },
+}
+
+def get_connection(db_config, streaming=False):
+    """Cria conexão; streaming=True usa cursor server-side (SSCursor)"""
+    return pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.SSCursor if streaming else pymysql.cursors.Cursor
+    )
+
+def get_filesystem(root):
+    """Resolve o filesystem do pyarrow (local ou s3://) e o caminho base"""
+    if '://' in root:
+        return pafs.FileSystem.from_uri(root)
+    return pafs.LocalFileSystem(), os.path.abspath(root)
+
+def partition_path(table, month, cliente):
+    """Caminho relativo da partição (layout hive: month=/client=)"""
+    client_value = '__null__' if cliente is None else quote(cliente, safe='')
+    return posixpath.join(table, f"month={month}", f"client={client_value}")
+
+def to_arrow_column(values, field):
+    """Converte uma coluna do MySQL para array Arrow (BOOLEAN chega como 0/1)"""
+    if pa.types.is_boolean(field.type):
+        values = [None if value is None else bool(value) for value in values]
+    return pa.array(values, type=field.type)
+
+def query_month_expr(spec):
+    """Expressão do mês para consultas com parâmetros (% do DATE_FORMAT escapado)"""
+    return spec['month_expr'].replace('%', '%%')
+
+def setup_touched_index(cursor, table):
+    """Cria o índice de created_at da tabela física (uma única vez)"""
+    spec = EXPORT_TABLES[table]
+    cursor.execute(f"SHOW INDEX FROM {spec['source']} WHERE Key_name = %s", (spec['touched_index'],))
+    if not cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {spec['source']} ADD INDEX {spec['touched_index']} (created_at)")
+
+def get_touched_months(cursor, table, watermark):
+    """Meses com linhas gravadas desde a marca e o maior created_at lido
+
+    Lê só a tabela física pelo índice de created_at; >= relê o último segundo
+    (linhas gravadas nele depois da exportação anterior).
+    """
+    spec = EXPORT_TABLES[table]
+    cursor.execute(f"""
+        SELECT {query_month_expr(spec)} as partition_month, MAX(created_at)
+        FROM {spec['source']}
+        WHERE created_at >= %s
+        GROUP BY partition_month
+    """, (watermark,))
+    rows = [(month, touched_at) for month, touched_at in cursor.fetchall() if month is not None]
+    months = {month for month, _ in rows}
+    months |= {shift_month(month, offset) for month in months for offset in range(1, spec['dependent_months'] + 1)}
+    return sorted(months), max((touched_at for _, touched_at in rows), default=None)
+
+def get_partition_fingerprints(cursor, table, months=None):
+    """Calcula a assinatura (linhas + checksum) de cada partição mês × cliente
+
+    Com months, só as partições desses meses (predicado de mês sobre o índice
+    de data da tabela fato). Retorna também o maior created_at lido.
+    """
+    spec = EXPORT_TABLES[table]
+    columns = ', '.join(spec['schema'].names)
+    where, params = '', []
+    if months is not None:
+        if not months:
+            return {}, None
+        where = 'WHERE ' + ' OR '.join([f"({spec['month_filter']})"] * len(months))
+        for month in months:
+            params.extend(month_bounds(month) if spec['month_is_range'] else (month,))
+    cursor.execute(f"""
+        SELECT
+            {query_month_expr(spec)} as partition_month,
+            cliente,
+            COUNT(*),
+            COALESCE(SUM(CRC32(CONCAT_WS('|', {columns}))), 0),
+            MAX(created_at)
+        FROM {table}
+        {where}
+        GROUP BY partition_month, cliente
+    """, params)
+    fingerprints, watermark = {}, None
+    for month, cliente, row_count, checksum, touched_at in cursor.fetchall():
+        if month is None:
+            continue
+        fingerprints[(month, cliente)] = [int(row_count), int(checksum)]
+        if touched_at is not None and (watermark is None or touched_at > watermark):
+            watermark = touched_at
+    return fingerprints, watermark
+
+def load_manifest(filesystem, root, table):
+    """Lê o manifesto da última exportação da tabela: (marca de created_at, assinaturas)"""
+    path = posixpath.join(root, table, '_manifest.json')
+    try:
+        with filesystem.open_input_stream(path) as stream:
+            manifest = json.loads(stream.read().decode('utf-8'))
+    except (FileNotFoundError, OSError):
+        return None, {}
+    # Manifestos antigos eram só a lista de partições (sem marca: recálculo completo)
+    if isinstance(manifest, list):
+        manifest = {'watermark': None, 'partitions': manifest}
+    fingerprints = {(entry['month'], entry['cliente']): entry['fingerprint'] for entry in manifest['partitions']}
+    return manifest['watermark'], fingerprints
+
+def save_manifest(filesystem, root, table, watermark, fingerprints):
+    """Grava o manifesto com a marca de created_at e a assinatura de cada partição exportada"""
+    entries = [
+        {'month': month, 'cliente': cliente, 'fingerprint': fingerprint}
+        for (month, cliente), fingerprint in sorted(fingerprints.items(), key=lambda item: (item[0][0], item[0][1] or ''))
+    ]
+    manifest = {'watermark': None if watermark is None else str(watermark), 'partitions': entries}
+    with filesystem.open_output_stream(posixpath.join(root, table, '_manifest.json')) as stream:
+        stream.write(json.dumps(manifest, indent=1).encode('utf-8'))
+
+def export_partition(db_config, filesystem, root, table, month, cliente, batch_size):
+    """Transmite uma partição do MySQL para Parquet em row groups de batch_size linhas"""
+    spec = EXPORT_TABLES[table]
+    schema = spec['schema']
+    month_params = month_bounds(month) if spec['month_is_range'] else (month,)
+
+    directory = posixpath.join(root, partition_path(table, month, cliente))
+    filesystem.create_dir(directory, recursive=True)
+    final_path = posixpath.join(directory, 'part-0.parquet')
+    temp_path = final_path + '.tmp'
+
+    conn = get_connection(db_config, streaming=True)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT {', '.join(schema.names)}
+        FROM {table}
+        WHERE cliente <=> %s AND {spec['month_filter']}
+    """, (cliente, *month_params))
+
+    rows_written = 0
+    with filesystem.open_output_stream(temp_path) as sink:
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            batch = pa.Table.from_arrays(
+                [to_arrow_column(values, field) for values, field in zip(columns, schema)],
+                schema=schema
+            )
+            writer.write_table(batch)
+            rows_written += len(rows)
+        writer.close()
+
+    cursor.close()
+    conn.close()
+
+    filesystem.move(temp_path, final_path)
+    return rows_written
+
+def export_table(db_config, root, table, batch_size=DEFAULT_BATCH_SIZE, full=False):
+    """Exporta as partições alteradas de uma tabela e remove as que sumiram
+
+    Incremental: só os meses com created_at acima da marca do manifesto têm a
+    assinatura recalculada. full recalcula todas as partições (pega também
+    linhas apagadas, que não renovam created_at) e reescreve todas.
+    """
+    filesystem, root_path = get_filesystem(root)
+    watermark, exported = load_manifest(filesystem, root_path, table)
+
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+    setup_touched_index(cursor, table)
+    if full or watermark is None:
+        current, watermark = get_partition_fingerprints(cursor, table)
+    else:
+        months, touched_at = get_touched_months(cursor, table, watermark)
+        fresh, _ = get_partition_fingerprints(cursor, table, months)
+        current = {key: fingerprint for key, fingerprint in exported.items() if key[0] not in months}
+        current.update(fresh)
+        watermark = touched_at or watermark
+    cursor.close()
+    conn.close()
+
+    changed = [key for key, fingerprint in current.items() if full or exported.get(key) != fingerprint]
+    removed = [key for key in exported if key not in current]
+
+    total_rows = 0
+    for month, cliente in sorted(changed, key=lambda key: (key[0], key[1] or '')):
+        total_rows += export_partition(db_config, filesystem, root_path, table, month, cliente, batch_size)
+
+    for month, cliente in removed:
+        try:
+            filesystem.delete_dir(posixpath.join(root_path, partition_path(table, month, cliente)))
+        except FileNotFoundError:
+            pass
+
+    filesystem.create_dir(posixpath.join(root_path, table), recursive=True)
+    save_manifest(filesystem, root_path, table, watermark, current)
+    print(f"✓ {table}: {len(changed)} partições reescritas ({total_rows} linhas), "
+          f"{len(current) - len(changed)} inalteradas, {len(removed)} removidas")
+    return len(changed)
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Exporta o warehouse de custos para Parquet")
+    parser.add_argument('--root', default=DEFAULT_EXPORT_ROOT, help="Diretório local ou URI s3:// de destino")
+    parser.add_argument('--tables', nargs='*', default=list(EXPORT_TABLES), choices=list(EXPORT_TABLES))
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--full', action='store_true', help="Recalcula a assinatura de todas as partições e reescreve todas")
+    args = parser.parse_args()
+
+    print(f"📦 Exportando warehouse para {args.root}...")
+    db_config = get_database_credentials()
+
+    for table in args.tables:
+        export_table(db_config, args.root, table, args.batch_size, args.full)
+
+    print("✅ Exportação Parquet concluída!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Rollup Cube - Fase 3
+Mantém tabelas pré-agregadas (cliente×dia, cliente×mês, cliente×serviço×mês e
+serviço×mês) recalculando apenas os dias e meses tocados pela última coleta
+"""
+
+import argparse
+import pymysql
+from datetime import datetime, timedelta
+
+from analytics_processor import get_database_credentials, shift_month
+
+ROLLUP_TABLES = [
+    """CREATE TABLE IF NOT EXISTS rollup_client_day (
+        client_key SMALLINT UNSIGNED NOT NULL,
+        cost_date DATE NOT NULL,
+        total_cost DECIMAL(14,4) NOT NULL,
+        services_count INT NOT NULL,
+        PRIMARY KEY (client_key, cost_date),
+        INDEX idx_rcd_date (cost_date)
+    )""",
+    """CREATE TABLE IF NOT EXISTS rollup_client_month (
+        client_key SMALLINT UNSIGNED NOT NULL,
+        year_month VARCHAR(7) NOT NULL,
+        total_cost DECIMAL(14,4) NOT NULL,
+        services_count INT NOT NULL,
+        accounts_count INT NOT NULL,
+        PRIMARY KEY (client_key, year_month),
+        INDEX idx_rcm_month (year_month)
+    )""",
+    """CREATE TABLE IF NOT EXISTS rollup_client_service_month (
+        client_key SMALLINT UNSIGNED NOT NULL,
+        service_key INT NOT NULL,
+        year_month VARCHAR(7) NOT NULL,
+        total_cost DECIMAL(14,4) NOT NULL,
+        accounts_count INT NOT NULL,
+        avg_growth_rate DECIMAL(8,4),
+        PRIMARY KEY (client_key, year_month, service_key),
+        INDEX idx_rcsm_month (year_month)
+    )""",
+    """CREATE TABLE IF NOT EXISTS rollup_service_month (
+        service_key INT NOT NULL,
+        year_month VARCHAR(7) NOT NULL,
+        total_cost DECIMAL(14,4) NOT NULL,
+        clients_count INT NOT NULL,
+        PRIMARY KEY (year_month, service_key)
+    )""",
+]
+
+# Cada rollup é recalculado a partir do fato de origem, período a período
+# (contagens distintas não são aditivas entre rollups)
+DAY_ROLLUP = """
+    INSERT INTO rollup_client_day (client_key, cost_date, total_cost, services_count)
+    SELECT client_key, cost_date, SUM(amount), COUNT(DISTINCT service_key)
+    FROM fact_daily_costs
+    WHERE cost_date BETWEEN %s AND %s
+    GROUP BY client_key, cost_date
+"""
+
+MONTH_ROLLUPS = {
+    'rollup_client_month': """
+        INSERT INTO rollup_client_month (client_key, year_month, total_cost, services_count, accounts_count)
+        SELECT client_key, year_month, SUM(total_cost), COUNT(DISTINCT service_key), COUNT(DISTINCT account_key)
+        FROM fact_monthly_service_costs
+        WHERE year_month IN ({months})
+        GROUP BY client_key, year_month
+    """,
+    'rollup_client_service_month': """
+        INSERT INTO rollup_client_service_month
+        (client_key, service_key, year_month, total_cost, accounts_count, avg_growth_rate)
+        SELECT client_key, service_key, year_month, SUM(total_cost), COUNT(DISTINCT account_key), AVG(growth_rate)
+        FROM fact_monthly_service_costs
+        WHERE year_month IN ({months})
+        GROUP BY client_key, service_key, year_month
+    """,
+    'rollup_service_month': """
+        INSERT INTO rollup_service_month (service_key, year_month, total_cost, clients_count)
+        SELECT service_key, year_month, SUM(total_cost), COUNT(DISTINCT client_key)
+        FROM fact_monthly_service_costs
+        WHERE year_month IN ({months})
+        GROUP BY service_key, year_month
+    """,
+}
+
+def get_connection(db_config):
+    """Cria conexão com o banco aws_costs"""
+    return pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+
+def setup_rollup_tables(db_config):
+    """Cria as tabelas do cubo"""
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+    for ddl in ROLLUP_TABLES:
+        cursor.execute(ddl)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def months_between(start_date, end_date):
+    """Períodos YYYY-MM de start_date até end_date (inclusive)"""
+    months = []
+    year_month = start_date.strftime('%Y-%m')
+    while year_month <= end_date.strftime('%Y-%m'):
+        months.append(year_month)
+        year_month = shift_month(year_month, 1)
+    return months
+
+def refresh_rollups(db_config, start_date, end_date):
+    """Recalcula o cubo para os dias de start_date a end_date e seus meses
+
+    Os períodos afetados são apagados e regravados em uma única transação,
+    então as leituras nunca veem um período parcialmente preenchido.
+    """
+    months = months_between(start_date, end_date)
+    month_placeholders = ', '.join(['%s'] * len(months))
+
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+
+    cursor.execute("DELETE FROM rollup_client_day WHERE cost_date BETWEEN %s AND %s", (start_date, end_date))
+    cursor.execute(DAY_ROLLUP, (start_date, end_date))
+
+    for table, rollup_query in MONTH_ROLLUPS.items():
+        cursor.execute(f"DELETE FROM {table} WHERE year_month IN ({month_placeholders})", months)
+        cursor.execute(rollup_query.format(months=month_placeholders), months)
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"✓ Rollups atualizados: {start_date} a {end_date} ({len(months)} meses)")
+
+def get_full_range(db_config):
+    """Primeiro e último dia com dados nas tabelas fato"""
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(cost_date), MAX(cost_date) FROM fact_daily_costs")
+    first_day, last_day = cursor.fetchone()
+    cursor.execute("SELECT MIN(year_month), MAX(year_month) FROM fact_monthly_service_costs")
+    first_month, last_month = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    # Meses já expurgados de daily_costs continuam em fact_monthly_service_costs
+    if first_month:
+        first_month_day = datetime.strptime(first_month, '%Y-%m').date()
+        last_month_day = datetime.strptime(last_month, '%Y-%m').date()
+        first_day = min(first_day or first_month_day, first_month_day)
+        last_day = max(last_day or last_month_day, last_month_day)
+    return first_day, last_day
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Atualiza o cubo de rollups de custos")
+    parser.add_argument('--days', type=int, default=8,
+                        help="Dias recalculados a partir de hoje (a coleta relê os últimos 7)")
+    parser.add_argument('--full', action='store_true', help="Reconstrói o cubo com todo o histórico")
+    args = parser.parse_args()
+
+    db_config = get_database_credentials()
+    setup_rollup_tables(db_config)
+
+    if args.full:
+        start_date, end_date = get_full_range(db_config)
+        if start_date is None:
+            print("⚠️ Nenhum dado para agregar")
+            return
+    else:
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=args.days)
+
+    refresh_rollups(db_config, start_date, end_date)
+    print("✅ Cubo de rollups atualizado!")
+
+if __name__ == "__main__":
+    main()
@@ -34,10 +34,17 @@ if [ ${PIPESTATUS[0]} -eq 0 ]; then
     if [ ${PIPESTATUS[0]} -eq 0 ]; then
         echo "✅ Analytics processado com sucesso"
         
+        # Atualizar rollups da API (a nova versão dos dados invalida o cache)
+        echo "🧊 Atualizando rollups..."
+        python3 $SCRIPT_DIR/rollup_cube.py 2>&1 | tee -a $ANALYTICS_LOG
+        
         # Executar coleta de budgets (mantém compatibilidade)
         echo "💰 Executando coleta de budgets..."
         python3 $SCRIPT_DIR/budget_report_mysql.py 2>&1 | tee -a $COLLECTION_LOG
         
+        # Publicar nova versão dos dados (invalida o cache de respostas da API)
+        python3 $SCRIPT_DIR/data_version.py 2>&1 | tee -a $COLLECTION_LOG
+        
         echo "🎉 Coleta aprimorada concluída!"
         echo "📊 Dados disponíveis para:"
         echo "  - Análise diária de custos por serviço"
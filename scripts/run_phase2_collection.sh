@@ -57,6 +57,26 @@ else
     exit 1
 fi
 
+# 3b. Atualizar cubo de rollups (dias recoletados e seus meses)
+log_message "🧊 Atualizando cubo de rollups..."
+python3 $SCRIPT_DIR/rollup_cube.py 2>&1 | tee -a $MAIN_LOG
+
+if [ ${PIPESTATUS[0]} -eq 0 ]; then
+    log_message "✅ Rollups atualizados"
+else
+    log_message "⚠️ Erro na atualização dos rollups (continuando...)"
+fi
+
+# 3c. Detectar anomalias nos dias novos de custo diário
+log_message "🚨 Detectando anomalias de custo..."
+python3 $SCRIPT_DIR/anomaly_detector.py 2>&1 | tee -a $MAIN_LOG
+
+if [ ${PIPESTATUS[0]} -eq 0 ]; then
+    log_message "✅ Anomalias detectadas"
+else
+    log_message "⚠️ Erro na detecção de anomalias (continuando...)"
+fi
+
 # 4. Gerar previsões
 log_message "🔮 Gerando previsões de custos..."
 python3 $SCRIPT_DIR/cost_forecasting.py 2>&1 | tee -a $MAIN_LOG
@@ -77,7 +97,32 @@ else
     log_message "⚠️ Erro na coleta de budgets (continuando...)"
 fi
 
-# 6. Gerar relatório final
+# 5b. Projetar consumo dos budgets mensais
+log_message "📉 Projetando consumo dos budgets..."
+python3 $SCRIPT_DIR/budget_projection.py 2>&1 | tee -a $MAIN_LOG
+
+if [ ${PIPESTATUS[0]} -eq 0 ]; then
+    log_message "✅ Projeções de budget atualizadas"
+else
+    log_message "⚠️ Erro na projeção de budgets (continuando...)"
+fi
+
+# 6. Exportar warehouse para Parquet (leituras analíticas fora do RDS)
+if [ -n "$EXPORT_ROOT" ]; then
+    log_message "📦 Exportando partições alteradas para $EXPORT_ROOT..."
+    python3 $SCRIPT_DIR/parquet_exporter.py --root "$EXPORT_ROOT" 2>&1 | tee -a $MAIN_LOG
+    
+    if [ ${PIPESTATUS[0]} -eq 0 ]; then
+        log_message "✅ Exportação Parquet concluída"
+    else
+        log_message "⚠️ Erro na exportação Parquet (continuando...)"
+    fi
+fi
+
+# 6b. Publicar nova versão dos dados (invalida o cache de respostas da API)
+python3 $SCRIPT_DIR/data_version.py 2>&1 | tee -a $MAIN_LOG
+
+# 7. Gerar relatório final
 log_message "📋 Gerando relatório final..."
 
 # Conectar no banco e gerar estatísticas
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Snapshot Refresher - Fase 3
+Mantém tabelas de snapshot (último relatório e fechamento de cada mês)
+de cost_reports e budget_alerts para as queries do Metabase
+"""
+
+import argparse
+import pymysql
+from datetime import datetime, timedelta
+
+from analytics_processor import get_database_credentials
+
+COST_REPORT_COLUMNS = [
+    'id', 'cliente', 'account_id', 'mes_anterior', 'atual_mtd', 'projecao',
+    'data_relatorio', 'mes_referencia', 'ano_mes_anterior'
+]
+
+BUDGET_ALERT_COLUMNS = [
+    'id', 'cliente', 'account_id', 'budget_name', 'budget_limit', 'actual_spend',
+    'forecasted_spend', 'percentage_used', 'alert_threshold', 'alert_triggered',
+    'time_period', 'data_coleta'
+]
+
+def column_list(columns, alias=None):
+    """Monta a lista de colunas para INSERT ... SELECT"""
+    return ', '.join(f"{alias}.{c}" if alias else c for c in columns)
+
+def get_connection(db_config):
+    """Cria conexão com o banco aws_costs"""
+    return pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+
+def ensure_index(cursor, table, index_name, columns):
+    """Cria o índice apenas se ainda não existir"""
+    cursor.execute(f"SHOW INDEX FROM {table} WHERE Key_name = %s", (index_name,))
+    if not cursor.fetchall():
+        cursor.execute(f"CREATE INDEX {index_name} ON {table}({columns})")
+
+def setup_snapshot_tables(db_config):
+    """Cria as tabelas de snapshot e os índices usados no refresh"""
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cost_reports_latest (
+            id INT PRIMARY KEY,
+            cliente VARCHAR(100),
+            account_id VARCHAR(20),
+            mes_anterior DECIMAL(10,2),
+            atual_mtd DECIMAL(10,2),
+            projecao DECIMAL(10,2),
+            data_relatorio DATE,
+            mes_referencia VARCHAR(7),
+            ano_mes_anterior VARCHAR(7),
+            INDEX idx_crl_mes_cliente (mes_referencia, cliente, account_id)
+        )""")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cost_reports_month_end (
+            id INT PRIMARY KEY,
+            cliente VARCHAR(100),
+            account_id VARCHAR(20),
+            mes_anterior DECIMAL(10,2),
+            atual_mtd DECIMAL(10,2),
+            projecao DECIMAL(10,2),
+            data_relatorio DATE,
+            mes_referencia VARCHAR(7),
+            ano_mes_anterior VARCHAR(7),
+            INDEX idx_crme_mes_cliente (mes_referencia, cliente, account_id),
+            INDEX idx_crme_cliente (cliente, mes_referencia)
+        )""")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS budget_alerts_latest (
+            id INT PRIMARY KEY,
+            cliente VARCHAR(100),
+            account_id VARCHAR(20),
+            budget_name VARCHAR(200),
+            budget_limit DECIMAL(10,2),
+            actual_spend DECIMAL(10,2),
+            forecasted_spend DECIMAL(10,2),
+            percentage_used DECIMAL(5,2),
+            alert_threshold DECIMAL(5,2),
+            alert_triggered BOOLEAN,
+            time_period VARCHAR(20),
+            data_coleta DATE,
+            INDEX idx_bal_cliente (cliente, account_id),
+            INDEX idx_bal_usage (percentage_used DESC)
+        )""")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS budget_alerts_month_end (
+            id INT PRIMARY KEY,
+            mes_referencia VARCHAR(7) NOT NULL,
+            cliente VARCHAR(100),
+            account_id VARCHAR(20),
+            budget_name VARCHAR(200),
+            budget_limit DECIMAL(10,2),
+            actual_spend DECIMAL(10,2),
+            forecasted_spend DECIMAL(10,2),
+            percentage_used DECIMAL(5,2),
+            alert_threshold DECIMAL(5,2),
+            alert_triggered BOOLEAN,
+            time_period VARCHAR(20),
+            data_coleta DATE,
+            INDEX idx_bame_mes_cliente (mes_referencia, cliente, account_id)
+        )""")
+
+    # Índices para localizar o último snapshot sem varrer o histórico
+    ensure_index(cursor, 'cost_reports', 'idx_mes_data_relatorio', 'mes_referencia, data_relatorio')
+    ensure_index(cursor, 'cost_reports', 'idx_data_relatorio', 'data_relatorio')
+    ensure_index(cursor, 'budget_alerts', 'idx_data_coleta', 'data_coleta')
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def month_bounds(year_month):
+    """Retorna primeiro e último dia de um período YYYY-MM"""
+    first_day = datetime.strptime(f"{year_month}-01", '%Y-%m-%d').date()
+    next_month = (first_day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return first_day, next_month - timedelta(days=1)
+
+def refresh_cost_report_snapshots(db_config, months=None):
+    """Atualiza cost_reports_latest e o fechamento dos meses informados
+
+    months=None atualiza apenas o mês corrente; months='all' reconstrói
+    o fechamento de todo o histórico. Tudo ocorre em uma transação, então
+    os dashboards nunca leem uma tabela parcialmente preenchida.
+    """
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+
+    cursor.execute("DELETE FROM cost_reports_latest")
+    cursor.execute(f"""
+        INSERT INTO cost_reports_latest ({column_list(COST_REPORT_COLUMNS)})
+        SELECT {column_list(COST_REPORT_COLUMNS)}
+        FROM cost_reports
+        WHERE data_relatorio = (SELECT MAX(data_relatorio) FROM cost_reports)
+    """)
+
+    if months == 'all':
+        cursor.execute("DELETE FROM cost_reports_month_end")
+        cursor.execute(f"""
+            INSERT INTO cost_reports_month_end ({column_list(COST_REPORT_COLUMNS)})
+            SELECT {column_list(COST_REPORT_COLUMNS, 'cr')}
+            FROM cost_reports cr
+            JOIN (
+                SELECT mes_referencia, MAX(data_relatorio) as data_relatorio
+                FROM cost_reports
+                GROUP BY mes_referencia
+            ) last_report ON last_report.mes_referencia = cr.mes_referencia
+                AND last_report.data_relatorio = cr.data_relatorio
+        """)
+    else:
+        for mes_referencia in months or [datetime.now().strftime('%Y-%m')]:
+            cursor.execute("DELETE FROM cost_reports_month_end WHERE mes_referencia = %s", (mes_referencia,))
+            cursor.execute(f"""
+                INSERT INTO cost_reports_month_end ({column_list(COST_REPORT_COLUMNS)})
+                SELECT {column_list(COST_REPORT_COLUMNS)}
+                FROM cost_reports
+                WHERE mes_referencia = %s
+                  AND data_relatorio = (
+                    SELECT MAX(data_relatorio)
+                    FROM cost_reports
+                    WHERE mes_referencia = %s
+                  )
+            """, (mes_referencia, mes_referencia))
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print("✓ Snapshots de cost_reports atualizados")
+
+def refresh_budget_snapshots(db_config, months=None):
+    """Atualiza budget_alerts_latest e o fechamento dos meses informados"""
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+
+    cursor.execute("DELETE FROM budget_alerts_latest")
+    cursor.execute(f"""
+        INSERT INTO budget_alerts_latest ({column_list(BUDGET_ALERT_COLUMNS)})
+        SELECT {column_list(BUDGET_ALERT_COLUMNS)}
+        FROM budget_alerts
+        WHERE data_coleta = (SELECT MAX(data_coleta) FROM budget_alerts)
+    """)
+
+    if months == 'all':
+        cursor.execute("DELETE FROM budget_alerts_month_end")
+        cursor.execute(f"""
+            INSERT INTO budget_alerts_month_end (mes_referencia, {column_list(BUDGET_ALERT_COLUMNS)})
+            SELECT last_collection.mes_referencia, {column_list(BUDGET_ALERT_COLUMNS, 'ba')}
+            FROM budget_alerts ba
+            JOIN (
+                SELECT DATE_FORMAT(data_coleta, '%Y-%m') as mes_referencia, MAX(data_coleta) as data_coleta
+                FROM budget_alerts
+                GROUP BY DATE_FORMAT(data_coleta, '%Y-%m')
+            ) last_collection ON last_collection.data_coleta = ba.data_coleta
+        """)
+    else:
+        for mes_referencia in months or [datetime.now().strftime('%Y-%m')]:
+            first_day, last_day = month_bounds(mes_referencia)
+            cursor.execute("DELETE FROM budget_alerts_month_end WHERE mes_referencia = %s", (mes_referencia,))
+            cursor.execute(f"""
+                INSERT INTO budget_alerts_month_end (mes_referencia, {column_list(BUDGET_ALERT_COLUMNS)})
+                SELECT %s, {column_list(BUDGET_ALERT_COLUMNS)}
+                FROM budget_alerts
+                WHERE data_coleta = (
+                    SELECT MAX(data_coleta)
+                    FROM budget_alerts
+                    WHERE data_coleta BETWEEN %s AND %s
+                )
+            """, (mes_referencia, first_day, last_day))
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print("✓ Snapshots de budget_alerts atualizados")
+
+def main():
+    """Reconstrói os snapshots (por padrão apenas o mês corrente)"""
+    parser = argparse.ArgumentParser(description="Atualiza tabelas de snapshot do Metabase")
+    parser.add_argument('--months', nargs='*', help="Períodos YYYY-MM a atualizar")
+    parser.add_argument('--full', action='store_true', help="Reconstrói o fechamento de todo o histórico")
+    args = parser.parse_args()
+
+    months = 'all' if args.full else args.months
+
+    db_config = get_database_credentials()
+    setup_snapshot_tables(db_config)
+    refresh_cost_report_snapshots(db_config, months)
+    refresh_budget_snapshots(db_config, months)
+    print("✅ Snapshots atualizados!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Trend Engine - Fase 3
+Detecção incremental de tendências: estatísticas por série (inclinação,
+coeficiente de variação, sequência de altas/quedas) mantidas em
+trend_series_state e recalculadas só para as séries tocadas pela última
+coleta. Apenas as linhas de fact_cost_trends que mudaram são regravadas
+"""
+
+import argparse
+import calendar
+from datetime import datetime
+
+import numpy as np
+import pymysql
+
+from analytics_processor import get_database_credentials, shift_month
+from dimension_keys import LOOKUP_CHUNK_SIZE
+
+TREND_MONTHS = 6
+SLOPE_THRESHOLD = 5.0
+GROWTH_THRESHOLD = 20.0
+VOLATILE_CV = 0.5
+VOLATILE_MAX_R2 = 0.5
+STREAK_MIN_CHANGE = 0.02
+
+STATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS trend_series_state (
+        client_key SMALLINT UNSIGNED NOT NULL,
+        account_key SMALLINT UNSIGNED NOT NULL,
+        service_key INT NOT NULL,
+        trend_period VARCHAR(20) NOT NULL,
+        months_observed TINYINT UNSIGNED NOT NULL,
+        slope_pct DECIMAL(10,4),
+        coefficient_variation DECIMAL(10,4),
+        streak SMALLINT NOT NULL DEFAULT 0,
+        growth_percentage DECIMAL(8,4),
+        trend_type ENUM('increasing', 'decreasing', 'stable', 'volatile') NOT NULL,
+        alert_level ENUM('low', 'medium', 'high', 'critical') NOT NULL,
+        source_updated_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (client_key, account_key, service_key),
+        INDEX idx_tss_source (source_updated_at)
+    )
+"""
+
+def get_connection(db_config):
+    """Cria conexão com o banco aws_costs"""
+    return pymysql.connect(
+        host=db_config['host'],
+        user=db_config['username'],
+        password=db_config['password'],
+        database='aws_costs',
+        port=db_config['port'],
+        charset='utf8mb4'
+    )
+
+def setup_trend_tables(cursor):
+    """Cria o estado por série e as chaves usadas pelo upsert (uma única vez)"""
+    cursor.execute(STATE_TABLE)
+
+    # created_at é renovado a cada upsert da coleta: identifica as séries tocadas
+    cursor.execute("SHOW INDEX FROM fact_monthly_service_costs WHERE Key_name = 'idx_fmsc_touched'")
+    if not cursor.fetchall():
+        cursor.execute("ALTER TABLE fact_monthly_service_costs ADD INDEX idx_fmsc_touched (created_at)")
+
+    cursor.execute("SHOW INDEX FROM fact_cost_trends WHERE Key_name = 'unique_trend'")
+    if not cursor.fetchall():
+        # A regravação completa podia gravar a mesma série duas vezes no período
+        cursor.execute("""
+            DELETE t FROM fact_cost_trends t
+            JOIN fact_cost_trends d ON d.client_key = t.client_key AND d.account_key = t.account_key
+                AND d.service_key <=> t.service_key AND d.trend_period = t.trend_period AND t.id > d.id
+        """)
+        cursor.execute("""
+            ALTER TABLE fact_cost_trends
+            ADD UNIQUE KEY unique_trend (client_key, account_key, service_key, trend_period)
+        """)
+
+def window_months(trend_period, months=TREND_MONTHS):
+    """Períodos YYYY-MM da janela que termina em trend_period"""
+    return [shift_month(trend_period, offset) for offset in range(1 - months, 1)]
+
+def get_touched_series(cursor, first_month):
+    """Séries com linhas mensais gravadas desde a última execução
+
+    Retorna {chaves: maior created_at}. Sem estado, todas as séries da janela.
+    """
+    cursor.execute("SELECT MAX(source_updated_at) FROM trend_series_state")
+    watermark = cursor.fetchone()[0]
+    # >= relê o último segundo: linhas gravadas nele depois da leitura anterior
+    cursor.execute("""
+        SELECT client_key, account_key, service_key, MAX(created_at)
+        FROM fact_monthly_service_costs
+        WHERE created_at >= COALESCE(%s, '1970-01-02') AND year_month >= %s
+        GROUP BY client_key, account_key, service_key
+    """, (watermark, first_month))
+    return {tuple(row[:3]): row[3] for row in cursor.fetchall()}
+
+def load_windows(cursor, series_keys, months):
+    """Matrizes custos[série, mês] e máscara da janela para as séries pedidas"""
+    row_index = {key: row for row, key in enumerate(series_keys)}
+    month_index = {year_month: column for column, year_month in enumerate(months)}
+    costs = np.zeros((len(series_keys), len(months)))
+    mask = np.zeros((len(series_keys), len(months)), dtype=bool)
+
+    for i in range(0, len(series_keys), LOOKUP_CHUNK_SIZE):
+        chunk = series_keys[i:i + LOOKUP_CHUNK_SIZE]
+        cursor.execute(f"""
+            SELECT client_key, account_key, service_key, year_month, CAST(SUM(total_cost) AS DOUBLE)
+            FROM fact_monthly_service_costs
+            WHERE (client_key, account_key, service_key) IN ({', '.join(['(%s, %s, %s)'] * len(chunk))})
+            AND year_month BETWEEN %s AND %s
+            GROUP BY client_key, account_key, service_key, year_month
+        """, [part for key in chunk for part in key] + [months[0], months[-1]])
+        for client_key, account_key, service_key, year_month, total_cost in cursor.fetchall():
+            row = row_index[(client_key, account_key, service_key)]
+            costs[row, month_index[year_month]] = total_cost
+            mask[row, month_index[year_month]] = True
+    return costs, mask
+
+def month_progress(cursor, trend_period):
+    """Fração do mês do período já coletada (1.0 para meses fechados)"""
+    cursor.execute("SELECT MAX(cost_date) FROM fact_daily_costs")
+    last_day = cursor.fetchone()[0]
+    if last_day is None or last_day.strftime('%Y-%m') != trend_period:
+        return 1.0
+    return last_day.day / calendar.monthrange(last_day.year, last_day.month)[1]
+
+def trend_statistics(costs, mask):
+    """Estatísticas vetorizadas de todas as séries da janela
+
+    Meses sem linha ficam fora dos ajustes. A inclinação é relativa à média
+    (% ao mês), streak conta as variações consecutivas na mesma direção até o
+    último mês (positivo = altas) e growth compara os dois últimos meses.
+    """
+    series, width = costs.shape
+    n = mask.sum(axis=1)
+    safe_n = np.maximum(n, 1)
+    x = np.broadcast_to(np.arange(width, dtype=float), costs.shape)
+
+    mean = np.where(mask, costs, 0).sum(axis=1) / safe_n
+    x_mean = np.where(mask, x, 0).sum(axis=1) / safe_n
+    dx = np.where(mask, x - x_mean[:, np.newaxis], 0)
+    dy = np.where(mask, costs - mean[:, np.newaxis], 0)
+    sxx = (dx ** 2).sum(axis=1)
+    syy = (dy ** 2).sum(axis=1)
+    sxy = (dx * dy).sum(axis=1)
+    slope = np.divide(sxy, sxx, out=np.zeros(series), where=sxx > 0)
+    r2 = np.divide(sxy ** 2, sxx * syy, out=np.ones(series), where=(sxx > 0) & (syy > 0))
+
+    slope_pct = np.divide(slope * 100, mean, out=np.zeros(series), where=mean > 0)
+    cv = np.divide(np.sqrt(syy / safe_n), mean, out=np.zeros(series), where=mean > 0)
+
+    # Variações entre meses consecutivos observados (colunas já alinhadas à esquerda)
+    order = np.argsort(~mask, axis=1, kind='stable')
+    packed = np.take_along_axis(costs, order, axis=1)
+    rows = np.arange(series)
+    last = packed[rows, np.maximum(n - 1, 0)]
+    previous = packed[rows, np.maximum(n - 2, 0)]
+    growth = np.where((n >= 2) & (previous > 0),
+                      np.divide((last - previous) * 100, previous, out=np.zeros(series), where=previous > 0), 0)
+
+    changes = np.diff(packed, axis=1) / np.maximum(packed[:, :-1], 1e-9)
+    direction = np.where(changes > STREAK_MIN_CHANGE, 1, np.where(changes < -STREAK_MIN_CHANGE, -1, 0))
+    valid = np.arange(width - 1)[np.newaxis, :] < (n - 1)[:, np.newaxis]
+    direction = np.where(valid, direction, 0)
+    last_direction = direction[rows, np.maximum(n - 2, 0)] * (n >= 2)
+    streak = np.zeros(series, dtype=int)
+    running = np.ones(series, dtype=bool)
+    for back in range(width - 1):
+        column = n - 2 - back
+        same = running & (column >= 0) & (last_direction != 0)
+        same &= direction[rows, np.maximum(column, 0)] == last_direction
+        streak += same
+        running = same
+    streak *= last_direction
+
+    return {
+        'n': n,
+        'slope_pct': slope_pct,
+        'r2': r2,
+        'cv': cv,
+        'growth': np.clip(growth, -9999.9999, 9999.9999),
+        'streak': streak,
+    }
+
+def classify_trends(stats):
+    """Tipo de tendência e nível de alerta de cada série
+
+    volatile: CV alto sem reta que explique a variação; increasing/decreasing:
+    variação do mês acima de GROWTH_THRESHOLD ou inclinação acima de
+    SLOPE_THRESHOLD com ao menos 2 meses seguidos na mesma direção.
+    """
+    growth, slope_pct, streak = stats['growth'], stats['slope_pct'], stats['streak']
+    volatile = (stats['n'] >= 3) & (stats['cv'] >= VOLATILE_CV) & (stats['r2'] < VOLATILE_MAX_R2)
+    increasing = (growth > GROWTH_THRESHOLD) | ((slope_pct >= SLOPE_THRESHOLD) & (streak >= 2))
+    decreasing = (growth < -GROWTH_THRESHOLD) | ((slope_pct <= -SLOPE_THRESHOLD) & (streak <= -2))
+
+    trend_type = np.select([volatile, increasing, decreasing], ['volatile', 'increasing', 'decreasing'], 'stable')
+    alert_level = np.select(
+        [(trend_type == 'increasing') & (growth > 100),
+         (trend_type == 'increasing') & (growth > 50),
+         ((trend_type == 'increasing') & (growth > GROWTH_THRESHOLD)) | ((trend_type == 'volatile') & (stats['cv'] >= 1))],
+        ['critical', 'high', 'medium'], 'low'
+    )
+    return trend_type, alert_level
+
+def describe_trend(service_name, trend_type, growth, slope_pct, cv, streak):
+    """Descrição da tendência para alertas e chatbot"""
+    if trend_type == 'volatile':
+        return f"Serviço {service_name} tem custo volátil (variação de {cv * 100:.0f}% sobre a média)"
+    if trend_type == 'stable':
+        return f"Serviço {service_name} tem custo estável ({growth:+.2f}% no mês)"
+    direction = 'crescimento' if trend_type == 'increasing' else 'queda'
+    return (f"Serviço {service_name} teve {direction} de {abs(growth):.2f}% no mês "
+            f"({slope_pct:+.1f}% ao mês, sequência de {abs(streak)} meses)")
+
+def get_service_names(cursor, service_keys):
+    """Nomes dos serviços pelas chaves, em lotes"""
+    service_keys = list(service_keys)
+    names = {}
+    for i in range(0, len(service_keys), LOOKUP_CHUNK_SIZE):
+        chunk = service_keys[i:i + LOOKUP_CHUNK_SIZE]
+        cursor.execute(f"SELECT id, service_name FROM aws_services WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                       chunk)
+        names.update(cursor.fetchall())
+    return names
+
+def get_stored_states(cursor, series_keys):
+    """(período, tipo, alerta, crescimento) gravados para as séries pedidas"""
+    stored = {}
+    for i in range(0, len(series_keys), LOOKUP_CHUNK_SIZE):
+        chunk = series_keys[i:i + LOOKUP_CHUNK_SIZE]
+        cursor.execute(f"""
+            SELECT client_key, account_key, service_key, trend_period, trend_type, alert_level, growth_percentage
+            FROM trend_series_state
+            WHERE (client_key, account_key, service_key) IN ({', '.join(['(%s, %s, %s)'] * len(chunk))})
+        """, [part for key in chunk for part in key])
+        for row in cursor.fetchall():
+            stored[tuple(row[:3])] = (row[3], row[4], row[5], round(float(row[6] or 0), 2))
+    return stored
+
+def update_trends(db_config, trend_period=None):
+    """Atualiza estado e tendências das séries tocadas desde a última execução"""
+    trend_period = trend_period or datetime.now().strftime('%Y-%m')
+    months = window_months(trend_period)
+
+    conn = get_connection(db_config)
+    cursor = conn.cursor()
+    setup_trend_tables(cursor)
+
+    touched = get_touched_series(cursor, months[0])
+    if not touched:
+        print("✓ Tendências: nenhuma série tocada desde a última execução")
+        cursor.close()
+        conn.close()
+        return 0
+
+    series_keys = list(touched)
+    costs, mask = load_windows(cursor, series_keys, months)
+    # Mês em andamento entra pelo ritmo atual (projeção para o mês inteiro)
+    costs[:, -1] /= month_progress(cursor, trend_period)
+
+    # Séries tocadas só em meses fora da janela não têm estado a atualizar
+    active = mask[:, -1]
+    series_keys = [key for key, is_active in zip(series_keys, active) if is_active]
+    costs, mask = costs[active], mask[active]
+
+    stats = trend_statistics(costs, mask)
+    trend_types, alert_levels = classify_trends(stats)
+
+    stored = get_stored_states(cursor, series_keys)
+    changed = [
+        row for row, key in enumerate(series_keys)
+        if stored.get(key) != (trend_period, trend_types[row], alert_levels[row], round(float(stats['growth'][row]), 2))
+    ]
+
+    if changed:
+        names = get_service_names(cursor, {series_keys[row][2] for row in changed})
+        cursor.executemany("""
+            INSERT INTO fact_cost_trends
+            (client_key, account_key, service_key, trend_type, trend_period, growth_percentage,
+             confidence_score, alert_level, description)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                trend_type = VALUES(trend_type),
+                growth_percentage = VALUES(growth_percentage),
+                confidence_score = VALUES(confidence_score),
+                alert_level = VALUES(alert_level),
+                description = VALUES(description),
+                created_at = CURRENT_TIMESTAMP
+        """, [
+            (*series_keys[row], str(trend_types[row]), trend_period, float(stats['growth'][row]),
+             float(np.clip(stats['r2'][row], 0, 1) * 100), str(alert_levels[row]),
+             describe_trend(names.get(series_keys[row][2], series_keys[row][2]), trend_types[row],
+                            stats['growth'][row], stats['slope_pct'][row], stats['cv'][row], stats['streak'][row]))
+            for row in changed
+        ])
+
+    cursor.executemany("""
+        INSERT INTO trend_series_state
+        (client_key, account_key, service_key, trend_period, months_observed, slope_pct,
+         coefficient_variation, streak, growth_percentage, trend_type, alert_level, source_updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            trend_period = VALUES(trend_period),
+            months_observed = VALUES(months_observed),
+            slope_pct = VALUES(slope_pct),
+            coefficient_variation = VALUES(coefficient_variation),
+            streak = VALUES(streak),
+            growth_percentage = VALUES(growth_percentage),
+            trend_type = VALUES(trend_type),
+            alert_level = VALUES(alert_level),
+            source_updated_at = VALUES(source_updated_at)
+    """, [
+        (*key, trend_period, int(stats['n'][row]), float(np.clip(stats['slope_pct'][row], -99999, 99999)),
+         float(min(stats['cv'][row], 99999)), int(stats['streak'][row]), float(stats['growth'][row]),
+         str(trend_types[row]), str(alert_levels[row]), touched[key])
+        for row, key in enumerate(series_keys)
+    ])
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    counts = {trend_type: int((trend_types == trend_type).sum())
+              for trend_type in ('increasing', 'decreasing', 'stable', 'volatile')}
+    print(f"✓ Tendências {trend_period}: {len(touched)} séries tocadas, {len(changed)} linhas regravadas "
+          f"({', '.join(f'{count} {name}' for name, count in counts.items())})")
+    return len(changed)
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Detecção incremental de tendências de custo")
+    parser.add_argument('--month', help="Período das tendências (YYYY-MM); padrão: mês atual")
+    args = parser.parse_args()
+
+    print("📈 Atualizando tendências de custo...")
+    db_config = get_database_credentials()
+    update_trends(db_config, args.month)
+    print("✅ Tendências atualizadas!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+-- Dimension Keys Migration - Fase 3
+-- Dimensões com chaves inteiras e tabelas fato; as tabelas antigas viram
+-- *_legacy e views com o nome antigo mantêm os consumidores funcionando.
+-- Equivale a dimension_keys.setup_dimension_tables (executado pelo coletor).
+
+-- Dimensões
+CREATE TABLE IF NOT EXISTS dim_client (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    cliente VARCHAR(100) NOT NULL,
+    UNIQUE KEY unique_cliente (cliente)
+);
+
+CREATE TABLE IF NOT EXISTS dim_account (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    account_id VARCHAR(20) NOT NULL,
+    UNIQUE KEY unique_account (account_id)
+);
+
+CREATE TABLE IF NOT EXISTS dim_region (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    region VARCHAR(50) NOT NULL,
+    UNIQUE KEY unique_region (region)
+);
+
+CREATE TABLE IF NOT EXISTS dim_usage (
+    id INT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    usage_type VARCHAR(200) NOT NULL DEFAULT '',
+    operation VARCHAR(200) NOT NULL DEFAULT '',
+    UNIQUE KEY unique_usage (usage_type, operation)
+);
+
+-- aws_services passa a ser a dimensão de serviço (chave pelo nome do Cost Explorer)
+ALTER TABLE aws_services
+MODIFY service_code VARCHAR(50) NULL,
+ADD UNIQUE KEY unique_service_name (service_name);
+
+-- Tabelas fato
+CREATE TABLE IF NOT EXISTS fact_daily_costs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    client_key SMALLINT UNSIGNED NOT NULL,
+    account_key SMALLINT UNSIGNED NOT NULL,
+    service_key INT NOT NULL,
+    region_key SMALLINT UNSIGNED NOT NULL,
+    usage_key INT UNSIGNED NOT NULL,
+    cost_date DATE NOT NULL,
+    amount DECIMAL(12,4) NOT NULL,
+    currency CHAR(3) DEFAULT 'USD',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_fdc_main (client_key, account_key, cost_date),
+    INDEX idx_fdc_service (service_key, cost_date),
+    INDEX idx_fdc_date (cost_date),
+    INDEX idx_fdc_touched (created_at),
+    UNIQUE KEY unique_daily_cost (client_key, account_key, service_key, region_key, cost_date, usage_key)
+);
+
+CREATE TABLE IF NOT EXISTS fact_monthly_service_costs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    client_key SMALLINT UNSIGNED NOT NULL,
+    account_key SMALLINT UNSIGNED NOT NULL,
+    service_key INT NOT NULL,
+    region_key SMALLINT UNSIGNED NOT NULL,
+    year_month VARCHAR(7) NOT NULL,
+    total_cost DECIMAL(12,4) NOT NULL,
+    avg_daily_cost DECIMAL(12,4),
+    max_daily_cost DECIMAL(12,4),
+    min_daily_cost DECIMAL(12,4),
+    days_with_usage INT DEFAULT 0,
+    growth_rate DECIMAL(8,4),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_fmsc_main (client_key, account_key, year_month),
+    INDEX idx_fmsc_service (service_key, year_month),
+    INDEX idx_fmsc_month (year_month),
+    INDEX idx_fmsc_growth (growth_rate DESC),
+    INDEX idx_fmsc_touched (created_at),
+    UNIQUE KEY unique_monthly_service (client_key, account_key, service_key, region_key, year_month)
+);
+
+CREATE TABLE IF NOT EXISTS fact_cost_forecasts (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    client_key SMALLINT UNSIGNED NOT NULL,
+    account_key SMALLINT UNSIGNED NOT NULL,
+    service_key INT,
+    forecast_period VARCHAR(20) NOT NULL,
+    forecast_type ENUM('monthly', 'quarterly', 'annual') NOT NULL,
+    predicted_cost DECIMAL(12,4) NOT NULL,
+    confidence_interval_lower DECIMAL(12,4),
+    confidence_interval_upper DECIMAL(12,4),
+    prediction_accuracy DECIMAL(5,2),
+    trend_direction ENUM('increasing', 'decreasing', 'stable') NOT NULL,
+    seasonal_factor DECIMAL(8,4),
+    growth_rate DECIMAL(8,4),
+    model_used VARCHAR(50) DEFAULT 'linear_regression',
+    input_fingerprint CHAR(32),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_fcf_main (client_key, account_key, forecast_period),
+    INDEX idx_fcf_service (service_key, forecast_period),
+    INDEX idx_fcf_period (forecast_period),
+    INDEX idx_fcf_client_period (client_key, forecast_period, predicted_cost DESC),
+    INDEX idx_fcf_touched (created_at),
+    UNIQUE KEY unique_forecast (client_key, account_key, service_key, forecast_period, forecast_type)
+);
+
+CREATE TABLE IF NOT EXISTS fact_cost_trends (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    client_key SMALLINT UNSIGNED NOT NULL,
+    account_key SMALLINT UNSIGNED NOT NULL,
+    service_key INT,
+    trend_type ENUM('increasing', 'decreasing', 'stable', 'volatile') NOT NULL,
+    trend_period VARCHAR(20) NOT NULL,
+    growth_percentage DECIMAL(8,4),
+    confidence_score DECIMAL(5,2),
+    alert_level ENUM('low', 'medium', 'high', 'critical') DEFAULT 'low',
+    description TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_fct_main (client_key, account_key, trend_type),
+    INDEX idx_fct_period (trend_period),
+    INDEX idx_fct_alert (alert_level, created_at),
+    UNIQUE KEY unique_trend (client_key, account_key, service_key, trend_period)
+);
+
+-- daily_costs
+INSERT IGNORE INTO dim_client (cliente) SELECT DISTINCT cliente FROM daily_costs;
+INSERT IGNORE INTO dim_account (account_id) SELECT DISTINCT account_id FROM daily_costs;
+INSERT IGNORE INTO aws_services (service_name) SELECT DISTINCT service_name FROM daily_costs;
+INSERT IGNORE INTO dim_region (region) SELECT DISTINCT COALESCE(region, 'global') FROM daily_costs;
+INSERT IGNORE INTO dim_usage (usage_type, operation) SELECT DISTINCT COALESCE(usage_type, ''), COALESCE(operation, '') FROM daily_costs;
+INSERT INTO fact_daily_costs
+(id, client_key, account_key, service_key, region_key, usage_key, cost_date, amount, currency, created_at)
+SELECT l.id, c.id, a.id, s.id, r.id, u.id, l.cost_date, l.amount, l.currency, l.created_at
+FROM daily_costs l
+JOIN dim_client c ON c.cliente = l.cliente
+JOIN dim_account a ON a.account_id = l.account_id
+JOIN aws_services s ON s.service_name = l.service_name
+JOIN dim_region r ON r.region = COALESCE(l.region, 'global')
+JOIN dim_usage u ON u.usage_type = COALESCE(l.usage_type, '') AND u.operation = COALESCE(l.operation, '')
+ORDER BY l.id
+ON DUPLICATE KEY UPDATE amount = VALUES(amount), created_at = VALUES(created_at);
+RENAME TABLE daily_costs TO daily_costs_legacy;
+CREATE VIEW daily_costs AS
+SELECT f.id, c.cliente, a.account_id, s.service_name, r.region, f.cost_date, f.amount,
+       f.currency, NULLIF(u.usage_type, '') as usage_type, NULLIF(u.operation, '') as operation,
+       f.created_at
+FROM fact_daily_costs f
+JOIN dim_client c ON c.id = f.client_key
+JOIN dim_account a ON a.id = f.account_key
+JOIN aws_services s ON s.id = f.service_key
+JOIN dim_region r ON r.id = f.region_key
+JOIN dim_usage u ON u.id = f.usage_key;
+
+-- monthly_service_costs
+INSERT IGNORE INTO dim_client (cliente) SELECT DISTINCT cliente FROM monthly_service_costs;
+INSERT IGNORE INTO dim_account (account_id) SELECT DISTINCT account_id FROM monthly_service_costs;
+INSERT IGNORE INTO aws_services (service_name) SELECT DISTINCT service_name FROM monthly_service_costs;
+INSERT IGNORE INTO dim_region (region) SELECT DISTINCT COALESCE(region, 'global') FROM monthly_service_costs;
+INSERT INTO fact_monthly_service_costs
+(id, client_key, account_key, service_key, region_key, year_month, total_cost, avg_daily_cost,
+ max_daily_cost, min_daily_cost, days_with_usage, growth_rate, created_at)
+SELECT l.id, c.id, a.id, s.id, r.id, l.year_month, l.total_cost, l.avg_daily_cost,
+       l.max_daily_cost, l.min_daily_cost, l.days_with_usage, l.growth_rate, l.created_at
+FROM monthly_service_costs l
+JOIN dim_client c ON c.cliente = l.cliente
+JOIN dim_account a ON a.account_id = l.account_id
+JOIN aws_services s ON s.service_name = l.service_name
+JOIN dim_region r ON r.region = COALESCE(l.region, 'global')
+ON DUPLICATE KEY UPDATE total_cost = VALUES(total_cost), growth_rate = VALUES(growth_rate);
+RENAME TABLE monthly_service_costs TO monthly_service_costs_legacy;
+CREATE VIEW monthly_service_costs AS
+SELECT f.id, c.cliente, a.account_id, s.service_name, r.region, f.year_month, f.total_cost,
+       f.avg_daily_cost, f.max_daily_cost, f.min_daily_cost, f.days_with_usage, f.growth_rate,
+       f.created_at
+FROM fact_monthly_service_costs f
+JOIN dim_client c ON c.id = f.client_key
+JOIN dim_account a ON a.id = f.account_key
+JOIN aws_services s ON s.id = f.service_key
+JOIN dim_region r ON r.id = f.region_key;
+
+-- cost_forecasts
+INSERT IGNORE INTO dim_client (cliente) SELECT DISTINCT cliente FROM cost_forecasts;
+INSERT IGNORE INTO dim_account (account_id) SELECT DISTINCT account_id FROM cost_forecasts;
+INSERT IGNORE INTO aws_services (service_name) SELECT DISTINCT service_name FROM cost_forecasts WHERE service_name IS NOT NULL;
+INSERT INTO fact_cost_forecasts
+(id, client_key, account_key, service_key, forecast_period, forecast_type, predicted_cost,
+ confidence_interval_lower, confidence_interval_upper, prediction_accuracy, trend_direction,
+ seasonal_factor, growth_rate, model_used, created_at)
+SELECT l.id, c.id, a.id, s.id, l.forecast_period, l.forecast_type, l.predicted_cost,
+       l.confidence_interval_lower, l.confidence_interval_upper, l.prediction_accuracy, l.trend_direction,
+       l.seasonal_factor, l.growth_rate, l.model_used, l.created_at
+FROM cost_forecasts l
+JOIN dim_client c ON c.cliente = l.cliente
+JOIN dim_account a ON a.account_id = l.account_id
+LEFT JOIN aws_services s ON s.service_name = l.service_name
+ON DUPLICATE KEY UPDATE predicted_cost = VALUES(predicted_cost);
+RENAME TABLE cost_forecasts TO cost_forecasts_legacy;
+CREATE VIEW cost_forecasts AS
+SELECT f.id, c.cliente, a.account_id, s.service_name, f.forecast_period, f.forecast_type,
+       f.predicted_cost, f.confidence_interval_lower, f.confidence_interval_upper,
+       f.prediction_accuracy, f.trend_direction, f.seasonal_factor, f.growth_rate,
+       f.model_used, f.created_at
+FROM fact_cost_forecasts f
+JOIN dim_client c ON c.id = f.client_key
+JOIN dim_account a ON a.id = f.account_key
+LEFT JOIN aws_services s ON s.id = f.service_key;
+
+-- cost_trends
+INSERT IGNORE INTO dim_client (cliente) SELECT DISTINCT cliente FROM cost_trends;
+INSERT IGNORE INTO dim_account (account_id) SELECT DISTINCT account_id FROM cost_trends;
+INSERT IGNORE INTO aws_services (service_name) SELECT DISTINCT service_name FROM cost_trends WHERE service_name IS NOT NULL;
+INSERT INTO fact_cost_trends
+(id, client_key, account_key, service_key, trend_type, trend_period, growth_percentage,
+ confidence_score, alert_level, description, created_at)
+SELECT l.id, c.id, a.id, s.id, l.trend_type, l.trend_period, l.growth_percentage,
+       l.confidence_score, l.alert_level, l.description, l.created_at
+FROM cost_trends l
+JOIN dim_client c ON c.cliente = l.cliente
+JOIN dim_account a ON a.account_id = l.account_id
+LEFT JOIN aws_services s ON s.service_name = l.service_name
+ON DUPLICATE KEY UPDATE description = VALUES(description);
+RENAME TABLE cost_trends TO cost_trends_legacy;
+CREATE VIEW cost_trends AS
+SELECT f.id, c.cliente, a.account_id, s.service_name, f.trend_type, f.trend_period,
+       f.growth_percentage, f.confidence_score, f.alert_level, f.description, f.created_at
+FROM fact_cost_trends f
+JOIN dim_client c ON c.id = f.client_key
+JOIN dim_account a ON a.id = f.account_key
+LEFT JOIN aws_services s ON s.id = f.service_key;
+
+-- Previsão incremental: instalações com fact_cost_forecasts criada antes de input_fingerprint
+-- ALTER TABLE fact_cost_forecasts
+-- ADD COLUMN input_fingerprint CHAR(32) AFTER model_used,
+-- ADD INDEX idx_fcf_period (forecast_period);
+
+-- Previsões sem serviço (service_name NULL): instalações com service_key NOT NULL
+-- ALTER TABLE fact_cost_forecasts MODIFY service_key INT NULL;
+
+-- Previsões reconciliadas por conta (cost_forecasts_reconciled vem de phase3_schema.sql)
+CREATE OR REPLACE VIEW v_cost_forecast_reconciled_summary AS
+SELECT 
+    c.cliente,
+    a.account_id,
+    r.forecast_period,
+    r.reconciled_forecast as total_predicted_cost,
+    r.base_forecast as account_model_forecast,
+    r.method
+FROM cost_forecasts_reconciled r
+JOIN dim_client c ON c.id = r.client_key
+JOIN dim_account a ON a.id = r.account_key
+WHERE r.level = 'account';
@@ -1,4 +1,11 @@
 -- Queries para Metabase - MySQL
+--
+-- As queries leem as tabelas de snapshot mantidas por scripts/snapshot_refresher.py,
+-- atualizadas ao final de cada execução de cost_report_mysql.py e budget_report_mysql.py:
+--   cost_reports_latest      -> linhas do relatório mais recente
+--   cost_reports_month_end   -> último relatório de cada mes_referencia
+--   budget_alerts_latest     -> linhas da coleta de budgets mais recente
+--   budget_alerts_month_end  -> última coleta de budgets de cada mês
 
 -- 1. Dados mais recentes por mês
 SELECT 
@@ -9,12 +16,7 @@ SELECT
     projecao,
     mes_referencia,
     data_relatorio
-FROM cost_reports 
-WHERE data_relatorio = (
-    SELECT MAX(data_relatorio) 
-    FROM cost_reports cr2 
-    WHERE cr2.mes_referencia = cost_reports.mes_referencia
-)
+FROM cost_reports_month_end 
 ORDER BY cliente, account_id;
 
 -- 2. Evolução mensal por cliente
@@ -24,12 +26,7 @@ SELECT
     SUM(mes_anterior) as total_mes_anterior,
     SUM(atual_mtd) as total_atual_mtd,
     SUM(projecao) as total_projecao
-FROM cost_reports 
-WHERE data_relatorio = (
-    SELECT MAX(data_relatorio) 
-    FROM cost_reports cr2 
-    WHERE cr2.mes_referencia = cost_reports.mes_referencia
-)
+FROM cost_reports_month_end 
 GROUP BY cliente, mes_referencia
 ORDER BY cliente, mes_referencia;
 
@@ -39,13 +36,8 @@ SELECT
     SUM(projecao) as total_projetado,
     COUNT(DISTINCT cliente) as total_clientes,
     COUNT(*) as total_contas
-FROM cost_reports 
+FROM cost_reports_month_end 
 WHERE mes_referencia >= DATE_FORMAT(DATE_SUB(CURDATE(), INTERVAL 6 MONTH), '%Y-%m')
-  AND data_relatorio = (
-    SELECT MAX(data_relatorio) 
-    FROM cost_reports cr2 
-    WHERE cr2.mes_referencia = cost_reports.mes_referencia
-  )
 GROUP BY mes_referencia
 ORDER BY mes_referencia;
 
@@ -54,13 +46,8 @@ SELECT
     cliente,
     SUM(projecao) as total_projetado,
     COUNT(*) as num_contas
-FROM cost_reports 
+FROM cost_reports_latest 
 WHERE mes_referencia = DATE_FORMAT(CURDATE(), '%Y-%m')
-  AND data_relatorio = (
-    SELECT MAX(data_relatorio) 
-    FROM cost_reports 
-    WHERE mes_referencia = DATE_FORMAT(CURDATE(), '%Y-%m')
-  )
 GROUP BY cliente
 ORDER BY total_projetado DESC
 LIMIT 10;
@@ -90,13 +77,8 @@ SELECT
     SUM(atual_mtd) as total_atual_mtd,
     SUM(projecao) as total_projecao,
     ROUND(((SUM(projecao) - SUM(mes_anterior)) / SUM(mes_anterior) * 100), 2) as variacao_percentual
-FROM cost_reports 
-WHERE mes_referencia = DATE_FORMAT(CURDATE(), '%Y-%m')
-  AND data_relatorio = (
-    SELECT MAX(data_relatorio) 
-    FROM cost_reports 
-    WHERE mes_referencia = DATE_FORMAT(CURDATE(), '%Y-%m')
-  );
+FROM cost_reports_latest 
+WHERE mes_referencia = DATE_FORMAT(CURDATE(), '%Y-%m');
 
 -- 7. Contas com maior variação (crescimento)
 SELECT 
@@ -106,13 +88,8 @@ SELECT
     projecao,
     (projecao - mes_anterior) as diferenca,
     ROUND(((projecao - mes_anterior) / mes_anterior * 100), 2) as percentual_variacao
-FROM cost_reports 
+FROM cost_reports_latest 
 WHERE mes_referencia = DATE_FORMAT(CURDATE(), '%Y-%m')
-  AND data_relatorio = (
-    SELECT MAX(data_relatorio) 
-    FROM cost_reports 
-    WHERE mes_referencia = DATE_FORMAT(CURDATE(), '%Y-%m')
-  )
   AND mes_anterior > 0
 ORDER BY percentual_variacao DESC
 LIMIT 10;
@@ -121,19 +98,14 @@ LIMIT 10;
 SELECT 
     mes_referencia,
     SUM(projecao) as total_mes
-FROM cost_reports 
+FROM cost_reports_month_end 
 WHERE mes_referencia >= DATE_FORMAT(DATE_SUB(CURDATE(), INTERVAL 12 MONTH), '%Y-%m')
-  AND data_relatorio = (
-    SELECT MAX(data_relatorio) 
-    FROM cost_reports cr2 
-    WHERE cr2.mes_referencia = cost_reports.mes_referencia
-  )
 GROUP BY mes_referencia
 ORDER BY mes_referencia;
 
 -- QUERIES DE BUDGET PARA METABASE
 
--- 9. Resumo de budgets por cliente
+-- 9. Resumo de budgets por cliente (última coleta)
 SELECT 
     cliente,
     COUNT(*) as total_budgets,
@@ -142,12 +114,11 @@ SELECT
     SUM(forecasted_spend) as total_forecasted,
     AVG(percentage_used) as avg_percentage,
     SUM(CASE WHEN alert_triggered = 1 THEN 1 ELSE 0 END) as alerts_triggered
-FROM budget_alerts 
-WHERE data_coleta = CURDATE()
+FROM budget_alerts_latest 
 GROUP BY cliente
 ORDER BY total_limit DESC;
 
--- 10. Budgets com alertas disparados
+-- 10. Budgets com alertas disparados (última coleta)
 SELECT 
     cliente,
     account_id,
@@ -156,11 +127,11 @@ SELECT
     actual_spend,
     percentage_used,
     alert_threshold
-FROM budget_alerts 
-WHERE alert_triggered = 1 AND data_coleta = CURDATE()
+FROM budget_alerts_latest 
+WHERE alert_triggered = 1
 ORDER BY percentage_used DESC;
 
--- 11. Top budgets por utilização
+-- 11. Top budgets por utilização (última coleta)
 SELECT 
     cliente,
     account_id,
@@ -169,8 +140,7 @@ SELECT
     actual_spend,
     forecasted_spend,
     percentage_used
-FROM budget_alerts 
-WHERE data_coleta = CURDATE()
+FROM budget_alerts_latest 
 ORDER BY percentage_used DESC
 LIMIT 20;
 
@@ -183,9 +153,69 @@ SELECT
     b.forecasted_spend,
     c.projecao as cost_projection,
     (c.projecao - b.budget_limit) as budget_variance
-FROM budget_alerts b
-LEFT JOIN cost_reports c ON b.cliente = c.cliente AND b.account_id = c.account_id
-WHERE b.data_coleta = CURDATE() 
-  AND c.mes_referencia = DATE_FORMAT(CURDATE(), '%Y-%m')
-  AND c.data_relatorio = (SELECT MAX(data_relatorio) FROM cost_reports WHERE mes_referencia = DATE_FORMAT(CURDATE(), '%Y-%m'))
+FROM budget_alerts_latest b
+LEFT JOIN cost_reports_latest c ON b.cliente = c.cliente AND b.account_id = c.account_id
+WHERE c.mes_referencia = DATE_FORMAT(CURDATE(), '%Y-%m')
 ORDER BY budget_variance DESC;
+
+-- 13. Fechamento de budgets por mês
+SELECT 
+    mes_referencia,
+    cliente,
+    SUM(budget_limit) as total_limit,
+    SUM(actual_spend) as total_actual,
+    SUM(CASE WHEN alert_triggered = 1 THEN 1 ELSE 0 END) as alerts_triggered
+FROM budget_alerts_month_end 
+GROUP BY mes_referencia, cliente
+ORDER BY mes_referencia, cliente;
+
+-- ===================================
+-- QUERIES DE CUSTO DETALHADO (ROLLUPS)
+-- ===================================
+-- Tabelas rollup_* mantidas por scripts/rollup_cube.py após cada coleta
+
+-- 14. Custo diário por cliente (últimos 30 dias)
+SELECT 
+    c.cliente,
+    r.cost_date,
+    r.total_cost,
+    r.services_count
+FROM rollup_client_day r
+JOIN dim_client c ON c.id = r.client_key
+WHERE r.cost_date >= CURDATE() - INTERVAL 30 DAY
+ORDER BY r.cost_date, c.cliente;
+
+-- 15. Custo mensal por cliente (últimos 12 meses)
+SELECT 
+    c.cliente,
+    r.year_month,
+    r.total_cost,
+    r.services_count,
+    r.accounts_count
+FROM rollup_client_month r
+JOIN dim_client c ON c.id = r.client_key
+WHERE r.year_month >= DATE_FORMAT(CURDATE() - INTERVAL 12 MONTH, '%Y-%m')
+ORDER BY r.year_month, c.cliente;
+
+-- 16. Top serviços por cliente no mês atual
+SELECT 
+    c.cliente,
+    s.service_name,
+    r.total_cost,
+    r.avg_growth_rate
+FROM rollup_client_service_month r
+JOIN dim_client c ON c.id = r.client_key
+JOIN aws_services s ON s.id = r.service_key
+WHERE r.year_month = DATE_FORMAT(CURDATE(), '%Y-%m')
+ORDER BY c.cliente, r.total_cost DESC;
+
+-- 17. Custo por serviço (todos os clientes, últimos 12 meses)
+SELECT 
+    s.service_name,
+    r.year_month,
+    r.total_cost,
+    r.clients_count
+FROM rollup_service_month r
+JOIN aws_services s ON s.id = r.service_key
+WHERE r.year_month >= DATE_FORMAT(CURDATE() - INTERVAL 12 MONTH, '%Y-%m')
+ORDER BY r.year_month, r.total_cost DESC;
@@ -0,0 +1,268 @@
+-- Phase 3 Schema Extensions
+-- Processamento incremental e otimizações de performance
+
+-- Estado do cálculo de growth rate (assinatura de cada mês já processado)
+CREATE TABLE IF NOT EXISTS growth_rate_state (
+    year_month VARCHAR(7) PRIMARY KEY,
+    row_count INT NOT NULL,
+    checksum BIGINT UNSIGNED NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Chave única para o upsert em lote das métricas (generate_cost_metrics)
+-- (o analytics_processor cria a chave quando falta; migração única):
+-- ALTER TABLE cost_metrics ADD UNIQUE KEY unique_metric (cliente, account_id, metric_type, metric_period);
+
+-- Snapshots para o Metabase (mantidos por scripts/snapshot_refresher.py)
+CREATE TABLE IF NOT EXISTS cost_reports_latest (
+    id INT PRIMARY KEY,
+    cliente VARCHAR(100),
+    account_id VARCHAR(20),
+    mes_anterior DECIMAL(10,2),
+    atual_mtd DECIMAL(10,2),
+    projecao DECIMAL(10,2),
+    data_relatorio DATE,
+    mes_referencia VARCHAR(7),
+    ano_mes_anterior VARCHAR(7),
+    INDEX idx_crl_mes_cliente (mes_referencia, cliente, account_id)
+);
+
+CREATE TABLE IF NOT EXISTS cost_reports_month_end (
+    id INT PRIMARY KEY,
+    cliente VARCHAR(100),
+    account_id VARCHAR(20),
+    mes_anterior DECIMAL(10,2),
+    atual_mtd DECIMAL(10,2),
+    projecao DECIMAL(10,2),
+    data_relatorio DATE,
+    mes_referencia VARCHAR(7),
+    ano_mes_anterior VARCHAR(7),
+    INDEX idx_crme_mes_cliente (mes_referencia, cliente, account_id),
+    INDEX idx_crme_cliente (cliente, mes_referencia)
+);
+
+CREATE TABLE IF NOT EXISTS budget_alerts_latest (
+    id INT PRIMARY KEY,
+    cliente VARCHAR(100),
+    account_id VARCHAR(20),
+    budget_name VARCHAR(200),
+    budget_limit DECIMAL(10,2),
+    actual_spend DECIMAL(10,2),
+    forecasted_spend DECIMAL(10,2),
+    percentage_used DECIMAL(5,2),
+    alert_threshold DECIMAL(5,2),
+    alert_triggered BOOLEAN,
+    time_period VARCHAR(20),
+    data_coleta DATE,
+    INDEX idx_bal_cliente (cliente, account_id),
+    INDEX idx_bal_usage (percentage_used DESC)
+);
+
+CREATE TABLE IF NOT EXISTS budget_alerts_month_end (
+    id INT PRIMARY KEY,
+    mes_referencia VARCHAR(7) NOT NULL,
+    cliente VARCHAR(100),
+    account_id VARCHAR(20),
+    budget_name VARCHAR(200),
+    budget_limit DECIMAL(10,2),
+    actual_spend DECIMAL(10,2),
+    forecasted_spend DECIMAL(10,2),
+    percentage_used DECIMAL(5,2),
+    alert_threshold DECIMAL(5,2),
+    alert_triggered BOOLEAN,
+    time_period VARCHAR(20),
+    data_coleta DATE,
+    INDEX idx_bame_mes_cliente (mes_referencia, cliente, account_id)
+);
+
+-- Índices das consultas de snapshot (o snapshot_refresher cria os que faltam;
+-- migração única):
+-- CREATE INDEX idx_mes_data_relatorio ON cost_reports(mes_referencia, data_relatorio);
+-- CREATE INDEX idx_data_relatorio ON cost_reports(data_relatorio);
+-- CREATE INDEX idx_data_coleta ON budget_alerts(data_coleta);
+
+-- Retenção de daily_costs (mantida por scripts/daily_costs_retention.py)
+CREATE TABLE IF NOT EXISTS daily_costs_archive_log (
+    year_month VARCHAR(7) PRIMARY KEY,
+    archive_root VARCHAR(500) NOT NULL,
+    rows_archived INT NOT NULL,
+    max_id BIGINT NOT NULL,
+    status ENUM('archived', 'purged') NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    purged_at TIMESTAMP NULL
+);
+
+-- Cubo de rollups (mantido por scripts/rollup_cube.py, lido por api/rollup_router.py)
+CREATE TABLE IF NOT EXISTS rollup_client_day (
+    client_key SMALLINT UNSIGNED NOT NULL,
+    cost_date DATE NOT NULL,
+    total_cost DECIMAL(14,4) NOT NULL,
+    services_count INT NOT NULL,
+    PRIMARY KEY (client_key, cost_date),
+    INDEX idx_rcd_date (cost_date)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_client_month (
+    client_key SMALLINT UNSIGNED NOT NULL,
+    year_month VARCHAR(7) NOT NULL,
+    total_cost DECIMAL(14,4) NOT NULL,
+    services_count INT NOT NULL,
+    accounts_count INT NOT NULL,
+    PRIMARY KEY (client_key, year_month),
+    INDEX idx_rcm_month (year_month)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_client_service_month (
+    client_key SMALLINT UNSIGNED NOT NULL,
+    service_key INT NOT NULL,
+    year_month VARCHAR(7) NOT NULL,
+    total_cost DECIMAL(14,4) NOT NULL,
+    accounts_count INT NOT NULL,
+    avg_growth_rate DECIMAL(8,4),
+    PRIMARY KEY (client_key, year_month, service_key),
+    INDEX idx_rcsm_month (year_month)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_service_month (
+    service_key INT NOT NULL,
+    year_month VARCHAR(7) NOT NULL,
+    total_cost DECIMAL(14,4) NOT NULL,
+    clients_count INT NOT NULL,
+    PRIMARY KEY (year_month, service_key)
+);
+
+-- Seleção de modelo de previsão por série (mantida por scripts/forecast_backtest.py)
+CREATE TABLE IF NOT EXISTS forecast_model_selection (
+    client_key SMALLINT UNSIGNED NOT NULL,
+    account_key SMALLINT UNSIGNED NOT NULL,
+    service_key INT NOT NULL,
+    selected_model VARCHAR(50) NOT NULL,
+    wape DECIMAL(10,4),
+    mape DECIMAL(10,4),
+    n_points INT NOT NULL,
+    history_total DECIMAL(14,4) NOT NULL,
+    evaluated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (client_key, account_key, service_key)
+);
+
+-- Previsões reconciliadas serviço → conta → cliente (mantidas por scripts/forecast_reconciliation.py)
+CREATE TABLE IF NOT EXISTS cost_forecasts_reconciled (
+    level ENUM('client', 'account', 'service') NOT NULL,
+    client_key SMALLINT UNSIGNED NOT NULL,
+    account_key SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+    service_key INT NOT NULL DEFAULT 0,
+    forecast_period VARCHAR(20) NOT NULL,
+    base_forecast DECIMAL(14,4),
+    reconciled_forecast DECIMAL(14,4) NOT NULL,
+    method VARCHAR(20) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (forecast_period, level, client_key, account_key, service_key),
+    INDEX idx_cfr_client (client_key, forecast_period)
+);
+
+-- Marca d'água do detector de anomalias (mantida por scripts/anomaly_detector.py)
+CREATE TABLE IF NOT EXISTS anomaly_detector_state (
+    detector VARCHAR(50) PRIMARY KEY,
+    last_scored_date DATE NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Reexecuções do detector atualizam o achado em vez de duplicar
+-- (o detector remove duplicatas antigas antes de criar a chave):
+-- ALTER TABLE cost_anomalies ADD UNIQUE KEY unique_anomaly (account_id, anomaly_id);
+
+-- Estado por série do engine incremental de tendências (mantido por scripts/trend_engine.py)
+CREATE TABLE IF NOT EXISTS trend_series_state (
+    client_key SMALLINT UNSIGNED NOT NULL,
+    account_key SMALLINT UNSIGNED NOT NULL,
+    service_key INT NOT NULL,
+    trend_period VARCHAR(20) NOT NULL,
+    months_observed TINYINT UNSIGNED NOT NULL,
+    slope_pct DECIMAL(10,4),
+    coefficient_variation DECIMAL(10,4),
+    streak SMALLINT NOT NULL DEFAULT 0,
+    growth_percentage DECIMAL(8,4),
+    trend_type ENUM('increasing', 'decreasing', 'stable', 'volatile') NOT NULL,
+    alert_level ENUM('low', 'medium', 'high', 'critical') NOT NULL,
+    source_updated_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (client_key, account_key, service_key),
+    INDEX idx_tss_source (source_updated_at)
+);
+
+-- Bancos criados antes do engine incremental (o script aplica quando faltam):
+-- ALTER TABLE fact_monthly_service_costs ADD INDEX idx_fmsc_touched (created_at);
+-- ALTER TABLE fact_cost_trends ADD UNIQUE KEY unique_trend (client_key, account_key, service_key, trend_period);
+
+-- Exportação Parquet incremental: meses alterados pelo created_at
+-- (parquet_exporter.py aplica quando faltam)
+-- ALTER TABLE fact_daily_costs ADD INDEX idx_fdc_touched (created_at);
+-- ALTER TABLE fact_cost_forecasts ADD INDEX idx_fcf_touched (created_at);
+-- ALTER TABLE budget_alerts ADD INDEX idx_ba_touched (created_at);
+
+-- Limites de budget por conta (sincronizados por budget_report_mysql.py;
+-- thresholds é editável e preservado na sincronização)
+CREATE TABLE IF NOT EXISTS budget_thresholds (
+    account_id VARCHAR(20) NOT NULL,
+    budget_name VARCHAR(200) NOT NULL,
+    cliente VARCHAR(100) NOT NULL,
+    budget_limit DECIMAL(10,2) NOT NULL,
+    time_period VARCHAR(20) NOT NULL,
+    thresholds VARCHAR(100) NOT NULL DEFAULT '50,80,100',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, budget_name)
+);
+
+-- Cruzamentos de limite emitidos na ingestão (um por budget, mês e limite)
+CREATE TABLE IF NOT EXISTS budget_threshold_events (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    cliente VARCHAR(100) NOT NULL,
+    account_id VARCHAR(20) NOT NULL,
+    budget_name VARCHAR(200) NOT NULL,
+    budget_period VARCHAR(7) NOT NULL,
+    threshold DECIMAL(5,2) NOT NULL,
+    budget_limit DECIMAL(10,2) NOT NULL,
+    mtd_spend DECIMAL(12,4) NOT NULL,
+    percentage_used DECIMAL(8,2) NOT NULL,
+    crossed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY unique_crossing (account_id, budget_name, budget_period, threshold),
+    INDEX idx_bte_cliente (cliente, crossed_at)
+);
+
+-- Projeção de consumo dos budgets mensais (mantida por scripts/budget_projection.py)
+CREATE TABLE IF NOT EXISTS budget_projections (
+    account_id VARCHAR(20) NOT NULL,
+    budget_name VARCHAR(200) NOT NULL,
+    budget_period VARCHAR(7) NOT NULL,
+    cliente VARCHAR(100) NOT NULL,
+    as_of_date DATE NOT NULL,
+    budget_limit DECIMAL(10,2) NOT NULL,
+    mtd_spend DECIMAL(12,4) NOT NULL,
+    burn_rate DECIMAL(12,4) NOT NULL,
+    projected_spend DECIMAL(12,4) NOT NULL,
+    projected_lower DECIMAL(12,4) NOT NULL,
+    projected_upper DECIMAL(12,4) NOT NULL,
+    projected_percentage DECIMAL(8,2) NOT NULL,
+    exhaustion_date DATE NULL,
+    earliest_exhaustion_date DATE NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, budget_name, budget_period),
+    INDEX idx_bp_cliente (cliente, budget_period),
+    INDEX idx_bp_exhaustion (budget_period, exhaustion_date)
+);
+
+-- Versão dos dados publicada ao final do pipeline (scripts/data_version.py);
+-- chave do cache de respostas da API
+CREATE TABLE IF NOT EXISTS pipeline_data_version (
+    id TINYINT UNSIGNED PRIMARY KEY,
+    version BIGINT UNSIGNED NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Configurações da API medidas por benchmark (api/summary_benchmark.py grava
+-- summary_query_mode, usado com SUMMARY_QUERY_MODE=auto)
+CREATE TABLE IF NOT EXISTS api_query_settings (
+    setting_name VARCHAR(64) PRIMARY KEY,
+    setting_value VARCHAR(255) NOT NULL,
+    details TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);